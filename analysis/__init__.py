@@ -0,0 +1,4 @@
+from .analysis import set_boundaries, summarize, report
+from .longrecord import set_long_boundaries
+from .parallel import set_parallel_boundaries
+from .pipeline import Pipeline, PipelineResult
@@ -0,0 +1,80 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import statistics
+
+import dsp
+from dsp.singlelead import heart_rate
+from ecg import BeatTable, Lead
+from instrument import stage
+
+
+def set_boundaries(ecg):
+    """
+    Determines the QRS, T-wave, and P-wave boundaries and P-terminal force of an ECG.
+    :param ecg: ECG object containing the samples, boundaries and measurements are set on it
+    """
+
+    frequency = ecg.get_frequency()
+
+    # Filtered and derived leads are cached on the ECG, so each lead is only processed once
+    with stage("filter"):
+        derivatives = ecg.get_derivatives()
+        squared = ecg.get_squared_derivatives()
+    qrs = dsp.determine_qrs(ecg.get_all_leads(), frequency, derivatives=derivatives, squared=squared)
+
+    # Waves and measurements are added to a table of the beats of each QRS complex
+    beats = BeatTable.from_boundaries(qrs)
+    with stage("t_wave"):
+        dsp.determine_t_waves(ecg.get_all_leads(), frequency, beats)
+    with stage("p_wave"):
+        dsp.p_wave_boundaries(beats, None, ecg.get_lead(Lead.V1), frequency, derived=ecg.get_derivative(Lead.V1))
+    with stage("ptf"):
+        dsp.pterm_measurements(ecg.get_filtered_lead(Lead.V1), frequency, beats)
+    ecg.set_beats(beats)
+
+
+def summarize(ecg):
+    """
+    Summarizes the boundaries and measurements of an analyzed ECG.
+    :param ecg: ECG object that has had its boundaries set
+    :return: Dictionary of frequency, heart rate (in beats per minute), beat count, P-terminal force of each P-wave,
+    and the median P-terminal force (in μV*mS)
+    """
+
+    frequency = ecg.get_frequency()
+    qrs = ecg.get_qrs_complexes()
+    p_terminal_force = [float(pterm) for pterm in ecg.get_p_terminal_force()]
+
+    rate = None
+    if len(qrs) > 1:
+        rate = 60 * frequency / heart_rate([boundary[0] for boundary in qrs])
+
+    median = None
+    if p_terminal_force:
+        median = statistics.median(p_terminal_force)
+
+    return {
+        "frequency": frequency,
+        "heart_rate": rate,
+        "beats": len(qrs),
+        "p_terminal_force": p_terminal_force,
+        "median_p_terminal_force": median,
+    }
+
+
+def report(ecg):
+    """
+    Reports the boundaries and measurements of an analyzed ECG as JSON serializable values.
+    :param ecg: ECG object that has had its boundaries set
+    :return: Dictionary of the summary and the QRS, T-wave, and P-wave boundaries
+    """
+
+    result = summarize(ecg)
+    result["qrs_complexes"] = [[int(index) for index in boundary] for boundary in ecg.get_qrs_complexes()]
+    result["t_waves"] = [[int(index) for index in boundary] for boundary in ecg.get_t_waves()]
+    result["p_waves"] = [[int(index) for index in boundary] for boundary in ecg.get_p_waves()]
+
+    return result
@@ -0,0 +1,163 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import numpy
+
+from ecg import NO_INDEX, P_WAVE
+from .analysis import set_boundaries
+
+
+# Default memory ceiling (in bytes) for the samples of a window and the arrays processed from them
+MEMORY_LIMIT = 512 * 2**20
+
+# Peak bytes used per sample of each lead while a window is analyzed, the window copy, cached filtered, derived and
+# squared samples, and the temporaries of filtering and averaging
+BYTES_PER_SAMPLE = 64
+
+# Seconds of samples before and after each window core, long enough for the 5 beats used to get the heart rate
+WINDOW_MARGIN = 8
+
+
+def set_long_boundaries(ecg, memory_limit=MEMORY_LIMIT, margin=WINDOW_MARGIN):
+    """
+    Determines the QRS, T-wave, and P-wave boundaries and P-terminal force of a long ECG, such as a Holter recording.
+    The ECG is analyzed in overlapping windows, so memory used for analysis is bounded by the window size rather than
+    the length of the recording. Each window is a core with margins on either side, and seams between cores are placed
+    between beats. A beat is kept from the window whose core holds its QRS onset, along with the T-wave following and
+    the P-wave preceding its QRS complex, so beats at a seam are neither duplicated nor missed.
+    :param ecg: ECG object containing the samples, boundaries and measurements are set on it
+    :param memory_limit: Maximum bytes used to analyze a window, which sets the window size
+    :param margin: Seconds of samples analyzed before and after each window core for context
+    """
+
+    frequency = ecg.get_frequency()
+    num_samples = ecg.get_num_samples()
+    margin = int(margin * frequency)
+
+    # Largest window that fits the memory limit, the core must at least span a margin
+    window_size = memory_limit // (BYTES_PER_SAMPLE * max(len(ecg), 1))
+    core_size = window_size - 2 * margin
+    if core_size < margin:
+        raise ValueError('memory limit of {} bytes is too small for {} leads, at least {} bytes are needed'.format(
+            memory_limit, len(ecg), 3 * margin * BYTES_PER_SAMPLE * len(ecg)))
+
+    results = ([], [], [], [])
+    core_start = 0
+    while core_start < num_samples:
+        # Analyze the core and its margins, the last window runs to the end of the recording
+        start = max(core_start - margin, 0)
+        stop = min(core_start + core_size + margin, num_samples)
+        qrs, t_waves, p_waves = analyze_window(ecg, start, stop)
+
+        # Place the seam between the last beat of the core and the first beat after it
+        core_end = num_samples
+        if stop < num_samples:
+            core_end = get_seam(qrs, core_start, core_start + core_size)
+
+        # Keep beats with a QRS onset in the core
+        owned = [core_start <= boundary[0] < core_end for boundary in qrs]
+        keep_beats(results, owned, qrs, t_waves, p_waves)
+
+        core_start = core_end
+
+    set_results(ecg, results)
+
+
+def analyze_window(ecg, start, stop):
+    """
+    Determines the boundaries and measurements of a window of an ECG, grouping the waves by QRS complex.
+    :param ecg: ECG object containing the samples
+    :param start: Index of the first sample of the window
+    :param stop: Index after the last sample of the window
+    :return: Tuple of the list of QRS boundaries, the list of T-waves as tuples of the index of the preceding QRS
+    complex and boundaries, and the list of P-waves as tuples of the index of the following QRS complex, boundaries,
+    and a tuple of P-terminal force, depth, duration, and index of max depth, all indices are from the start of the
+    recording
+    """
+
+    window = ecg.get_window(start, stop)
+    set_boundaries(window)
+    qrs = [shift(boundary, start) for boundary in window.get_qrs_complexes()]
+    onsets = numpy.array([boundary[0] for boundary in qrs], dtype=int)
+
+    # T-waves follow a QRS complex
+    t_waves = []
+    for t_wave in window.get_t_waves():
+        t_wave = shift(t_wave, start)
+        i = int(numpy.searchsorted(onsets, t_wave[0], side='right')) - 1
+        if i >= 0:
+            t_waves.append((i, t_wave))
+
+    # P-waves precede a QRS complex
+    p_waves = []
+    beats = window.get_beats()
+    measured = beats[beats.has(P_WAVE)]
+    deepest = numpy.where(measured["p_deepest"] != NO_INDEX, measured["p_deepest"] + start, NO_INDEX)
+    measurements = zip(measured["ptf"].tolist(), measured["p_depth"].tolist(), measured["p_duration"].tolist(),
+                       deepest.tolist())
+    for p_wave, measurement in zip(window.get_p_waves(), measurements):
+        p_wave = shift(p_wave, start)
+        i = int(numpy.searchsorted(onsets, p_wave[-1], side='left'))
+        if i < len(onsets):
+            p_waves.append((i, p_wave, measurement))
+
+    return qrs, t_waves, p_waves
+
+
+def keep_beats(results, owned, qrs, t_waves, p_waves):
+    """
+    Appends the kept QRS complexes of a window, and the T-waves and P-waves grouped with them, to the results.
+    :param results: Tuple of the lists of QRS complexes, T-waves, P-waves, and P-wave measurements of the recording
+    :param owned: List of whether each QRS complex of the window is kept
+    :param qrs: List of QRS boundaries of the window, as returned by analyze_window
+    :param t_waves: List of T-waves of the window, as returned by analyze_window
+    :param p_waves: List of P-waves of the window, as returned by analyze_window
+    """
+
+    qrs_complexes, t_wave_list, p_wave_list, measurements = results
+    qrs_complexes += [boundary for boundary, keep in zip(qrs, owned) if keep]
+    t_wave_list += [t_wave for i, t_wave in t_waves if owned[i]]
+    for i, p_wave, measurement in p_waves:
+        if owned[i]:
+            p_wave_list.append(p_wave)
+            measurements.append(measurement)
+
+
+def set_results(ecg, results):
+    """ Sets the stitched boundaries and measurements on the ECG """
+
+    qrs_complexes, t_waves, p_waves, measurements = results
+    ecg.set_qrs_complexes(qrs_complexes)
+    ecg.set_t_waves(t_waves)
+    ecg.set_p_waves(p_waves)
+    ecg.set_p_terminal_force([measurement[0] for measurement in measurements])
+
+    # Depth, duration, and index of max depth are only held by the table of the beats
+    if measurements:
+        ecg.get_beats().set_p_terminal_force(*zip(*measurements))
+
+
+def get_seam(qrs, core_start, core_end):
+    """
+    Places the end of a window core between beats, midway from the end of the last QRS complex before the nominal end
+    of the core to the onset of the first QRS complex after it.
+    :param qrs: List of tuples containing start and end index for QRS complexes
+    :param core_start: Index of the start of the core
+    :param core_end: Index of the nominal end of the core
+    :return: Index of the end of the core
+    """
+
+    before = [boundary for boundary in qrs if core_start <= boundary[0] < core_end]
+    after = [boundary for boundary in qrs if boundary[0] >= core_end]
+    if not before or not after:
+        return core_end
+
+    return (before[-1][-1] + after[0][0]) // 2
+
+
+def shift(boundary, offset):
+    """ Shifts the indices of a boundary from a window to the recording """
+
+    return tuple(int(index) + offset for index in boundary)
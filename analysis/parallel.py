@@ -0,0 +1,154 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from dsp.singlelead import QRS_REFRACTORY_PERIOD
+from ecg import ECG
+from .longrecord import WINDOW_MARGIN, analyze_window, keep_beats, set_results
+
+
+# Seconds of samples in the core of each segment
+SEGMENT_LENGTH = 300
+
+# ECG attached to the shared lead matrix in each worker process
+_shared_ecg = None
+_shared_memory = None
+
+
+def set_parallel_boundaries(ecg, workers=None, segment_length=SEGMENT_LENGTH, margin=WINDOW_MARGIN):
+    """
+    Determines the QRS, T-wave, and P-wave boundaries and P-terminal force of a long ECG using multiple processes.
+    The ECG is split into segments of a fixed length, each analyzed with margins on either side in a process pool that
+    reads the lead matrix from shared memory. Beats are merged in segment order, so results do not depend on the
+    number of workers.
+    :param ecg: ECG object containing the samples, boundaries and measurements are set on it
+    :param workers: Number of worker processes, default/None is the number of CPUs, 1 analyzes in this process
+    :param segment_length: Seconds of samples in the core of each segment
+    :param margin: Seconds of samples analyzed before and after each segment core for context
+    """
+
+    frequency = ecg.get_frequency()
+    num_samples = ecg.get_num_samples()
+    core_size = int(segment_length * frequency)
+    margin = int(margin * frequency)
+
+    # Fixed grid of segment cores, each with its window of margins
+    segments = []
+    for core_start in range(0, num_samples, core_size):
+        core_end = min(core_start + core_size, num_samples)
+        segments.append((core_start, core_end, max(core_start - margin, 0), min(core_end + margin, num_samples)))
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(segments) == 1:
+        windows = [analyze_window(ecg, start, stop) for _, _, start, stop in segments]
+    else:
+        windows = analyze_shared(ecg, segments, workers)
+
+    # Each segment keeps beats with an onset in its core, or near enough to a seam to be missed by the other side
+    tolerance = int(QRS_REFRACTORY_PERIOD * frequency)
+    owned = []
+    for (core_start, core_end, _, _), (qrs, _, _) in zip(segments, windows):
+        owned.append([core_start - tolerance <= boundary[0] < core_end + tolerance for boundary in qrs])
+
+    # A beat found by the segments on both sides of a seam is only kept from one of them
+    for s in range(1, len(segments)):
+        drop_duplicates(windows[s - 1][0], owned[s - 1], windows[s][0], owned[s], segments[s][0], tolerance)
+
+    # Merge beats in segment order
+    results = ([], [], [], [])
+    for keep, (qrs, t_waves, p_waves) in zip(owned, windows):
+        keep_beats(results, keep, qrs, t_waves, p_waves)
+
+    set_results(ecg, results)
+
+
+def drop_duplicates(previous_qrs, previous_owned, qrs, owned, seam, tolerance):
+    """
+    Drops the beats found by the segments on both sides of a seam from one side.
+    Each kept QRS complex is matched to the kept QRS complex of the other side with the nearest onset within the
+    tolerance, and a matched beat is kept from the segment whose core holds its onset, or the earlier segment if
+    neither does.
+    :param previous_qrs: List of QRS boundaries of the segment before the seam
+    :param previous_owned: List of whether each QRS complex of the segment before the seam is kept, updated in place
+    :param qrs: List of QRS boundaries of the segment after the seam
+    :param owned: List of whether each QRS complex of the segment after the seam is kept, updated in place
+    :param seam: Index of the start of the core of the segment after the seam
+    :param tolerance: Samples between onsets of the same beat
+    """
+
+    rows = [i for i, keep in enumerate(previous_owned) if keep]
+    onsets = numpy.array([previous_qrs[i][0] for i in rows], dtype=int)
+    matched = numpy.zeros(len(rows), dtype=bool)
+
+    for i, boundary in enumerate(qrs):
+        if not owned[i]:
+            continue
+
+        # Nearest unmatched onset of the previous segment on either side of this onset
+        j = int(numpy.searchsorted(onsets, boundary[0]))
+        nearest = [k for k in (j - 1, j) if 0 <= k < len(rows) and not matched[k]
+                   and abs(onsets[k] - boundary[0]) <= tolerance]
+        if not nearest:
+            continue
+        k = min(nearest, key=lambda k: abs(onsets[k] - boundary[0]))
+        matched[k] = True
+
+        if onsets[k] >= seam and boundary[0] >= seam:
+            previous_owned[rows[k]] = False
+        else:
+            owned[i] = False
+
+
+def analyze_shared(ecg, segments, workers):
+    """
+    Analyzes segments in a process pool, placing the lead matrix in shared memory rather than sending it to workers.
+    The matrix is shared as stored, so scaled integer samples are not converted to mV.
+    :param ecg: ECG object containing the samples
+    :param segments: List of tuples of the core start, core end, window start, and window stop of each segment
+    :param workers: Number of worker processes
+    :return: List of the results of analyze_window for each segment
+    """
+
+    from multiprocessing import shared_memory
+
+    samples, scale = ecg.get_raw_matrix()
+    shared = shared_memory.SharedMemory(create=True, size=max(samples.nbytes, 1))
+    try:
+        matrix = numpy.ndarray(samples.shape, dtype=samples.dtype, buffer=shared.buf)
+        matrix[:] = samples
+        del matrix
+
+        args = (shared.name, samples.shape, samples.dtype.str, scale, ecg.get_frequency(), ecg.get_available_leads())
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=args) as executor:
+            starts = [start for _, _, start, _ in segments]
+            stops = [stop for _, _, _, stop in segments]
+            return list(executor.map(analyze_attached, starts, stops))
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def attach(name, shape, dtype, scale, frequency, leads):
+    """ Worker initializer, attaches an ECG to the lead matrix in shared memory """
+
+    from multiprocessing import shared_memory
+
+    global _shared_ecg, _shared_memory
+
+    # Kept open for the life of the worker, the parent process unlinks it once the pool is done
+    _shared_memory = shared_memory.SharedMemory(name=name)
+
+    _shared_ecg = ECG(frequency)
+    _shared_ecg.set_lead_matrix(leads, numpy.ndarray(shape, dtype=dtype, buffer=_shared_memory.buf), scale=scale)
+
+
+def analyze_attached(start, stop):
+    """ Analyzes a window of the ECG attached in the worker """
+
+    return analyze_window(_shared_ecg, start, stop)
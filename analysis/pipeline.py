@@ -0,0 +1,241 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import statistics
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy
+
+import dsp
+from dsp.dsp import bandpass_filter, derivative_filter, moving_average, squaring
+from dsp.singlelead import QRS_WIDTH_MAX, heart_rate
+from ecg import BeatTable, Lead
+from instrument import stage
+
+
+# Stages of the analysis in order, each requiring the stages listed for it
+STAGES = ("qrs", "t_wave", "p_wave", "ptf")
+STAGE_REQUIREMENTS = {
+    "qrs": (),
+    "t_wave": ("qrs",),
+    "p_wave": ("qrs",),
+    "ptf": ("qrs", "p_wave"),
+}
+
+# Buffers are grown to this multiple of the requested size, so slightly longer records do not grow them again
+BUFFER_GROWTH = 1.25
+
+
+@dataclass
+class PipelineResult:
+    """ Boundaries and measurements of an ECG analyzed by a Pipeline """
+
+    frequency: float
+    beats: BeatTable
+    heart_rate: Optional[float]
+    median_p_terminal_force: Optional[float]
+
+    def get_p_terminal_force(self):
+        return [float(pterm) for pterm in self.beats.get_p_terminal_force()]
+
+
+class BufferPool:
+    """
+    Named arrays reused across records, each grown when a larger array than it holds is requested.
+    An array returned by get is only valid until the same name is requested again.
+    """
+
+    __slots__ = ("_buffers",)
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape):
+        """
+        Gets a buffer of float samples.
+        :param name: Name of the buffer
+        :param shape: Shape of the array
+        :return: Uninitialized contiguous array of the shape, a view of the named buffer
+        """
+
+        size = int(numpy.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = numpy.empty(int(size * BUFFER_GROWTH))
+            self._buffers[name] = buffer
+
+        return buffer[:size].reshape(shape)
+
+    def get_size(self):
+        """
+        Gets the memory held by the pool.
+        :return: Total bytes of all buffers
+        """
+
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def clear(self):
+        self._buffers.clear()
+
+
+class Pipeline:
+    """
+    Analysis configured once and applied to many ECGs.
+    Derived samples are computed into buffers owned by the pipeline rather than cached on each ECG, so after the
+    first few records no large arrays are allocated other than by the band-pass filter. A pipeline is not thread-safe,
+    each process or thread should keep its own.
+    """
+
+    def __init__(self, frequency=None, leads=None, stages=STAGES, lead_of_interest=Lead.V1, qrs_consensus=None,
+                 t_wave_consensus=None):
+        """
+        :param frequency: Sampling frequency the ECGs must have, default/None is any frequency
+        :param leads: Iterable of Lead enums used for the consensus of leads, default/None is all available leads
+        :param stages: Iterable of the names of the stages to run, of STAGES, default is all stages
+        :param lead_of_interest: Lead enum the P-waves are found and measured in, need not be one of the consensus leads,
+        default is V1
+        :param qrs_consensus: Percent of leads for a QRS consensus, default/None is QRS_CONSENSUS_THRESHOLD
+        :param t_wave_consensus: Percent of leads for a T-wave consensus, default/None is T_WAVE_CONSENSUS_THRESHOLD
+        """
+
+        # Validate stages
+        stages = tuple(stages)
+        for name in stages:
+            if name not in STAGE_REQUIREMENTS:
+                raise ValueError('unknown stage: {}'.format(name))
+            missing = [required for required in STAGE_REQUIREMENTS[name] if required not in stages]
+            if missing:
+                raise ValueError('stage {} requires {}'.format(name, ", ".join(missing)))
+
+        # Validate leads
+        if leads is not None:
+            leads = list(leads)
+            if not all(isinstance(lead, Lead) for lead in leads):
+                raise TypeError('leads must be instances of Lead')
+        if not isinstance(lead_of_interest, Lead):
+            raise TypeError('lead_of_interest must be an instance of Lead')
+
+        self._frequency = frequency
+        self._leads = leads
+        self._stages = tuple(name for name in STAGES if name in stages)
+        self._lead_of_interest = lead_of_interest
+        self._qrs_consensus = qrs_consensus
+        self._t_wave_consensus = t_wave_consensus
+        self._pool = BufferPool()
+
+    def get_stages(self):
+        return self._stages
+
+    def get_pool(self):
+        return self._pool
+
+    def __call__(self, ecg):
+        """
+        Determines the boundaries and measurements of an ECG, setting them on it.
+        :param ecg: ECG object containing the samples
+        :return: PipelineResult object
+        """
+
+        result = self.run(ecg)
+        ecg.set_beats(result.beats)
+
+        return result
+
+    def run(self, ecg):
+        """
+        Determines the boundaries and measurements of an ECG without setting them on it.
+        :param ecg: ECG object containing the samples
+        :return: PipelineResult object, sharing no arrays with the pool
+        """
+
+        frequency = ecg.get_frequency()
+        if self._frequency is not None and frequency != self._frequency:
+            raise ValueError('ECG sampled at {} Hz, pipeline configured for {} Hz'.format(frequency, self._frequency))
+
+        samples, row = self._select_leads(ecg)
+        shape = samples.shape
+        pool = self._pool
+
+        # Filtered leads are allocated by the filter itself, everything derived from them is computed into the pool
+        with stage("filter"):
+            filtered = bandpass_filter(samples, frequency)
+            derivatives = derivative_filter(filtered, out=pool.get("derivatives", shape))
+            width = int(frequency * QRS_WIDTH_MAX)
+            squared = squaring(derivatives, out=pool.get("squared", shape))
+            averaged = moving_average(squared, width, out=pool.get("averaged", shape),
+                                      work=pool.get("padded", shape[:-1] + (shape[-1] + width,)))
+
+            # The lead of interest is filtered on its own when it is not one of the consensus leads
+            if row is not None:
+                interest, interest_filtered, interest_derived = samples[row], filtered[row], derivatives[row]
+            elif "p_wave" in self._stages:
+                interest = ecg.get_lead(self._lead_of_interest)
+                interest_filtered = bandpass_filter(interest, frequency)
+                interest_derived = derivative_filter(interest_filtered, out=pool.get("interest", interest.shape))
+
+        qrs = []
+        if "qrs" in self._stages:
+            qrs = dsp.determine_qrs(samples, frequency, derivatives=derivatives, squared=squared, averaged=averaged,
+                                    threshold=self._qrs_consensus)
+
+        beats = BeatTable.from_boundaries(qrs)
+        if "t_wave" in self._stages:
+            with stage("t_wave"):
+                raw_derivatives = derivative_filter(samples, out=pool.get("raw_derivatives", shape))
+                dsp.determine_t_waves(samples, frequency, beats, derivatives=raw_derivatives,
+                                      threshold=self._t_wave_consensus)
+        if "p_wave" in self._stages:
+            with stage("p_wave"):
+                dsp.p_wave_boundaries(beats, None, interest, frequency, derived=interest_derived)
+        if "ptf" in self._stages:
+            with stage("ptf"):
+                dsp.pterm_measurements(interest_filtered, frequency, beats)
+
+        return get_result(frequency, beats)
+
+    def _select_leads(self, ecg):
+        """
+        Gets the samples of the configured leads, gathered into the pool when only some leads of the ECG are used.
+        :param ecg: ECG object containing the samples
+        :return: Tuple of the 2-D array of samples and the row of the lead of interest, or None if it is not one of the
+        consensus leads
+        """
+
+        available = ecg.get_available_leads()
+        leads = available if self._leads is None else self._leads
+        required = leads + [self._lead_of_interest] if "p_wave" in self._stages else leads
+        for lead in required:
+            if lead not in available:
+                raise KeyError('lead not available: {}'.format(lead))
+
+        matrix = ecg.get_lead_matrix()
+        if leads == available:
+            samples = matrix
+        else:
+            rows = [available.index(lead) for lead in leads]
+            samples = numpy.take(matrix, rows, axis=0, out=self._pool.get("samples", (len(rows), matrix.shape[1])))
+
+        row = leads.index(self._lead_of_interest) if self._lead_of_interest in leads else None
+
+        return samples, row
+
+
+def get_result(frequency, beats):
+    """
+    Summarizes the beats of an ECG.
+    :param frequency: Sampling frequency
+    :param beats: BeatTable object
+    :return: PipelineResult object
+    """
+
+    rate = None
+    if len(beats) > 1:
+        rate = 60 * frequency / heart_rate(beats["qrs_on"].tolist())
+
+    p_terminal_force = [float(pterm) for pterm in beats.get_p_terminal_force()]
+    median = statistics.median(p_terminal_force) if p_terminal_force else None
+
+    return PipelineResult(frequency, beats, rate, median)
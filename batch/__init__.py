@@ -0,0 +1 @@
+from .batch import run_batch, find_records, analyze_record
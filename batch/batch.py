@@ -0,0 +1,288 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import csv
+import json
+import os
+import os.path as path
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import filereader
+from analysis import Pipeline, summarize
+from cache import ResultCache, set_cached_boundaries
+from instrument import aggregate, stage, start_recording, stop_recording
+from store import ResultStore, get_file_key
+
+
+# File extensions of the ECG formats that can be read
+RECORD_EXTENSIONS = (".json", ".xml", ".ecgb")
+
+# Columns of each output row
+FIELDS = (
+    "file",
+    "frequency",
+    "heart_rate",
+    "beats",
+    "p_terminal_force",
+    "median_p_terminal_force",
+    "seconds",
+    "error",
+)
+
+# Number of records queued per worker, bounds the number of pending results held in memory
+QUEUED_PER_WORKER = 4
+
+# Pipeline kept warm in each worker process, so its buffers are reused from one record to the next
+_pipeline = None
+
+
+def find_records(source):
+    """
+    Lists the ECG files of a cohort.
+    :param source: Directory to be searched recursively, or manifest file listing one ECG file path per line
+    :return: Sorted list of ECG file paths
+    """
+
+    if path.isdir(source):
+        records = []
+        for directory, _, files in os.walk(source):
+            for file in files:
+                if path.splitext(file)[1].lower() in RECORD_EXTENSIONS:
+                    records.append(path.join(directory, file))
+        return sorted(records)
+
+    # Manifest paths are relative to the manifest, blank lines and lines starting with '#' are ignored
+    records = []
+    with open(source) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                records.append(path.join(path.dirname(source), line))
+    return records
+
+
+def analyze_record(file_path, seconds=None, timeout=None, cache_directory=None, instrument=False, with_beats=False,
+                   with_file_key=False):
+    """
+    Reads and analyzes a single ECG file, isolating any error it raises.
+    :param file_path: Path to ECG file
+    :param seconds: Length of waveform in seconds to be read, default/None is entire waveform
+    :param timeout: Maximum seconds the analysis may take, default/None is no limit, requires SIGALRM (Unix)
+    :param cache_directory: Directory of the result cache, default/None is no cache
+    :param instrument: Records the time, memory, and counters of each stage under the key 'instrumentation'
+    :param with_beats: Adds the structured array of the beats under the key 'beat_table'
+    :param with_file_key: Adds the size, modification time, and hash of the file from before it is read under the key
+    'file_key', unless the file could not be found
+    :return: Dictionary with a value for each of FIELDS
+    """
+
+    row = dict.fromkeys(FIELDS)
+    row["file"] = file_path
+
+    start = time.perf_counter()
+    previous_handler = None
+    if timeout:
+        previous_handler = signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if instrument:
+        start_recording()
+    try:
+        if with_file_key:
+            row["file_key"] = get_file_key(file_path)
+        with stage("read"):
+            ecg = filereader.read_file(file_path, seconds)
+        cache = ResultCache(cache_directory) if cache_directory else None
+        set_cached_boundaries(ecg, file_path, cache, analyze=get_pipeline(), seconds=seconds, mode="whole")
+        row.update(summarize(ecg))
+        if with_beats:
+            row["beat_table"] = ecg.get_beats().get_array()
+    except Exception as error:
+        row["error"] = "{}: {}".format(type(error).__name__, error)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    row["seconds"] = time.perf_counter() - start
+    if instrument:
+        row["instrumentation"] = stop_recording()
+
+    return row
+
+
+def get_pipeline():
+    """ Gets the pipeline of this process, created on its first record """
+
+    global _pipeline
+
+    if _pipeline is None:
+        _pipeline = Pipeline()
+
+    return _pipeline
+
+
+def raise_timeout(signum, frame):
+    raise TimeoutError("Analysis exceeded time limit")
+
+
+def run_batch(source, output_path, workers=None, seconds=None, timeout=None, output_format=None, cache_directory=None,
+              instrument_path=None, store_path=None):
+    """
+    Analyzes every ECG file of a cohort across a process pool and writes one row per record.
+    :param source: Directory to be searched recursively, or manifest file listing one ECG file path per line
+    :param output_path: Path of the output file
+    :param workers: Number of worker processes, default/None is the number of processors
+    :param seconds: Length of waveform in seconds to be read, default/None is entire waveform
+    :param timeout: Maximum seconds the analysis of a record may take, default/None is no limit
+    :param output_format: 'csv' or 'ndjson', default/None is determined by the output file extension
+    :param cache_directory: Directory of the result cache, default/None is no cache
+    :param instrument_path: Path of a JSON file for percentiles of the time, memory, and counters of each stage across
+    records, default/None is no instrumentation
+    :param store_path: Path of a results database, records with results of their current file and analysis are not
+    analyzed again, default/None is no database
+    :return: Tuple containing the number of records analyzed and the number that failed, not counting records with
+    results reused from the database
+    """
+
+    records = find_records(source)
+    if output_format is None:
+        output_format = "csv" if path.splitext(output_path)[1].lower() == ".csv" else "ndjson"
+
+    workers = workers or os.cpu_count()
+    instrument = instrument_path is not None
+    store = ResultStore(store_path) if store_path else None
+    options = (seconds, timeout, cache_directory, instrument, store is not None, store is not None)
+
+    analyzed = 0
+    records_instrumentation = []
+    failed = 0
+    with open(output_path, "w", newline="") as output:
+        write_row = get_writer(output, output_format)
+
+        pending = {}
+        remaining = iter(records)
+        executor = ProcessPoolExecutor(workers)
+        try:
+            while True:
+                # Keep a bounded number of records queued
+                while len(pending) < QUEUED_PER_WORKER * workers:
+                    file_path = next(remaining, None)
+                    if file_path is None:
+                        break
+
+                    # Results of unchanged records are written from the database rather than analyzed again
+                    if store is not None and store.is_current(file_path, seconds=seconds):
+                        write_row(store.get_row(file_path))
+                        continue
+
+                    pending[executor.submit(analyze_record, file_path, *options)] = file_path
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                # A worker that dies takes every queued record with it, so wait for the rest of the queue to fail
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    done, _ = wait(pending)
+
+                rows = []
+                suspects = []
+                for future in done:
+                    file_path = pending.pop(future)
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        suspects.append(file_path)
+                    else:
+                        rows.append(future.result())
+
+                # Replace the broken pool and retry each affected record on its own to find the one that crashed
+                if suspects:
+                    executor.shutdown(cancel_futures=True)
+                    rows += [analyze_isolated(file_path, *options) for file_path in suspects]
+                    executor = ProcessPoolExecutor(workers)
+
+                # Records are stored in one transaction, each keyed by its file as the worker found it before reading,
+                # records with no key are not stored and are analyzed again on the next run
+                stored = []
+                for row in rows:
+                    beats = row.pop("beat_table", None)
+                    file_key = row.pop("file_key", None)
+                    if file_key is not None:
+                        stored.append((row["file"], row, beats, file_key))
+                if store is not None:
+                    store.put_many(stored, seconds=seconds)
+
+                for row in rows:
+                    write_row(row)
+                    analyzed += 1
+                    if row["error"]:
+                        failed += 1
+                    if row.get("instrumentation"):
+                        records_instrumentation.append(row["instrumentation"])
+        finally:
+            executor.shutdown(cancel_futures=True)
+            if store is not None:
+                store.close()
+
+    if instrument:
+        with open(instrument_path, "w") as file:
+            json.dump(aggregate(records_instrumentation), file, indent=2)
+
+    return analyzed, failed
+
+
+def analyze_isolated(file_path, seconds=None, timeout=None, cache_directory=None, instrument=False, with_beats=False,
+                     with_file_key=False):
+    """
+    Analyzes a single ECG file in its own worker process, so a crash only fails that record.
+    :param file_path: Path to ECG file
+    :param seconds: Length of waveform in seconds to be read, default/None is entire waveform
+    :param timeout: Maximum seconds the analysis may take, default/None is no limit
+    :param cache_directory: Directory of the result cache, default/None is no cache
+    :param instrument: Records the time, memory, and counters of each stage under the key 'instrumentation'
+    :param with_beats: Adds the structured array of the beats under the key 'beat_table'
+    :param with_file_key: Adds the size, modification time, and hash of the file from before it is read under the key
+    'file_key'
+    :return: Dictionary with a value for each of FIELDS
+    """
+
+    with ProcessPoolExecutor(1) as executor:
+        try:
+            return executor.submit(analyze_record, file_path, seconds, timeout, cache_directory, instrument,
+                                   with_beats, with_file_key).result()
+        except BrokenProcessPool:
+            row = dict.fromkeys(FIELDS)
+            row.update(file=file_path, error="BrokenProcessPool: worker process terminated abruptly")
+            return row
+
+
+def get_writer(output, output_format):
+    """
+    Gets a function that writes a row to the output file.
+    :param output: Writable text file
+    :param output_format: 'csv' or 'ndjson'
+    :return: Function taking a row dictionary
+    """
+
+    match output_format:
+        case "csv":
+            writer = csv.DictWriter(output, fieldnames=FIELDS, extrasaction="ignore")
+            writer.writeheader()
+
+            def write_row(row):
+                row = dict(row)
+                if row["p_terminal_force"] is not None:
+                    row["p_terminal_force"] = ";".join(str(round(pterm, 2)) for pterm in row["p_terminal_force"])
+                writer.writerow(row)
+
+        case "ndjson":
+            def write_row(row):
+                output.write(json.dumps(row) + "\n")
+
+        case _:
+            raise Exception("Output format not supported: '{}'".format(output_format))
+
+    return write_row
@@ -0,0 +1,71 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import sys
+from argparse import ArgumentParser
+
+from benchmark import compare_results, load_results, run_benchmarks, save_results
+from benchmark.benchmark import FREQUENCIES, FULL_LENGTHS, LEAD_COUNTS, LENGTHS, TOLERANCE
+
+
+def get_arguments():
+    """ Defines and returns a dictionary of environment arguments """
+
+    parser = ArgumentParser()
+
+    # Argument for output file path
+    parser.add_argument("-o", "--output", required=False, help="Path to save results (.json)")
+
+    # Argument for baseline to compare against
+    parser.add_argument("-b", "--baseline", required=False, help="Path to saved results to compare against")
+
+    # Arguments for the benchmarked grid
+    parser.add_argument("-l", "--lengths", required=False, type=float, nargs="+", default=LENGTHS,
+                        help="Recording lengths in seconds")
+    parser.add_argument("--full", required=False, action="store_true",
+                        help="Benchmark lengths up to 24 hours, which needs several GB of memory")
+    parser.add_argument("-f", "--frequencies", required=False, type=int, nargs="+", default=FREQUENCIES,
+                        help="Sampling frequencies")
+    parser.add_argument("--leads", required=False, type=int, nargs="+", default=LEAD_COUNTS, help="Lead counts")
+    parser.add_argument("--stages", required=False, nargs="+", help="Stages to be reported, default is all")
+
+    # Argument for number of timed runs
+    parser.add_argument("-r", "--repeat", required=False, type=int, default=3, help="Number of timed runs of a stage")
+
+    # Argument for regression threshold
+    parser.add_argument("-t", "--tolerance", required=False, type=float, default=TOLERANCE,
+                        help="Fractional drop in throughput or growth in peak memory reported as a regression")
+
+    return vars(parser.parse_args())
+
+
+def print_result(result):
+    # Stages too fast to time have no throughput
+    throughput = "n/a" if result["throughput"] is None else "{:,.0f}".format(result["throughput"])
+    print("{stage:<20} {length:>8g} s {frequency:>5} Hz {leads:>3} leads {throughput:>14} samples/s "
+          "{peak_memory:>14,} B".format(**dict(result, throughput=throughput)))
+
+
+def main():
+    args = get_arguments()
+    lengths = FULL_LENGTHS if args["full"] else args["lengths"]
+    results = run_benchmarks(lengths, args["frequencies"], args["leads"], stages=args["stages"], repeat=args["repeat"],
+                             progress=print_result)
+
+    if args["output"]:
+        save_results(results, args["output"])
+
+    # Exit with an error when a regression is found, so it can fail a build
+    if args["baseline"]:
+        regressions = compare_results(load_results(args["baseline"]), results, args["tolerance"])
+        for stage, length, frequency, leads, measurement, before, after in regressions:
+            print("Regression in {} ({:g} s, {} Hz, {} leads): {} {:,.0f} -> {:,.0f}".format(
+                stage, length, frequency, leads, measurement, before, after))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from .benchmark import run_benchmarks, save_results, load_results, compare_results
@@ -0,0 +1,259 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import gc
+import json
+import os
+import os.path as path
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+import filereader
+from dsp import dsp, multilead, singlelead
+from ecg import ECG, Lead
+
+
+# Recording of a single beat of each lead, tiled to the benchmarked length
+FIXTURE = path.join(path.dirname(path.dirname(path.abspath(__file__))), "test", "testdata", "nsr.json")
+
+# Order leads are added to a benchmarked recording, V1 first as the single lead stages analyze it
+LEAD_ORDER = (Lead.V1, Lead.II, Lead.V5, Lead.I, Lead.III, Lead.V2, Lead.V3, Lead.V4, Lead.V6, Lead.AVL, Lead.AVR,
+              Lead.AVF)
+
+# Default grid of recording lengths (in seconds), sampling frequencies, and lead counts
+LENGTHS = (10, 60, 600)
+FREQUENCIES = (250, 500, 1000)
+LEAD_COUNTS = (1, 3, 12)
+
+# Lengths up to 24 hours, which need several GB of memory per lead at 1000 Hz
+FULL_LENGTHS = (10, 60, 600, 3600, 86400)
+
+# Default fractional drop in throughput, or growth in peak memory, reported as a regression
+TOLERANCE = 0.2
+
+# Growth in peak memory (in bytes) below which a regression is not reported, as small allocations vary between runs
+MEMORY_FLOOR = 64 * 2**10
+
+# Format version of saved results
+RESULTS_VERSION = 1
+
+
+def make_recording(seconds, frequency, num_leads):
+    """
+    Makes a recording by resampling and tiling a beat of the fixture.
+    Leads the fixture does not have are derived from leads I and II.
+    :param seconds: Length of the recording in seconds
+    :param frequency: Sampling frequency
+    :param num_leads: Number of leads, up to 12
+    :return: ECG object
+    """
+
+    import scipy.signal as signal
+
+    fixture = filereader.read_file(FIXTURE, seconds=1)
+    beats = {lead: fixture.get_lead(lead) for lead in fixture.get_available_leads()}
+    beats[Lead.AVR] = -(beats[Lead.I] + beats[Lead.II]) / 2
+    beats[Lead.AVL] = beats[Lead.I] - beats[Lead.II] / 2
+    beats[Lead.AVF] = beats[Lead.II] - beats[Lead.I] / 2
+
+    # The beat is periodic, so it is resampled in the frequency domain without edge effects
+    leads = LEAD_ORDER[:num_leads]
+    beat = signal.resample(numpy.array([beats[lead] for lead in leads]), int(frequency), axis=1)
+    num_samples = int(seconds * frequency)
+    samples = numpy.tile(beat, (1, -(-num_samples // beat.shape[1])))[:, :num_samples]
+
+    ecg = ECG(frequency)
+    ecg.set_lead_matrix(list(leads), numpy.ascontiguousarray(samples))
+
+    return ecg
+
+
+def get_stages(ecg, directory):
+    """
+    Gets the benchmarked stages of the analysis of a recording, each run on the output of the stages before it.
+    :param ecg: ECG object of the recording
+    :param directory: Directory for files written by the stages
+    :return: List of tuples of the stage name, the number of samples it processes, and a function running it
+    """
+
+    frequency = ecg.get_frequency()
+    leads = ecg.get_lead_matrix()
+    v1 = ecg.get_lead(Lead.V1)
+    file_path = path.join(directory, "recording.ecgb")
+    filereader.write_binary(ecg, file_path)
+
+    # Inputs of later stages, set as the earlier stages run
+    data = {}
+
+    def read_file():
+        filereader.read_file(file_path).get_lead_matrix()
+
+    def bandpass_filter():
+        data["filtered"] = dsp.bandpass_filter(leads, frequency)
+
+    def derivative_filter():
+        data["derived"] = dsp.derivative_filter(data["filtered"])
+        data["squared"] = dsp.squaring(data["derived"])
+
+    def moving_average():
+        dsp.moving_average(data["squared"], int(frequency * singlelead.QRS_WIDTH_MAX))
+
+    def qrs_detect():
+        singlelead.qrs_detect(data["derived"][0], frequency, squared=data["squared"][0])
+
+    def determine_qrs():
+        data["qrs"] = multilead.determine_qrs(leads, frequency, derivatives=data["derived"], squared=data["squared"])
+
+    def determine_t_waves():
+        data["t_waves"] = multilead.determine_t_waves(leads, frequency, data["qrs"])
+
+    def p_wave_boundaries():
+        data["p_waves"] = singlelead.p_wave_boundaries(data["qrs"], data["t_waves"], v1, frequency,
+                                                       derived=data["derived"][0])
+
+    def pterm_measurements():
+        singlelead.pterm_measurements(data["filtered"][0], frequency, data["p_waves"])
+
+    return [
+        ("read_file", leads.size, read_file),
+        ("bandpass_filter", leads.size, bandpass_filter),
+        ("derivative_filter", leads.size, derivative_filter),
+        ("moving_average", leads.size, moving_average),
+        ("qrs_detect", len(v1), qrs_detect),
+        ("determine_qrs", leads.size, determine_qrs),
+        ("determine_t_waves", leads.size, determine_t_waves),
+        ("p_wave_boundaries", len(v1), p_wave_boundaries),
+        ("pterm_measurements", len(v1), pterm_measurements),
+    ]
+
+
+def measure(function, repeat):
+    """
+    Measures the time and peak memory of a function.
+    Time is the best of several runs, and peak memory is measured on a separate run, as tracing slows allocation.
+    :param function: Function taking no arguments
+    :param repeat: Number of timed runs
+    :return: Tuple of seconds and peak bytes allocated
+    """
+
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak
+
+
+def run_benchmarks(lengths=LENGTHS, frequencies=FREQUENCIES, lead_counts=LEAD_COUNTS, stages=None, repeat=3,
+                   progress=None):
+    """
+    Benchmarks each stage of the analysis over a grid of recording lengths, sampling frequencies, and lead counts.
+    :param lengths: Iterable of recording lengths in seconds
+    :param frequencies: Iterable of sampling frequencies
+    :param lead_counts: Iterable of lead counts, up to 12
+    :param stages: Iterable of stage names to be reported, default/None is all stages, earlier stages are always run
+    :param repeat: Number of timed runs of each stage
+    :param progress: Function called with each result as it is measured, default/None is none
+    :return: Dictionary of the machine, library versions, and list of results
+    """
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for seconds in lengths:
+            for frequency in frequencies:
+                for num_leads in lead_counts:
+                    ecg = make_recording(seconds, frequency, num_leads)
+                    for stage, num_samples, function in get_stages(ecg, directory):
+                        if stages is not None and stage not in stages:
+                            function()
+                            continue
+                        elapsed, peak = measure(function, repeat)
+                        result = {
+                            "stage": stage,
+                            "length": seconds,
+                            "frequency": frequency,
+                            "leads": num_leads,
+                            "samples": num_samples,
+                            "seconds": elapsed,
+                            "throughput": num_samples / elapsed if elapsed else None,
+                            "peak_memory": peak,
+                        }
+                        results.append(result)
+                        if progress is not None:
+                            progress(result)
+                    del ecg
+
+    return {
+        "version": RESULTS_VERSION,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "results": results,
+    }
+
+
+def save_results(results, file_path):
+    """ Saves benchmark results as JSON """
+
+    with open(file_path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(file_path):
+    """ Loads benchmark results saved by save_results """
+
+    with open(file_path) as file:
+        results = json.load(file)
+
+    if results.get("version") != RESULTS_VERSION:
+        raise Exception("Benchmark results version not supported: {}".format(results.get("version")))
+
+    return results
+
+
+def compare_results(baseline, current, tolerance=TOLERANCE):
+    """
+    Compares benchmark results to a baseline, matching results by stage, length, frequency, and lead count.
+    :param baseline: Results of run_benchmarks or load_results to compare against
+    :param current: Results of run_benchmarks or load_results
+    :param tolerance: Fractional drop in throughput, or growth in peak memory, reported as a regression
+    :return: List of tuples of the stage, length, frequency, lead count, measurement, baseline value, and current value
+    for each regression
+    """
+
+    def key(result):
+        return result["stage"], result["length"], result["frequency"], result["leads"]
+
+    previous = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        throughput = result["throughput"]
+        if before["throughput"] and throughput and throughput < (1 - tolerance) * before["throughput"]:
+            regressions.append(key(result) + ("throughput", before["throughput"], result["throughput"]))
+        growth = result["peak_memory"] - before["peak_memory"]
+        if growth > tolerance * before["peak_memory"] and growth > MEMORY_FLOOR:
+            regressions.append(key(result) + ("peak_memory", before["peak_memory"], result["peak_memory"]))
+
+    return regressions
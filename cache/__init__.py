@@ -0,0 +1 @@
+from .cache import ResultCache, set_cached_boundaries, CACHE_DIRECTORY
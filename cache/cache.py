@@ -0,0 +1,226 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import hashlib
+import json
+import os
+import os.path as path
+import tempfile
+
+from analysis import set_boundaries
+from ecg import P_WAVE
+
+
+# Version of the analysis code, change whenever results of the same parameters change, so cached results are unused
+VERSION = "4"
+
+# Default directory and maximum size (in bytes) of the result cache
+CACHE_DIRECTORY = path.join(path.expanduser("~"), ".cache", "p-terminal-force")
+CACHE_SIZE = 256 * 2**20
+
+# Fraction of the maximum size the least recently used results are evicted down to, so the cache directory is only
+# scanned once every several puts when full
+EVICTION_TARGET = 0.9
+
+# Bytes read at a time when hashing a file
+HASH_BLOCK_SIZE = 2**20
+
+# Running estimate of the bytes in each cache directory, from its last scan and the results this process put since
+_sizes = {}
+
+
+class ResultCache:
+    """
+    On-disk cache of boundaries and measurements, keyed by the content of the ECG file, the analysis parameters, and
+    the code version, so results are reused until the file, a parameter, or the code changes.
+    Each result is a file in the cache directory, and the least recently used results are evicted once the cache
+    exceeds its maximum size. The directory is only scanned when a running estimate of its size exceeds the maximum,
+    and the estimate only counts the results of this process, so several processes sharing a cache can overshoot it
+    until one of them scans.
+    """
+
+    def __init__(self, directory=CACHE_DIRECTORY, max_size=CACHE_SIZE):
+        """
+        :param directory: Directory of cached results, created when first written
+        :param max_size: Maximum bytes of cached results
+        """
+
+        self._directory = directory
+        self._max_size = max_size
+
+        # Hash of the last file, keyed by path, size, and modification time, so a file is hashed once for a get and put
+        self._hashes = {}
+
+    def get(self, file_path, **options):
+        """
+        Gets cached results of an ECG file.
+        :param file_path: Path to ECG file
+        :param options: Options the results depend on, such as the seconds read
+        :return: Dictionary of QRS complexes, T-waves, P-waves, and P-terminal force, or None if not cached
+        """
+
+        entry = self._entry(file_path, options)
+        try:
+            with open(entry) as file:
+                results = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used
+        os.utime(entry)
+
+        return results
+
+    def put(self, file_path, ecg, **options):
+        """
+        Caches the results of an analyzed ECG, then evicts least recently used results over the maximum size.
+        :param file_path: Path to ECG file
+        :param ecg: ECG object that has had its boundaries set
+        :param options: Options the results depend on, such as the seconds read
+        """
+
+        results = {
+            "qrs_complexes": [[int(index) for index in boundary] for boundary in ecg.get_qrs_complexes()],
+            "t_waves": [[int(index) for index in boundary] for boundary in ecg.get_t_waves()],
+            "p_waves": [[int(index) for index in boundary] for boundary in ecg.get_p_waves()],
+            "p_terminal_force": [float(pterm) for pterm in ecg.get_p_terminal_force()],
+        }
+
+        # Measurements of the terminal segment of each P-wave, kept so the display does not measure them again
+        beats = ecg.get_beats()
+        measured = beats[beats.has(P_WAVE)]
+        results["p_depth"] = measured["p_depth"].tolist()
+        results["p_duration"] = measured["p_duration"].tolist()
+        results["p_deepest"] = measured["p_deepest"].tolist()
+
+        # Write to a temporary file first, so concurrent readers never see a partial result
+        os.makedirs(self._directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=self._directory, suffix=".tmp", delete=False) as file:
+            json.dump(results, file)
+        entry = self._entry(file_path, options)
+        added = path.getsize(file.name) - get_size(entry)
+        os.replace(file.name, entry)
+
+        directory = path.abspath(self._directory)
+        if directory not in _sizes or _sizes[directory] + added > self._max_size:
+            self._evict()
+        else:
+            _sizes[directory] += added
+
+    def _entry(self, file_path, options):
+        """ Gets the path of the cached results of an ECG file """
+
+        stat = os.stat(file_path)
+        file_key = (path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if file_key not in self._hashes:
+            self._hashes = {file_key: hash_file(file_path)}
+
+        key = {
+            "file": self._hashes[file_key],
+            "parameters": get_parameters(),
+            "version": VERSION,
+            "options": options,
+        }
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+        return path.join(self._directory, digest + ".json")
+
+    def _evict(self):
+        """
+        Scans the cache directory, removing the least recently used results down to EVICTION_TARGET of the maximum
+        size if it is exceeded.
+        """
+
+        entries = []
+        for name in os.listdir(self._directory):
+            if name.endswith(".json"):
+                stat = os.stat(path.join(self._directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+        if size > self._max_size:
+            for _, entry_size, name in sorted(entries):
+                if size <= EVICTION_TARGET * self._max_size:
+                    break
+                try:
+                    os.remove(path.join(self._directory, name))
+                except FileNotFoundError:
+                    pass  # already evicted by another process
+                size -= entry_size
+
+        _sizes[path.abspath(self._directory)] = size
+
+
+def set_cached_boundaries(ecg, file_path, cache, analyze=set_boundaries, **options):
+    """
+    Sets the boundaries and measurements of an ECG from the cache, or analyzes it and caches the results.
+    :param ecg: ECG object read from the file, boundaries and measurements are set on it
+    :param file_path: Path to ECG file
+    :param cache: ResultCache, or None to always analyze
+    :param analyze: Function setting the boundaries of an ECG, default is set_boundaries
+    :param options: Options the results depend on, such as the seconds read
+    :return: True if the results were cached
+    """
+
+    results = cache.get(file_path, **options) if cache is not None else None
+    if results is None:
+        analyze(ecg)
+        if cache is not None:
+            cache.put(file_path, ecg, **options)
+        return False
+
+    ecg.set_qrs_complexes([tuple(boundary) for boundary in results["qrs_complexes"]])
+    ecg.set_t_waves([tuple(boundary) for boundary in results["t_waves"]])
+    ecg.set_p_waves([tuple(boundary) for boundary in results["p_waves"]])
+    ecg.set_p_terminal_force(results["p_terminal_force"])
+    if results["p_waves"]:
+        ecg.get_beats().set_p_terminal_force(results["p_terminal_force"], results["p_depth"], results["p_duration"],
+                                             results["p_deepest"])
+
+    return True
+
+
+def get_size(file_path):
+    """ Gets the bytes of a file, or 0 if it does not exist """
+
+    try:
+        return os.stat(file_path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def hash_file(file_path):
+    """
+    Hashes the content of a file.
+    :param file_path: Path to file
+    :return: Hex digest of the SHA-256 of the file
+    """
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def get_parameters():
+    """
+    Gets the current values of the tunable analysis constants.
+    :return: Dictionary of constant name to value
+    """
+
+    from dsp import dsp, multilead, singlelead
+
+    names = {
+        dsp: ("SAVGOL_WINDOW", "SAVGOL_ORDER", "HIGHPASS_CUTOFF", "DERIVATIVE_WINDOW"),
+        singlelead: ("QR_INTERVAL", "QRS_REFRACTORY_PERIOD", "QRS_WIDTH_MAX", "PR_INTERVAL_MAX", "PR_INTERVAL_MIN",
+                     "P_WAVE_WIDTH_MAX", "BIPHASIC_FACTOR", "BASE_CUTOFF_FACTOR", "LOWERED_CUTOFF_FACTOR",
+                     "BACKTRACK_FACTOR"),
+        multilead: ("QRS_CONSENSUS_THRESHOLD", "T_WAVE_CONSENSUS_THRESHOLD"),
+    }
+
+    return {"{}.{}".format(module.__name__, name): getattr(module, name)
+            for module, constants in names.items() for name in constants}
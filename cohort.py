@@ -0,0 +1,60 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+from argparse import ArgumentParser
+
+from batch import run_batch
+from cache import CACHE_DIRECTORY
+
+
+def get_arguments():
+    """ Defines and returns a dictionary of environment arguments """
+
+    parser = ArgumentParser()
+
+    # Argument for directory or manifest of ECG files
+    parser.add_argument("-d", "--source", required=True, help="Directory of ECG files, or manifest listing one per line")
+
+    # Argument for output file path
+    parser.add_argument("-o", "--output", required=True, help="Path to output file (.csv or .ndjson)")
+
+    # Argument for output format if not determined by extension
+    parser.add_argument("--format", required=False, choices=["csv", "ndjson"], help="Output format")
+
+    # Argument for number of worker processes
+    parser.add_argument("-w", "--workers", required=False, type=int, help="Number of worker processes")
+
+    # Argument for max duration of lead to be read
+    parser.add_argument("-s", "--seconds", required=False, type=float, help="Maximum seconds to be analyzed")
+
+    # Argument for time limit of each record
+    parser.add_argument("-t", "--timeout", required=False, type=float, help="Maximum seconds to analyze a record")
+
+    # Argument for always analyzing rather than reusing cached results
+    parser.add_argument("--no-cache", required=False, action="store_true",
+                        help="Analyze even if results of the same file and parameters are cached")
+
+    # Argument for measuring the time and memory of each stage
+    parser.add_argument("--instrument", required=False,
+                        help="Path to save percentiles of the time, memory, and counters of each stage as JSON")
+
+    # Argument for storing results to a database, only new or changed records are analyzed
+    parser.add_argument("--database", required=False,
+                        help="Path to SQLite results database, records unchanged since last stored are not reanalyzed")
+
+    return vars(parser.parse_args())
+
+
+def main():
+    args = get_arguments()
+    analyzed, failed = run_batch(args["source"], args["output"], workers=args["workers"], seconds=args["seconds"],
+                                 timeout=args["timeout"], output_format=args["format"],
+                                 cache_directory=None if args["no_cache"] else CACHE_DIRECTORY,
+                                 instrument_path=args["instrument"], store_path=args["database"])
+    print("Analyzed {} records, {} failed".format(analyzed, failed))
+
+
+if __name__ == "__main__":
+    main()
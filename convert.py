@@ -0,0 +1,80 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import os
+import os.path as path
+from argparse import ArgumentParser
+
+import filereader
+from batch import find_records
+from batch.batch import RECORD_EXTENSIONS
+
+
+# Extension of converted files
+BINARY_EXTENSION = ".ecgb"
+
+
+def get_arguments():
+    """ Defines and returns a dictionary of environment arguments """
+
+    parser = ArgumentParser()
+
+    # Argument for ECG file, directory, or manifest to be converted
+    parser.add_argument("-d", "--source", required=True,
+                        help="ECG file, directory of ECG files, or manifest listing one per line")
+
+    # Argument for output directory
+    parser.add_argument("-o", "--output", required=False,
+                        help="Directory of converted files, default is alongside each ECG file")
+
+    # Argument for max duration of lead to be converted
+    parser.add_argument("-s", "--seconds", required=False, type=float, help="Maximum seconds to be converted")
+
+    # Argument for compressing the samples
+    parser.add_argument("--compress", required=False, action="store_true",
+                        help="Compress the samples, which are then no longer memory-mapped when read")
+
+    return vars(parser.parse_args())
+
+
+def convert(file_path, output_path, seconds=None, compress=False):
+    """
+    Converts an ECG file to the binary format read by filereader.
+    :param file_path: Path to ECG file
+    :param output_path: Path to binary ECG file
+    :param seconds: Length of waveform in seconds to be converted, default/None is entire waveform
+    :param compress: Compresses the samples, default is false
+    """
+
+    ecg = filereader.read_file(file_path, seconds)
+    filereader.write_binary(ecg, output_path, compress=compress)
+
+
+def main():
+    args = get_arguments()
+
+    # A single file is converted on its own, otherwise every ECG file of the directory or manifest
+    source = args["source"]
+    if path.splitext(source)[1].lower() in RECORD_EXTENSIONS:
+        records, root = [source], path.dirname(source)
+    else:
+        records, root = find_records(source), source if path.isdir(source) else path.dirname(source)
+
+    converted = 0
+    for record in records:
+        if record.endswith(BINARY_EXTENSION):
+            continue
+        output_path = path.splitext(record)[0] + BINARY_EXTENSION
+        if args["output"]:
+            output_path = path.join(args["output"], path.relpath(output_path, root))
+            os.makedirs(path.dirname(output_path), exist_ok=True)
+        convert(record, output_path, seconds=args["seconds"], compress=args["compress"])
+        converted += 1
+
+    print("Converted {} records".format(converted))
+
+
+if __name__ == "__main__":
+    main()
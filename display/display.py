@@ -3,9 +3,6 @@ Author: Brody Taylor
 Date: Sept. 30, 2019
 """
 
-from matplotlib import pyplot
-
-from dsp.singlelead import bandpass_filter as filter
 from ecg import Lead
 
 
@@ -27,10 +24,13 @@ def plot(ecg, lead_of_interest=Lead.V1, annotate=True, do_filtering=False, grid_
     :param grid_lines: Boolean for displaying grid lines
     """
 
+    # Imported when first needed so that analysis without a display never loads matplotlib
+    from matplotlib import pyplot
+
     frequency = ecg.get_frequency()
     samples = ecg.get_lead(lead_of_interest)
     if do_filtering:
-        samples = filter(samples, frequency)
+        samples = ecg.get_filtered_lead(lead_of_interest)
 
     # Determine graph boundaries
     y_min = min(samples)
@@ -59,7 +59,11 @@ def plot(ecg, lead_of_interest=Lead.V1, annotate=True, do_filtering=False, grid_
         draw_boundaries(ecg.get_qrs_complexes(), y_min, y_max, QRS_COLOR, highlight=True)
         draw_boundaries(ecg.get_t_waves(), y_min, y_max, T_WAVE_COLOR, highlight=True)
         draw_boundaries(ecg.get_p_waves(), y_min, y_max, P_WAVE_COLOR)
-        write_p_terminal_force(ecg.get_p_terminal_force(), ecg.get_p_waves(), samples, frequency)
+        # Labels are placed below the deepest point of each terminal segment, as found when it was measured
+        deepest = ecg.get_beats().get_p_deepest()
+        if len(deepest) != len(ecg.get_p_waves()):
+            deepest = None  # P-waves set without QRS complexes to group them by
+        write_p_terminal_force(ecg.get_p_terminal_force(), ecg.get_p_waves(), samples, frequency, deepest=deepest)
 
     # Plot the lead
     pyplot.plot([i for i in range(x_max)], samples, linestyle="solid", color=LEAD_COLOR)
@@ -72,6 +76,8 @@ def plot(ecg, lead_of_interest=Lead.V1, annotate=True, do_filtering=False, grid_
 
 
 def draw_grid_lines(frequency, x_min, x_max, y_min, y_max):
+    from matplotlib import pyplot
+
     grid_width, grid_height = get_grid_size(frequency)
 
     # Vertical lines
@@ -99,6 +105,8 @@ def get_grid_size(frequency):
 
 
 def draw_boundaries(boundaries, y_min, y_max, color, highlight=False):
+    from matplotlib import pyplot
+
     for boundary in boundaries:
         start, end = boundary[0], boundary[-1]
         if highlight and start != end:
@@ -109,20 +117,21 @@ def draw_boundaries(boundaries, y_min, y_max, color, highlight=False):
             pyplot.plot([end, end], [y_min, y_max], linestyle="dashed", color=color, linewidth=1)
 
 
-def write_p_terminal_force(p_terminal_force, p_waves, samples, frequency):
+def write_p_terminal_force(p_terminal_force, p_waves, samples, frequency, deepest=None):
+    from matplotlib import pyplot
+
     for i in range(len(p_waves)):
         p_wave = p_waves[i]
         
         # Build text
-        pterm = str(round(p_terminal_force[i], 2))
-        if pterm == "0":
+        if p_terminal_force[i] == 0:
             pterm = "N/A"
         else:
-            pterm += " μV*mS"
+            pterm = str(round(p_terminal_force[i], 2)) + " μV*mS"
 
-        # Get x-coord for text
-        if len(p_wave) > 3:
-            x = p_wave[1]
+        # Get x-coord for text, the point of max depth if biphasic
+        if deepest is not None and deepest[i] >= 0:
+            x = deepest[i]
         else:
             x = p_wave[0] + round((p_wave[-1] - p_wave[0]) / 2)
         
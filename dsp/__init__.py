@@ -1,2 +1,3 @@
 from .multilead import determine_qrs, determine_t_waves
-from .singlelead import p_wave_boundaries, pterm_measurements
\ No newline at end of file
+from .singlelead import measure_p_terminal_force, p_wave_boundaries, pterm_measurements
+from .stream import Beat, StreamAnalyzer
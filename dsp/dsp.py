@@ -5,22 +5,45 @@ Date: Sept. 30, 2019
 
 import math
 import numpy
-import scipy.signal as signal
-import scipy.stats as stats
-import statistics
+from numpy.lib.stride_tricks import sliding_window_view
 
 
-def bandpass_filter(samples, frequency):
+# Savitzky–Golay smoothing window length (in samples) and polynomial order
+SAVGOL_WINDOW = 31
+SAVGOL_ORDER = 3
+
+# Cutoff (in Hz) of the high-pass filter removing baseline wander
+HIGHPASS_CUTOFF = 0.8
+
+# Number of samples on either side of the least-squares window used for the derivative
+DERIVATIVE_WINDOW = 2
+
+
+def bandpass_filter(samples, frequency, with_derivative=False):
+    """
+    Savitzky–Golay smoothing followed by a high-pass filter.
+    :param samples: Array of samples to be filtered
+    :param frequency: Sampling frequency
+    :param with_derivative: Also returns the derivative of the filtered samples, default is false
+    :return: Array of filtered samples, or tuple of filtered samples and derivative if with_derivative is true
+    """
+
+    # Imported when first needed, as scipy.signal is slow to import
+    import scipy.signal as signal
+
     # Savitzky–Golay filter to remove electromyogenic noise
-    filtered = signal.savgol_filter(samples, 31, 3, mode='nearest')
+    filtered = signal.savgol_filter(samples, SAVGOL_WINDOW, SAVGOL_ORDER, mode='nearest')
 
     # Highpass filter to remove baseline wander
     filtered = highpass_filter(filtered, frequency)
 
+    if with_derivative:
+        return filtered, derivative_filter(filtered)
+
     return filtered
 
 
-def highpass_filter(samples, frequency, cutoff=0.8):
+def highpass_filter(samples, frequency, cutoff=HIGHPASS_CUTOFF):
     """
     Butterworth second-order sections high-pass filter.
     :param samples: Array of samples to be filtered
@@ -29,6 +52,8 @@ def highpass_filter(samples, frequency, cutoff=0.8):
     :return: Array of filtered samples
     """
 
+    import scipy.signal as signal
+
     # Get Nyquist frequency
     nyq = 0.5 * frequency
 
@@ -44,67 +69,78 @@ def highpass_filter(samples, frequency, cutoff=0.8):
     return filtered
 
 
-def derivative_filter(samples):
-    """ Gets the derivative of a waveform """
+def derivative_filter(samples, window=DERIVATIVE_WINDOW, out=None):
+    """
+    Gets the derivative of a waveform.
+    The slope at each sample is the least-squares line fit over the surrounding samples, computed for the whole
+    array at once as a correlation with the regression weights.
+    :param samples: Array of samples, or 2-D array with one waveform per row
+    :param window: Number of samples on either side of the fitted sample, default is 2
+    :param out: Optional array to store the result in, must have the same shape as samples
+    :return: Array of slopes
+    """
+
+    samples = numpy.asarray(samples, dtype=float)
 
-    window = 2
+    # Least-squares slope weights are the window positions centered on the fitted sample
+    weights = numpy.arange(-window, window + 1, dtype=float)
+    sum_of_squares = numpy.dot(weights, weights)
 
-    derivative = numpy.empty(len(samples))
-    x = [i for i in range(0, (window * 2) + 1)]
-    for i in range(window, len(samples) - window):
-        y = samples[i-window:i+window+1]
-        slope, *_ = stats.linregress(x, y)
-        derivative[i] = slope
+    derivative = numpy.empty(samples.shape) if out is None else out
+    windows = sliding_window_view(samples, 2 * window + 1, axis=-1)
+    numpy.matmul(windows, weights, out=derivative[..., window:-window])
+    derivative[..., window:-window] /= sum_of_squares
 
     # Extrapolate over sample delay
-    for i in range(window):
-        derivative[i] = derivative[window]
-        derivative[-(1+i)] = derivative[-(window+1)]
+    derivative[..., :window] = derivative[..., window:window+1]
+    derivative[..., -window:] = derivative[..., -(window+1):-window]
 
     return derivative
 
 
-def squaring(samples, signed=False):
+def squaring(samples, signed=False, out=None):
     """
     Squares each sample in an array.
-    :param samples: Array of samples to be squared
+    :param samples: Array of samples to be squared, or 2-D array with one waveform per row
     :param signed: Can specify if value should keep original sign, default is false
+    :param out: Optional array to store the result in, must have the same shape as samples
     :return: Array of squared samples
     """
 
-    squared = numpy.empty(len(samples))
+    samples = numpy.asarray(samples, dtype=float)
+
     if signed:
-        for i in range(len(samples)):
-            sample = samples[i]
-            if sample < 0:
-                squared[i] = -1 * (sample ** 2)
-            else:
-                squared[i] = sample ** 2
-    else:
-        for i in range(len(samples)):
-            squared[i] = samples[i] ** 2
+        return numpy.multiply(samples, numpy.abs(samples), out=out)
 
-    return squared
+    return numpy.square(samples, out=out)
 
 
-def moving_average(samples, width):
+def moving_average(samples, width, out=None, work=None):
     """
     Moving window averaging.
-    :param samples: Array of samples to be averaged
+    :param samples: Array of samples to be averaged, or 2-D array with one waveform per row
     :param width: Number of samples in the moving window
+    :param out: Optional array to store the result in, must have the same shape as samples
+    :param work: Optional array to work in, must have the shape of samples with width more along the last axis
     :return: Array of averages
     """
 
-    averages = numpy.empty(len(samples))
+    samples = numpy.asarray(samples, dtype=float)
+    if out is None:
+        out = numpy.empty(samples.shape)
 
     # Extrapolate samples for delay, weights first sample by amount of window overhang
-    for i in range(width):
-        averages[i] = statistics.mean([samples[0] for _ in range(width - i)] + [sample for sample in samples[:i]])
+    padded = numpy.empty(samples.shape[:-1] + (samples.shape[-1] + width,)) if work is None else work
+    padded[..., :width] = samples[..., :1]
+    padded[..., width:] = samples
 
-    for i in range(width, len(samples)):
-        averages[i] = statistics.mean(samples[i-width:i])
+    # Window sums are differences of the running total, the first average is of the padding alone
+    totals = numpy.cumsum(padded, axis=-1, out=padded)
+    out[..., 0] = totals[..., width-1]
+    numpy.subtract(totals[..., width:-1], totals[..., :-(width+1)], out=out[..., 1:])
+    out /= width
 
-    return averages
+    return out
 
 
 def get_peak(samples, index, positive=True):
@@ -138,3 +174,68 @@ def get_peak(samples, index, positive=True):
         i += direction
 
     return peak
+
+
+def get_edges(samples):
+    """
+    Finds where a waveform rises and falls, so that peaks can be found without stepping through samples.
+    :param samples: Array of waveform samples
+    :return: Tuple of arrays containing the indices followed by a higher sample and by a lower sample
+    """
+
+    slopes = numpy.diff(samples)
+    return numpy.flatnonzero(slopes > 0), numpy.flatnonzero(slopes < 0)
+
+
+def find_peak(samples, index, edges):
+    """
+    Given a point on a positive wave, will find the peak, same as get_peak.
+    :param samples: Array of waveform samples
+    :param index: Index of any point on the wave
+    :param edges: Tuple of rising and falling indices of the samples from get_edges
+    :return: Index of the wave peak
+    """
+
+    rises, falls = edges
+
+    # Determines if peak is to the left or right
+    if index > 0:
+        left = samples[index] < samples[index-1]
+    else:
+        left = samples[index+1] < samples[index]
+
+    # Peak to the left is just after the last rise before the point
+    if left:
+        previous = numpy.searchsorted(rises, index)
+        return int(rises[previous-1]) + 1 if previous else 0
+
+    # Peak to the right is at the first fall from the point onward
+    following = numpy.searchsorted(falls, index)
+    return int(falls[following]) if following < len(falls) else len(samples) - 1
+
+
+def first_above(samples, threshold, start, stop=None):
+    """
+    Finds the first sample above a threshold.
+    Searches in growing blocks, so the work done is proportional to the distance to the sample found.
+    :param samples: Array of waveform samples
+    :param threshold: Value the sample must exceed
+    :param start: Index to search from
+    :param stop: Index to search until (exclusive), default/None is the end of the samples
+    :return: Index of the first sample above the threshold, or None if not found
+    """
+
+    if stop is None or stop > len(samples):
+        stop = len(samples)
+
+    block = 256
+    while start < stop:
+        end = min(start + block, stop)
+        above = samples[start:end] > threshold
+        first = above.argmax()
+        if above[first]:
+            return start + int(first)
+        start = end
+        block *= 2
+
+    return None
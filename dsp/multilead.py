@@ -5,7 +5,10 @@ Date: Sept. 30, 2019
 
 import numpy
 
-from .singlelead import qrs_boundaries, t_wave_boundaries, bandpass_filter, QRS_REFRACTORY_PERIOD
+from ecg import BeatTable
+from instrument import stage
+from .dsp import bandpass_filter, derivative_filter, moving_average, squaring
+from .singlelead import qrs_boundaries, t_wave_ends, t_wave_windows, QRS_REFRACTORY_PERIOD, QRS_WIDTH_MAX
 
 
 # Consensus thresholds are the minimum percent of leads that report a detection for it to be a consensus
@@ -13,109 +16,114 @@ QRS_CONSENSUS_THRESHOLD = 0.5
 T_WAVE_CONSENSUS_THRESHOLD = 0.5
 
 
-def determine_qrs(leads, frequency):
+def determine_qrs(leads, frequency, derivatives=None, squared=None, averaged=None, threshold=None):
     """
     Multi-lead determination of QRS boundaries.
-    Uses the single lead boundary method for each available lead and forms a consensus.
-    :param leads: List of samples representing each available lead
+    All leads are filtered, derived, and averaged together, then the single lead boundary method is used for each lead
+    to form a consensus.
+    :param leads: 2-D array or list of samples representing each available lead
     :param frequency: Sampling frequency
+    :param derivatives: 2-D array of the derivative of each filtered lead if already computed
+    :param squared: 2-D array of the squared derivative of each filtered lead if already computed
+    :param averaged: 2-D array of the moving window average of each squared derivative if already computed
+    :param threshold: Percent of leads for a consensus, default/None is QRS_CONSENSUS_THRESHOLD
     :return: List of tuples containing the consensus start and end index for each QRS complex
     """
 
-    # Array tracks the total number of leads that determined the index to be within a QRS complex
-    qrs_complexes = numpy.zeros(len(leads[0]))
-
-    for samples in leads:
-        # Filter samples
-        filtered = bandpass_filter(samples, frequency)
-
-        # Get QRS boundaries for the lead
-        boundaries = qrs_boundaries(filtered, frequency)
-
-        # Add each QRS to the total
-        for qrs in boundaries:
-            start = qrs[0]
-            end = qrs[1]
-            for i in range(start, end + 1):
-                qrs_complexes[i] += 1
+    # Get slope information for all leads at once, only timed as a stage when not already computed by the caller
+    if derivatives is None or squared is None:
+        with stage("filter"):
+            if derivatives is None:
+                _, derivatives = bandpass_filter(numpy.asarray(leads, dtype=float), frequency, with_derivative=True)
+            if squared is None:
+                squared = squaring(derivatives)
+
+    # QRS complexes determined by every lead
+    with stage("qrs_detect"):
+        if averaged is None:
+            averaged = moving_average(squared, int(frequency * QRS_WIDTH_MAX))
+        qrs_complexes = []
+        for i in range(len(leads)):
+            # Get QRS boundaries for the lead from its precomputed slope information
+            qrs_complexes += qrs_boundaries(leads[i], frequency, derived=derivatives[i], squared=squared[i],
+                                            averaged=averaged[i])
 
     # Get consensus for qrs detections
-    threshold = QRS_CONSENSUS_THRESHOLD * len(leads)
-    consensus = build_consensus(qrs_complexes, threshold, refactory_period=QRS_REFRACTORY_PERIOD*frequency)
+    with stage("qrs_consensus"):
+        threshold = (QRS_CONSENSUS_THRESHOLD if threshold is None else threshold) * len(leads)
+        consensus = build_consensus(qrs_complexes, threshold, refactory_period=QRS_REFRACTORY_PERIOD*frequency)
 
     return consensus
 
 
-def determine_t_waves(leads, frequency, qrs):
+def determine_t_waves(leads, frequency, qrs, derivatives=None, threshold=None):
     """
     Multi-lead determination of T-wave end points.
-    Forms consensus for T-wave end-point using all available leads.
+    Forms consensus for T-wave end-point using all available leads, delineating the windows of every lead together.
     :param leads: List of samples representing each available lead
     :param frequency: Sampling frequency
-    :param qrs: List of tuples containing start and end index for QRS complexes
-    :return: List of tuples containing the consensus start and end index for each T-wave
+    :param qrs: List of tuples containing start and end index for QRS complexes, or BeatTable
+    :param derivatives: 2-D array of the derivative of each lead if already computed
+    :param threshold: Percent of leads for a consensus, default/None is T_WAVE_CONSENSUS_THRESHOLD
+    :return: List of tuples containing the consensus start and end index for each T-wave, or the BeatTable with its
+    T-waves set if given one
     """
 
-    # Array tracks the total number of leads that determined the index to be within a T-wave
-    t_waves = numpy.zeros(len(leads[0]))
-
-    # Get T-wave end points for each lead
-    for samples in leads:
-        boundaries = t_wave_boundaries(qrs, samples, frequency)
+    # Get slope information for all leads at once
+    if derivatives is None:
+        derivatives = derivative_filter(numpy.asarray(leads, dtype=float))
 
-        # Add each T-wave to the total
-        for t_wave in boundaries:
-            for i in range(t_wave[0], t_wave[-1] + 1):
-                t_waves[i] += 1
+    # Get T-wave end points for each lead, the search windows are the same for every lead
+    windows = t_wave_windows(qrs, frequency)
+    ends = t_wave_ends(derivatives, windows)
+    t_waves = [(start, end) for row in ends.tolist() for (start, _), end in zip(windows, row)]
 
     # Get boundary consensus
-    threshold = T_WAVE_CONSENSUS_THRESHOLD * len(leads)
+    threshold = (T_WAVE_CONSENSUS_THRESHOLD if threshold is None else threshold) * len(leads)
     consensus = build_consensus(t_waves, threshold)
 
+    if isinstance(qrs, BeatTable):
+        qrs.set_t_waves(consensus)
+        return qrs
+
     return consensus
 
 
 def build_consensus(boundaries, threshold, refactory_period=None):
     """
     Finds the boundary consensus points between available leads.
-    :param boundaries: Boundaries represented as intra-waveform occurrences at each index
-    :param threshold: Number of occurrences to be considered a consensus
+    Sweeps over the start and end points of the boundaries, so time and memory scale with the number of boundaries
+    rather than the number of samples.
+    :param boundaries: List of tuples containing the start and end index of every boundary determined by any lead
+    :param threshold: Number of overlapping boundaries to be considered a consensus
     :param refactory_period: Minimum samples between occurrences, where multiple consensuses within will be consolidated
     :return: List of tuples containing the consensus start and end indices
     """
 
-    con_start = None
-    con_end = None
-    consensus = []
-    for i in range(len(boundaries)):
+    if not boundaries:
+        return []
+
+    # Each boundary adds an occurrence from its start-point up to and including its end-point
+    starts = numpy.array([max(boundary[0], 0) for boundary in boundaries])
+    ends = numpy.array([boundary[-1] + 1 for boundary in boundaries])
+    points, first = numpy.unique(numpy.concatenate((starts, ends)), return_inverse=True)
+    changes = numpy.zeros(len(points), dtype=int)
+    numpy.add.at(changes, first, numpy.repeat([1, -1], len(boundaries)))
 
-        # Start recording boundaries if number of detections meet threshold
-        if boundaries[i] >= threshold:
-            if not con_start:
-                con_start = i
-            con_end = i
+    # Number of occurrences from each point until the next
+    occurrences = numpy.cumsum(changes)
 
-        # Record boundaries and reset for next
-        elif con_start and con_end:
+    # Consensus runs from the point occurrences reach the threshold until the point they drop below it
+    meets = numpy.concatenate(([False], occurrences >= threshold, [False]))
+    con_starts = points[numpy.flatnonzero(meets[1:] & ~meets[:-1])]
+    con_ends = points[numpy.flatnonzero(meets[:-1] & ~meets[1:])] - 1
+
+    # Consolidate any consensuses within the refactory period of the previous one if a refactory period is defined
+    consensus = []
+    for con_start, con_end in zip(con_starts.tolist(), con_ends.tolist()):
+        if refactory_period and consensus and consensus[-1][0] + refactory_period > con_start:
+            consensus[-1] = (consensus[-1][0], con_end)
+        else:
             consensus.append((con_start, con_end))
-            con_start = None
-            con_end = None
-
-    # Add last consensus if needed
-    if con_start and con_end:
-        consensus.append((con_start, con_end))
-
-    # Consolidate any gaps in the consensus if a refactory period is defined
-    if refactory_period:
-        consolidated = False
-        while not consolidated:
-            consolidated = True
-            for i in range(1, len(consensus)):
-                if consensus[i-1][0] + refactory_period > consensus[i][0]:
-                    consolidated = False
-                    new_qrs = (consensus[i-1][0], consensus[i][-1])
-                    consensus[i-1] = new_qrs
-                    consensus.pop(i)
-                    break
 
     return consensus
@@ -3,9 +3,12 @@ Author: Brody Taylor
 Date: Sept. 30, 2019
 """
 
+import math
 import numpy
 
 from dsp.dsp import *
+from ecg import BeatTable, NO_INDEX, P_WAVE, T_WAVE
+from instrument import count
 
 
 # Non-pathogenic physiological features (in seconds)
@@ -19,30 +22,44 @@ P_WAVE_WIDTH_MAX = 0.12  # widened P-wave duration defined as ≥0.12 second
 # Factor to determine if slopes are comparable for defining biphasic T-waves and P-waves
 BIPHASIC_FACTOR = 1.5
 
+# QRS detection thresholds
+BASE_CUTOFF_FACTOR = 0.8  # proportion of local slope max for detection cutoff
+LOWERED_CUTOFF_FACTOR = 0.5  # proportion of base detection cutoff to use for backtracking
+BACKTRACK_FACTOR = 1.8  # number of avg. inter-complex durations before initiating backtracking
 
-def qrs_boundaries(samples, frequency, do_filtering=False):
+# Number of T-wave search windows of all leads, and of P-wave search windows, delineated together
+T_WAVE_BLOCK = 4096
+P_WAVE_BLOCK = 4096
+
+
+def qrs_boundaries(samples, frequency, do_filtering=False, derived=None, squared=None, averaged=None):
     """
     Determines QRS complex boundaries in a waveform.
     :param samples: Array of waveform samples
     :param frequency: Sampling frequency
     :param do_filtering: Specifies if the provided samples need to be filtered
+    :param derived: Derivative of the filtered samples if already computed
+    :param squared: Squared derivative of the filtered samples if already computed
+    :param averaged: Moving window average of the squared derivative if already computed
     :return: List of tuples containing start and end index for each QRS complex
     """
 
-    # Filter samples if needed
-    filtered = samples
-    if do_filtering:
-        filtered = bandpass_filter(samples, frequency)
-
-    # Derives the waveform to get slope information
-    derived = derivative_filter(filtered)
+    # Filter samples if needed and derive the waveform to get slope information
+    if derived is None:
+        if do_filtering:
+            _, derived = bandpass_filter(samples, frequency, with_derivative=True)
+        else:
+            derived = derivative_filter(samples)
+    if squared is None:
+        squared = squaring(derived)
 
     # Gets list of detected QRS complexes
-    detections = qrs_detect(derived, frequency)
+    detections = qrs_detect(derived, frequency, squared=squared)
 
     # Moving window average
     window = int(frequency * QRS_WIDTH_MAX)
-    averaged = moving_average(squaring(derived), window)
+    if averaged is None:
+        averaged = moving_average(squared, window)
 
     # Omit first detection if too close to start for accurate end-point determination
     if detections[0] < window:
@@ -51,44 +68,55 @@ def qrs_boundaries(samples, frequency, do_filtering=False):
     # Determine boundaries for each detection
     boundaries = []
     for detection in detections:
+        boundaries.append(qrs_boundary(averaged, detection, frequency))
 
-        # End-point is defined as local peak of the moving window average
-        end_window = averaged[detection:detection+window]
-        local_max = max(end_window)
-        end = end_window.argmax()
+    return boundaries
 
-        # Get start-point of R-wave as first point less than 5% of local peak when backtracking
-        start_window = averaged[detection-window:detection]
-        local_min = min(start_window)
-        start_threshold = local_min + 0.05 * local_max
-        start = numpy.where(start_window < start_threshold)[0][-1]
 
-        # Get start-point of Q-wave by adjusting typical QR interval back from R-wave start
-        start -= int(frequency * QR_INTERVAL)
+def qrs_boundary(averaged, detection, frequency):
+    """
+    Determines the boundaries of a detected QRS complex.
+    :param averaged: Moving window average of the squared derivative
+    :param detection: Index where the complex was detected
+    :param frequency: Sampling frequency
+    :return: Tuple containing start and end index of the QRS complex
+    """
 
-        # Convert boundary indices from local to actual
-        end += detection
-        start += detection - window
+    window = int(frequency * QRS_WIDTH_MAX)
 
-        boundaries.append((start, end))
+    # End-point is defined as local peak of the moving window average
+    end_window = averaged[detection:detection+window]
+    local_max = end_window.max()
+    end = end_window.argmax()
 
-    return boundaries
+    # Get start-point of R-wave as first point less than 5% of local peak when backtracking
+    start_window = averaged[detection-window:detection]
+    local_min = start_window.min()
+    start_threshold = local_min + 0.05 * local_max
+    start = numpy.where(start_window < start_threshold)[0][-1]
+
+    # Get start-point of Q-wave by adjusting typical QR interval back from R-wave start
+    start -= int(frequency * QR_INTERVAL)
 
+    # Convert boundary indices from local to actual
+    end += detection
+    start += detection - window
 
-def qrs_detect(derivative, frequency):
+    return start, end
+
+
+def qrs_detect(derivative, frequency, squared=None):
     """
     Detects QRS complexes using slope information.
     :param derivative: The derivative of the waveform
     :param frequency: Sampling frequency
+    :param squared: Squared derivative if already computed
     :return: List of indices representing where a complex was detected
     """
 
-    BASE_CUTOFF_FACTOR = 0.8  # proportion of local slope max for detection cutoff
-    LOWERED_CUTOFF_FACTOR = 0.5  # proportion of base detection cutoff to use for backtracking
-    BACKTRACK_FACTOR = 1.8  # number of avg. inter-complex durations before initiating backtracking
-
     # Square slopes to non-linearly amplify QRS from other waves and to absolute the values
-    squared = squaring(derivative)
+    if squared is None:
+        squared = squaring(derivative)
 
     # Defines refractory period
     refract = int(frequency * QRS_REFRACTORY_PERIOD)
@@ -102,285 +130,469 @@ def qrs_detect(derivative, frequency):
     else:
         cutoff = BASE_CUTOFF_FACTOR * max(squared)
 
+    # Peaks are looked up from where the slopes rise and fall rather than climbed one sample at a time
+    edges = get_edges(squared)
+
     detections = []
-    num_samples = len(squared)
-    i = -1
-    while i < num_samples-1:
-        i += 1
-        found = False
-
-        # Indicate QRS if above cutoff
-        if squared[i] > cutoff:
-            found = True
-
-        # Initiate backtrack with lower threshold if too long without QRS
-        elif detections and i > detections[-1] + BACKTRACK_FACTOR*hr:
-            lower_cutoff = LOWERED_CUTOFF_FACTOR * cutoff
-            for j in range(detections[-1]+refract, i):
-                if squared[j] > lower_cutoff:
-                    i = j
-                    found = True
-                    break
-
-        if found:
-            peak = get_peak(squared, i)
-            detections.append(peak)
-
-            # Update average heart rate
-            if len(detections) > 1:
-                hr = heart_rate(detections)
-
-            # Update cutoff, weighted average between current and new
-            cutoff = 0.8 * cutoff + 0.2 * (0.8 * squared[peak])
-
-            # Skip the refractory period
-            i = peak
-            i += refract
+    i = 0
+    while (found := next_detection(squared, i, cutoff, hr, detections, frequency)) is not None:
+        peak = find_peak(squared, found, edges)
+        detections.append(peak)
+
+        # Update average heart rate
+        if len(detections) > 1:
+            hr = heart_rate(detections)
+
+        # Update cutoff, weighted average between current and new
+        cutoff = 0.8 * cutoff + 0.2 * (0.8 * squared[peak])
+
+        # Skip the refractory period
+        i = peak + refract + 1
 
     return detections
 
 
-def t_wave_boundaries(qrs, samples, frequency, do_filtering=False):
+def next_detection(squared, start, cutoff, hr, detections, frequency):
+    """
+    Finds the next point where a QRS complex is detected.
+    Only the cutoff crossing and the backtrack candidate are searched for, instead of stepping through each sample.
+    :param squared: Squared derivative of the waveform
+    :param start: Index to search from
+    :param cutoff: Detection cutoff
+    :param hr: Average heart rate (in samples between QRS complexes)
+    :param detections: List of previous detections
+    :param frequency: Sampling frequency
+    :return: Index of the detection, or None if there is no detection
+    """
+
+    # Indicate QRS at the first point above cutoff
+    found = first_above(squared, cutoff, start)
+
+    # Initiate backtrack with lower threshold if too long without QRS, from the first point past the backtrack delay
+    if detections:
+        backtrack = max(start, math.floor(detections[-1] + BACKTRACK_FACTOR*hr) + 1)
+        stop = len(squared) if found is None else found
+        if backtrack < stop:
+            # Backtracking finds the first point above the lowered cutoff after the refractory period, once the search
+            # has passed it
+            refract = int(frequency * QRS_REFRACTORY_PERIOD)
+            lowered = first_above(squared, LOWERED_CUTOFF_FACTOR * cutoff, max(detections[-1] + refract, 0), stop)
+            if lowered is not None and max(backtrack, lowered + 1) < stop:
+                found = lowered
+                count("qrs_backtracks")
+
+    return found
+
+
+def t_wave_boundaries(qrs, samples, frequency, do_filtering=False, windows=None, derived=None):
     """
     Determines T-wave boundaries when given QRS boundaries.
     :param qrs: List of QRS boundaries
     :param samples: Array of waveform samples
     :param frequency: Sampling frequency
     :param do_filtering: Specifies if the provided samples need to be noise-filtered
+    :param windows: List of T-wave search windows if already determined, default/None is from t_wave_windows
+    :param derived: Derivative of the (filtered) samples if already computed
     :return: List of tuples containing start and end index for T-waves
     """
 
-    t_waves = []
-    for window in t_wave_windows(qrs, frequency):
-        win_start, win_end = window
+    if windows is None:
+        windows = t_wave_windows(qrs, frequency)
 
-        # Filter samples
-        filtered = samples[win_start:win_end]
+    # Filter the whole lead once and derive it to get slope information, rather than each window on its own
+    if derived is None:
         if do_filtering:
-            filtered = bandpass_filter(filtered, frequency)
-
-        # Get slope information
-        derived = squaring(derivative_filter(filtered), signed=True)
-
-        up = derived.argmax()
-        down = derived.argmin()
-        peak_slope = max([abs(derived[up]), abs(derived[down])])
-
-        # Classify between biphasic and monophasic T-wave and get last slope peak
-        if up < down:
-            # Can be up-down, down-up, or up
-            end_peak = down
-            if abs(max(derived[down:])) * BIPHASIC_FACTOR > peak_slope:
-                # Adjust final slope peak if up-down
-                end_peak += derived[down:].argmax()
+            _, derived = bandpass_filter(samples, frequency, with_derivative=True)
         else:
-            # Can be down-up, up-down, or down
-            end_peak = up
-            if abs(min(derived[up:])) * BIPHASIC_FACTOR > peak_slope:
-                # Adjust final slope peak if down-up
-                end_peak += derived[up:].argmin()
+            derived = derivative_filter(samples)
+
+    ends = t_wave_ends(derived, windows)
+
+    return [(start, end) for (start, _), end in zip(windows, ends.tolist())]
 
-        # Define T-wave end-point forward from last slope peak until slope threshold
-        threshold = derived[end_peak] / 10
-        end = end_peak
-        for i in range(end_peak, len(derived)):
-            end = i
-            if threshold > 0:
-                if derived[i] < threshold:
-                    break
-            else:
-                if derived[i] > threshold:
-                    break
 
-        # Convert end-point index from local to actual
-        start = win_start
-        end += win_start
+def t_wave_ends(derived, windows):
+    """
+    Determines the T-wave end-points of every search window of every lead at once.
+    :param derived: Derivative of the waveform, or 2-D array with one row per lead
+    :param windows: List of tuples containing start and end index of each T-wave search window
+    :return: Array of end indices, one per window, or 2-D array with one row per lead
+    """
+
+    derived = numpy.asarray(derived, dtype=float)
+    leads = numpy.atleast_2d(derived)
+    starts = numpy.array([window[0] for window in windows], dtype=int)
+    lengths = numpy.array([window[1] - window[0] for window in windows], dtype=int)
 
-        t_waves.append((start, end))
+    # Windows are delineated in blocks, bounding the size of the padded window arrays
+    ends = numpy.empty((len(leads), len(windows)), dtype=int)
+    block = max(T_WAVE_BLOCK // len(leads), 1)
+    for first in range(0, len(windows), block):
+        chosen = slice(first, first + block)
+        ends[:, chosen] = t_wave_block(leads, starts[chosen], lengths[chosen]) + starts[chosen]
 
-    return t_waves
+    return ends[0] if derived.ndim == 1 else ends
+
+
+def t_wave_block(leads, starts, lengths):
+    """
+    Determines the T-wave end-points of a block of search windows.
+    Windows of every lead are gathered into one array padded to the longest window, one row per lead and window, and
+    the slope peaks, biphasic classification, and threshold crossings of all rows are found together.
+    :param leads: 2-D array of the derivative of each lead
+    :param starts: Array of the start index of each window
+    :param lengths: Array of the length of each window
+    :return: 2-D array of end indices from the start of each window, one row per lead
+    """
+
+    # Slopes within the derivative window of either window edge are the edge slope, as when each window is derived on
+    # its own, so the slope of the next wave past the window end is never seen
+    positions = numpy.arange(lengths.max())
+    inner = numpy.clip(positions, DERIVATIVE_WINDOW, numpy.maximum(lengths[:, None] - 1 - DERIVATIVE_WINDOW, 0))
+    indices = numpy.minimum(starts[:, None] + inner, leads.shape[-1] - 1)
+    derived = squaring(leads[:, indices], signed=True).reshape(-1, len(positions))
+    lengths = numpy.tile(lengths, len(leads))
+    valid = positions < lengths[:, None]
+    rows = numpy.arange(len(derived))
+
+    up = numpy.where(valid, derived, -numpy.inf).argmax(axis=1)
+    down = numpy.where(valid, derived, numpy.inf).argmin(axis=1)
+    peak_slope = numpy.maximum(abs(derived[rows, up]), abs(derived[rows, down]))
+
+    # Classify between biphasic and monophasic T-wave and get last slope peak
+    # Up before down can be up-down, down-up, or up, and down before up can be down-up, up-down, or down
+    rising = up < down
+    end_peak = numpy.where(rising, down, up)
+    after = valid & (positions >= end_peak[:, None])
+    last = numpy.where(rising, numpy.where(after, derived, -numpy.inf).argmax(axis=1),
+                       numpy.where(after, derived, numpy.inf).argmin(axis=1))
+
+    # Adjust final slope peak if up-down or down-up
+    biphasic = abs(derived[rows, last]) * BIPHASIC_FACTOR > peak_slope
+    end_peak = numpy.where(biphasic, last, end_peak)
+
+    # Define T-wave end-point forward from last slope peak until slope threshold, or the end of the window
+    threshold = derived[rows, end_peak][:, None] / 10
+    crossed = numpy.where(threshold > 0, derived < threshold, derived > threshold)
+    crossed &= valid & (positions >= end_peak[:, None])
+    ends = numpy.where(crossed.any(axis=1), crossed.argmax(axis=1), lengths - 1)
+
+    return ends.reshape(len(leads), len(starts))
 
 
 def t_wave_windows(qrs, frequency):
-    windows = []
-    for i in range(len(qrs) - 1):
-        # Define start of search window as QRS end-point plus ST interval
-        win_start = qrs[i][-1] + int(0.04 * frequency)  # ST interval can range from 5 to 150 ms
-
-        # Get average heart rate using previous 5 beats
-        if i >= 4:
-            hr = heart_rate([detection[0] for detection in qrs[i - 4:i + 1]])
-        else:  # Use following beats if not enough have occurred
-            if len(qrs) < 5:
-                hr = heart_rate([detection[0] for detection in qrs])
-            else:
-                hr = heart_rate([detection[0] for detection in qrs[:5]])
-
-        # Define end of search window as function of heart rate
-        length = qrs[i + 1][0] - qrs[i][-1]
-        if hr > 0.7 * frequency and length > int(0.5 * frequency):
-            win_end = qrs[i][-1] + int(0.5 * frequency)
-        elif length > int(0.7 * hr):
-            win_end = qrs[i][-1] + int(0.7 * hr)
-        else:
-            win_end = qrs[i][-1] + int(0.7 * length)
+    """
+    Defines the search windows for the T-waves between QRS complexes, as t_wave_window does for each, all at once.
+    :param qrs: List of QRS boundaries, or BeatTable
+    :param frequency: Sampling frequency
+    :return: List of tuples containing start and end index of each window, QRS complexes with no room for a T-wave
+    are skipped
+    """
+
+    onsets, ends = qrs_columns(qrs)
+    if len(onsets) < 2:
+        return []
+
+    # Get average heart rate using previous 5 beats, or the first 5 beats if not enough have occurred
+    beats = min(len(onsets), 5)
+    recent = sliding_window_view(onsets, beats)
+    rates = (recent.max(axis=1) - recent.min(axis=1)) / (beats - 1)
+    hr = rates[numpy.maximum(numpy.arange(len(onsets) - 1) - (beats - 1), 0)]
 
-        if win_end < win_start:  # TODO: wtf @twa52
-            continue
+    # Define start of search window as QRS end-point plus ST interval
+    ends = ends[:-1]
+    win_starts = ends + int(0.04 * frequency)
 
-        windows.append((win_start, win_end))
-    return windows
+    # Define end of search window as function of heart rate
+    length = onsets[1:] - ends
+    hr_length = (0.7 * hr).astype(int)
+    win_ends = numpy.where(length > hr_length, ends + hr_length, ends + (0.7 * length).astype(int))
+    win_ends = numpy.where((hr > 0.7 * frequency) & (length > int(0.5 * frequency)), ends + int(0.5 * frequency),
+                           win_ends)
 
+    kept = win_ends > win_starts
+    count("t_wave_windows_skipped", int(numpy.count_nonzero(~kept)))
 
-def p_wave_boundaries(qrs, t_waves, samples, frequency, do_filtering=False):
+    return list(zip(win_starts[kept].tolist(), win_ends[kept].tolist()))
+
+
+def t_wave_window(qrs, next_qrs, hr, frequency):
+    """
+    Defines the search window for the T-wave following a QRS complex.
+    :param qrs: QRS boundaries preceding the T-wave
+    :param next_qrs: QRS boundaries following the T-wave
+    :param hr: Average heart rate (in samples between QRS complexes)
+    :param frequency: Sampling frequency
+    :return: Tuple containing start and end index of the window, or None if there is no room for a T-wave
+    """
+
+    # Define start of search window as QRS end-point plus ST interval
+    win_start = qrs[-1] + int(0.04 * frequency)  # ST interval can range from 5 to 150 ms
+
+    # Define end of search window as function of heart rate
+    length = next_qrs[0] - qrs[-1]
+    if hr > 0.7 * frequency and length > int(0.5 * frequency):
+        win_end = qrs[-1] + int(0.5 * frequency)
+    elif length > int(0.7 * hr):
+        win_end = qrs[-1] + int(0.7 * hr)
+    else:
+        win_end = qrs[-1] + int(0.7 * length)
+
+    if win_end <= win_start:  # TODO: wtf @twa52
+        return None
+
+    return win_start, win_end
+
+
+def p_wave_boundaries(qrs, t_waves, samples, frequency, do_filtering=False, derived=None):
     """
     Determines P-wave boundaries when given QRS boundaries and T-wave end-points.
     :param samples: Array of waveform samples
     :param frequency: Sampling frequency
-    :param qrs: List of QRS boundaries
-    :param t_waves: List of T-wave boundaries
+    :param qrs: List of QRS boundaries, or BeatTable
+    :param t_waves: List of T-wave boundaries or array of T-wave end-points, default/None is the T-waves of the
+    BeatTable
     :param do_filtering: Specifies if the provided samples need to be filtered
-    :return: List of tuples containing P-wave start, inflection (if biphasic), and end indices
+    :param derived: Derivative of the filtered samples if already computed
+    :return: List of tuples containing P-wave start, inflection (if biphasic), and end indices, or the BeatTable with
+    its P-waves set if given one
     """
 
-    # Filter samples if needed
-    filtered = samples
-    if do_filtering:
-        filtered = bandpass_filter(samples, frequency)
-
-    # Derives the waveform to get slope information
-    derived = derivative_filter(filtered)
+    # Filter samples if needed and derive the waveform to get slope information
+    if derived is None:
+        if do_filtering:
+            _, derived = bandpass_filter(samples, frequency, with_derivative=True)
+        else:
+            derived = derivative_filter(samples)
+
+    if t_waves is None:
+        t_waves = qrs["t_end"][qrs.has(T_WAVE)] if isinstance(qrs, BeatTable) else []
+
+    onsets, offsets = qrs_columns(qrs)
+    onsets = onsets[1:]
+    offsets = offsets[1:]
+
+    # Get max slope of each associated QRS complex, padded so a complex can end at the last sample
+    qrs_slopes = numpy.empty(len(onsets))
+    if len(onsets):
+        slopes = numpy.append(numpy.abs(derived), 0)
+        qrs_slopes = numpy.maximum.reduceat(slopes, numpy.stack((onsets, offsets), axis=1).ravel())[::2]
+
+    # Define search windows from the max P-R interval until the start of each QRS complex
+    win_starts = onsets - int(frequency * PR_INTERVAL_MAX)
+    win_ends = onsets
+
+    # Adjust search windows that overlap with T-waves to start at the last T-wave end-point within them
+    if len(t_waves):
+        if not isinstance(t_waves, numpy.ndarray):
+            t_waves = [t_wave[-1] for t_wave in t_waves]
+        t_wave_ends = numpy.sort(t_waves)
+        last = t_wave_ends[numpy.maximum(numpy.searchsorted(t_wave_ends, win_ends) - 1, 0)]
+        win_starts = numpy.where((win_starts < last) & (last < win_ends), last, win_starts)
+    win_starts = numpy.maximum(win_starts, 0)
+
+    # Window width must be at least the minimum P-R interval
+    wide = numpy.flatnonzero(win_ends - win_starts >= frequency * PR_INTERVAL_MIN)
+    count("p_wave_windows_narrow", len(onsets) - len(wide))
+
+    # Windows are delineated in blocks, bounding the size of the padded window arrays
+    boundaries = numpy.empty((len(wide), 3), dtype=int)
+    found = numpy.empty(len(wide), dtype=bool)
+    for first in range(0, len(wide), P_WAVE_BLOCK):
+        chosen = wide[first:first + P_WAVE_BLOCK]
+        boundaries[first:first + P_WAVE_BLOCK], found[first:first + P_WAVE_BLOCK] = p_wave_block(
+            derived, win_starts[chosen], win_ends[chosen], qrs_slopes[chosen], frequency)
+
+    if isinstance(qrs, BeatTable):
+        qrs.set_p_waves(boundaries[found], rows=wide[found] + 1)
+        return qrs
 
     p_waves = []
-    for i in range(1, len(qrs)):
-
-        # Get max slope of associated QRS complex
-        qrs_slope = abs(max(derived[qrs[i][0]:qrs[i][-1]], key=abs))
-
-        # Define search window
-        win_start = qrs[i][0] - int(frequency * PR_INTERVAL_MAX)  # window starts at max P-R interval
-        win_end = qrs[i][0]  # window goes until start of QRS complex
-
-        # Adjust search window if it overlaps with T-wave
-        for t_wave in t_waves:
-            t_wave_end = t_wave[-1]
-            if win_start < t_wave_end < win_end:
-                win_start = t_wave_end
-
-        # Filter window and get slope information
-        if win_end - win_start < (frequency * PR_INTERVAL_MIN):  # window width must be at least the minimum P-R interval 
-            continue
-        win_derived = derived[win_start:win_end]
-
-        # P-wave said to be present if negative slope peak is greater than 3% of max qrs slope
-        neg_peak = numpy.argmin(win_derived)
-        if abs(win_derived[neg_peak]) > 0.03 * qrs_slope:
-            # Get forward and backward P-wave peaks if present
-            for_zero_indices = numpy.where(win_derived[neg_peak:] > 0)[0]
-            back_zero_indices = numpy.where(win_derived[:neg_peak] > 0)[0]
-            if len(for_zero_indices) > 0 and len(back_zero_indices) > 0:
-                for_zero = neg_peak + for_zero_indices[0]
-                back_zero = back_zero_indices[-1]
-            else:
-                continue
-
-            # Get forward and backward slope peaks
-            if (peak_win := back_zero - int(P_WAVE_WIDTH_MAX * frequency)) > 0:
-                back_peak = peak_win + win_derived[peak_win:back_zero].argmax()
-            else:
-                back_peak = win_derived[:back_zero].argmax()
-            if (peak_win := for_zero + int(P_WAVE_WIDTH_MAX * frequency)) < len(win_derived):
-                for_peak = for_zero + numpy.where(win_derived[for_zero:peak_win] == max(win_derived[for_zero:peak_win]))[0][-1]
-            else:
-                for_peak = for_zero + numpy.where(win_derived[for_zero:] == max(win_derived[for_zero:]))[0][-1]
-
-            # Define P-wave start-point
-            start = back_peak
-            start_threshold = win_derived[back_peak] / 1.35
-            for i in range(back_peak, -1, -1):
-                start = i
-                if win_derived[i] < start_threshold:
-                    break
-
-            # Define P-wave end-point and mid-point for biphasic classification
-            if win_derived[for_peak] * BIPHASIC_FACTOR > win_derived[back_peak]:
-                mid = neg_peak + win_start  # mid-point defined as the inflection between positive and negative wave
-                end_threshold = win_derived[for_peak] / 2
-                end = for_peak
-                for j in range(for_peak, len(win_derived)):
-                    end = j
-                    if win_derived[j] < end_threshold:
-                        break
-
-            # Define P-wave end-point if monophasic classification, no mid-point
-            else:
-                mid = None
-                end_threshold = win_derived[neg_peak] / 2
-                end = neg_peak
-                for j in range(neg_peak, len(win_derived)):
-                    end = j
-                    if win_derived[j] > end_threshold:
-                        break
-
-            # Convert start and end-point from local to actual
-            start += win_start
-            end += win_start
-
-            if mid:
-                p_waves.append((start, mid, end))
-            else:
-                p_waves.append((start, end))
+    for start, mid, end in boundaries[found].tolist():
+        if mid != NO_INDEX:
+            p_waves.append((start, mid, end))
+        else:
+            p_waves.append((start, end))
 
     return p_waves
 
 
+def p_wave_block(derived, win_starts, win_ends, qrs_slopes, frequency):
+    """
+    Determines the P-wave boundaries of a block of search windows.
+    Windows are gathered into one array padded to the longest window, one row per window, and the slope peaks, zero
+    crossings, and threshold crossings of all rows are found together.
+    :param derived: Derivative of the filtered samples
+    :param win_starts: Array of the start index of each window
+    :param win_ends: Array of the end index of each window
+    :param qrs_slopes: Array of the max absolute slope of the QRS complex following each window
+    :param frequency: Sampling frequency
+    :return: Tuple of the 2-D array of P-wave start, inflection (NO_INDEX if monophasic), and end indices of each
+    window, and the array of whether a P-wave was found in each window
+    """
+
+    lengths = win_ends - win_starts
+    positions = numpy.arange(lengths.max())
+    last = len(positions) - 1
+    valid = positions < lengths[:, None]
+    win_derived = derived[numpy.minimum(win_starts[:, None] + positions, len(derived) - 1)]
+    rows = numpy.arange(len(win_derived))
+
+    # P-wave said to be present if negative slope peak is greater than 3% of max qrs slope
+    neg_peak = numpy.where(valid, win_derived, numpy.inf).argmin(axis=1)
+    present = numpy.abs(win_derived[rows, neg_peak]) > 0.03 * qrs_slopes
+    count("p_wave_windows_flat", int(numpy.count_nonzero(~present)))
+
+    # Get forward and backward P-wave peaks if present, the first positive slope after and the last before the
+    # negative peak
+    positive = valid & (win_derived > 0)
+    forward = positive & (positions >= neg_peak[:, None])
+    backward = positive & (positions < neg_peak[:, None])
+    bounded = forward.any(axis=1) & backward.any(axis=1)
+    count("p_wave_windows_unbounded", int(numpy.count_nonzero(present & ~bounded)))
+    for_zero = forward.argmax(axis=1)
+    back_zero = last - backward[:, ::-1].argmax(axis=1)
+
+    # Get forward and backward slope peaks within a max P-wave width, the last forward peak if several are equal
+    width = int(P_WAVE_WIDTH_MAX * frequency)
+    back_window = (positions >= (back_zero - width)[:, None]) & (positions < back_zero[:, None])
+    back_peak = numpy.where(back_window, win_derived, -numpy.inf).argmax(axis=1)
+    for_window = valid & (positions >= for_zero[:, None]) & (positions < (for_zero + width)[:, None])
+    for_peak = last - numpy.where(for_window, win_derived, -numpy.inf)[:, ::-1].argmax(axis=1)
+
+    # Define P-wave start-point backward from the backward slope peak until slope threshold, or the window start
+    start_threshold = win_derived[rows, back_peak] / 1.35
+    below = (win_derived < start_threshold[:, None]) & (positions <= back_peak[:, None])
+    start = numpy.where(below.any(axis=1), last - below[:, ::-1].argmax(axis=1), 0)
+
+    # Define P-wave end-point forward from the forward slope peak if biphasic, or from the negative peak if monophasic,
+    # until slope threshold, or the window end
+    biphasic = win_derived[rows, for_peak] * BIPHASIC_FACTOR > win_derived[rows, back_peak]
+    end_peak = numpy.where(biphasic, for_peak, neg_peak)
+    end_threshold = (win_derived[rows, end_peak] / 2)[:, None]
+    crossed = numpy.where(biphasic[:, None], win_derived < end_threshold, win_derived > end_threshold)
+    crossed &= valid & (positions >= end_peak[:, None])
+    end = numpy.where(crossed.any(axis=1), crossed.argmax(axis=1), lengths - 1)
+
+    # Mid-point defined as the inflection between positive and negative wave, only if biphasic
+    mid = numpy.where(biphasic, neg_peak + win_starts, NO_INDEX)
+
+    # Convert start and end-point from local to actual
+    boundaries = numpy.stack((start + win_starts, mid, end + win_starts), axis=1)
+
+    return boundaries, present & bounded
+
+
 def pterm_measurements(samples, frequency, p_waves, do_filtering=False):
     """
     Calculates the P-terminal force when given P-wave boundaries.
     :param samples: Array of noise-filtered waveform samples
     :param frequency: Sampling frequency
-    :param p_waves: List of tuples containing P-wave start, inflection (if biphasic), and end indices
+    :param p_waves: List of tuples containing P-wave start, inflection (if biphasic), and end indices, or BeatTable
     :param do_filtering: Specifies if the provided samples need to be filtered
-    :return: List of P-terminal forces (in μV*mS) corresponding to provided P-waves
+    :return: List of P-terminal forces (in μV*mS) corresponding to provided P-waves, or the BeatTable with its
+    P-terminal force, depth, duration, and index of max depth set if given one
     """
 
     filtered = samples
     if do_filtering:
         filtered = bandpass_filter(samples, frequency)
 
-    measurements = []
-    for p_wave in p_waves:
-        # P-terminal force is 0 if P-wave is monophasic
-        if len(p_wave) < 3:
-            measurements.append(0)
-            continue
-
-        start, mid, end = p_wave
-
-        # Define duration as time between mid-point and end-point in mS
-        duration = 1000 * (end - mid) / frequency
-
-        # Create function for line connecting start-point and end-point
-        x1 = start
-        y1 = filtered[x1]
-        x2 = end
-        y2 = filtered[x2]
-        m = (y1-y2)/(x1-x2)
-        b = y1 - m * x1
-
-        # Define depth as max absolute amplitude in μV
-        depth = 0
-        for i in range(mid, end):
-            top = m * i + b
-            bottom = filtered[i]
-            if top - bottom > depth:
-                depth = top - bottom
-        depth = depth * 1000
-
-        # P-terminal force is equal to the depth multiplied by the duration
-        measurements.append(depth * duration)
-
-    return measurements
+    measurements = measure_p_terminal_force(filtered, p_waves, frequency)
+    if isinstance(p_waves, BeatTable):
+        p_waves.set_p_terminal_force(*measurements)
+        return p_waves
+
+    return measurements[0].tolist()
+
+
+def measure_p_terminal_force(filtered, p_waves, frequency):
+    """
+    Measures the P-terminal force of every P-wave at once.
+    Depth is the max height of the line connecting the P-wave start-point and end-point above the samples from the
+    mid-point to the end-point. The terminal segments of all P-waves are concatenated, and the height of each segment
+    is reduced with maximum.reduceat.
+    :param filtered: Array of noise-filtered waveform samples
+    :param p_waves: 2-D array of P-wave start, mid-point, and end indices as returned by p_wave_array, list of tuples
+    containing P-wave start, inflection (if biphasic), and end indices, or BeatTable
+    :param frequency: Sampling frequency
+    :return: Tuple of arrays of the P-terminal force (in μV*mS), depth (in μV), duration (in mS), and index of max
+    depth (NO_INDEX if monophasic) of each P-wave
+    """
+
+    boundaries = p_wave_array(p_waves)
+    starts, mids, ends = boundaries.T
+
+    # P-terminal force is 0 if P-wave is monophasic, which has no terminal segment
+    biphasic = mids != NO_INDEX
+    lengths = numpy.where(biphasic, numpy.maximum(ends - mids, 0), 0)
+
+    # Define duration as time between mid-point and end-point in mS
+    duration = numpy.where(biphasic, 1000 * (ends - mids) / frequency, 0.0)
+
+    # Create line connecting start-point and end-point of each P-wave
+    y1 = filtered[starts]
+    y2 = filtered[ends]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        m = (y1 - y2) / (starts - ends)
+    b = y1 - m * starts
+
+    # Height of the line above the samples at every index of the concatenated terminal segments
+    segments = numpy.repeat(numpy.arange(len(boundaries)), lengths)
+    firsts = numpy.cumsum(lengths) - lengths
+    indices = numpy.arange(lengths.sum()) - firsts[segments] + mids[segments]
+    heights = m[segments] * indices + b[segments] - filtered[indices]
+
+    # Define depth as max absolute amplitude in μV, and its index as the first index of the max height
+    depth = numpy.zeros(len(boundaries))
+    deepest = numpy.full(len(boundaries), NO_INDEX)
+    measured = lengths > 0
+    if measured.any():
+        peaks = numpy.maximum.reduceat(heights, firsts[measured])
+        depth[measured] = numpy.maximum(peaks, 0) * 1000
+        at_peak = numpy.flatnonzero(heights == numpy.repeat(peaks, lengths[measured]))
+        _, first_at_peak = numpy.unique(segments[at_peak], return_index=True)
+        deepest[measured] = indices[at_peak[first_at_peak]]
+
+    # P-terminal force is equal to the depth multiplied by the duration
+    return depth * duration, depth, duration, deepest
+
+
+def p_wave_array(p_waves):
+    """
+    Converts P-wave boundaries to an array with a column each for the start, mid-point, and end indices.
+    :param p_waves: List of tuples containing P-wave start, inflection (if biphasic), and end indices, 2-D array, or
+    BeatTable, of which the beats with a P-wave are converted
+    :return: 2-D array of P-wave start, mid-point (NO_INDEX if monophasic), and end indices
+    """
+
+    if isinstance(p_waves, BeatTable):
+        beats = p_waves[p_waves.has(P_WAVE)]
+        return numpy.stack((beats["p_on"], beats["p_mid"], beats["p_off"]), axis=1).astype(int)
+    if isinstance(p_waves, numpy.ndarray):
+        return p_waves.reshape(-1, 3).astype(int, copy=False)
+
+    boundaries = numpy.empty((len(p_waves), 3), dtype=int)
+    for i, p_wave in enumerate(p_waves):
+        boundaries[i] = (p_wave[0], p_wave[1] if len(p_wave) > 2 else NO_INDEX, p_wave[-1])
+
+    return boundaries
+
+
+def qrs_columns(qrs):
+    """
+    Gets the onsets and end-points of QRS complexes as arrays.
+    :param qrs: List of QRS boundaries, or BeatTable
+    :return: Tuple of the array of start indices and the array of end indices
+    """
+
+    if isinstance(qrs, BeatTable):
+        return qrs["qrs_on"].astype(int), qrs["qrs_off"].astype(int)
+
+    onsets = numpy.array([boundary[0] for boundary in qrs], dtype=int)
+    ends = numpy.array([boundary[-1] for boundary in qrs], dtype=int)
+
+    return onsets, ends
 
 
 def heart_rate(detections):
@@ -0,0 +1,306 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+from collections import deque, namedtuple
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .dsp import DERIVATIVE_WINDOW, HIGHPASS_CUTOFF, SAVGOL_ORDER, SAVGOL_WINDOW, find_peak, get_edges, moving_average
+from .singlelead import *
+
+
+# Beat reported by the stream analyzer, boundaries are sample indices from the start of the stream
+Beat = namedtuple("Beat", ["qrs", "t_wave", "p_wave", "p_terminal_force"])
+
+# Maximum seconds of processed samples kept, bounds memory when beats stop being detected
+MAX_CONTEXT = 10
+
+# Length of the high-pass filter in periods of its cutoff frequency, adds half as many periods of latency
+HIGHPASS_PERIODS = 2
+
+
+class StreamAnalyzer:
+    """
+    Analyzes a single lead as it arrives in chunks of samples.
+    Filter, detector, and heart rate state is carried between chunks, and each beat is reported as soon as the samples
+    it depends on have arrived, so the latency of each beat and the memory used are bounded.
+    Filtering is done with a linear-phase filter that approximates the forward-backward filtering of a whole
+    recording, delaying analysis by the filter length, so boundaries can differ slightly from offline analysis.
+    """
+
+    def __init__(self, frequency, max_context=MAX_CONTEXT):
+        """
+        :param frequency: Sampling frequency
+        :param max_context: Maximum seconds of processed samples kept
+        """
+
+        import scipy.signal as signal
+
+        self._frequency = frequency
+        self._max_context = int(max_context * frequency)
+        self._width = int(frequency * QRS_WIDTH_MAX)
+        self._refract = int(frequency * QRS_REFRACTORY_PERIOD)
+
+        # Band-pass filter as a single linear-phase FIR, combining the Savitzky–Golay filter with a high-pass filter
+        # matching the response of the forward-backward Butterworth filter
+        sos = signal.butter(1, HIGHPASS_CUTOFF / (0.5 * frequency), analog=False, btype='highpass', output='sos')
+        frequencies = numpy.linspace(0, 0.5 * frequency, 2049)
+        _, response = signal.sosfreqz(sos, worN=frequencies, fs=frequency)
+        num_taps = int(HIGHPASS_PERIODS * frequency / HIGHPASS_CUTOFF) | 1
+        highpass = signal.firwin2(num_taps, frequencies, numpy.abs(response) ** 2, fs=frequency)
+        self._fir = numpy.convolve(signal.savgol_coeffs(SAVGOL_WINDOW, SAVGOL_ORDER), highpass)
+
+        # Raw samples overlapping the next chunk
+        self._raw_tail = None
+
+        # Filtered samples overlapping the next chunk for the derivative
+        self._filtered_tail = numpy.empty(0)
+        self._derivative_started = False
+
+        # Processed samples, where index 0 is sample number offset of the stream
+        self._offset = 0
+        self._filtered = numpy.empty(0)
+        self._derived = numpy.empty(0)
+        self._squared = numpy.empty(0)
+
+        # QRS detector state
+        self._cutoff = None
+        self._hr = (50/60) * frequency
+        self._search = 0
+        self._first_detection = None
+        self._last_detection = None
+        self._num_detections = 0
+        self._pending = deque()  # detections waiting on samples to determine their boundaries
+
+        # Beat state, QRS boundaries of unfinished beats and the 4 before them are kept with their beat number
+        self._qrs = deque()
+        self._first_onsets = []
+        self._num_qrs = 0
+        self._next_beat = 0
+        self._previous_t_wave = None
+
+    def push(self, chunk):
+        """
+        Analyzes the next chunk of samples.
+        :param chunk: Array of samples following the previously pushed samples
+        :return: List of Beat for each beat finished by the chunk
+        """
+
+        chunk = numpy.asarray(chunk, dtype=float)
+        if len(chunk) == 0:
+            return []
+
+        self._process(chunk)
+        return self._analyze()
+
+    def finish(self):
+        """
+        Analyzes the remaining samples at the end of the stream.
+        :return: List of Beat for each remaining beat, the last beat has no T-wave
+        """
+
+        self._process(None)
+        return self._analyze(final=True)
+
+    def _process(self, chunk):
+        """ Filters and derives a chunk, continuing from the state of the previous chunk """
+
+        final = chunk is None
+        half = len(self._fir) // 2
+
+        # Band-pass filter, the stream is extended by its first and last sample as with mode 'nearest'
+        if self._raw_tail is None:
+            if final:
+                return
+            self._raw_tail = numpy.full(half, chunk[0])
+        raw = self._raw_tail if final else numpy.concatenate((self._raw_tail, chunk))
+        if final:
+            raw = numpy.concatenate((raw, numpy.full(half, raw[-1])))
+        filtered = numpy.convolve(raw, self._fir, mode='valid') if len(raw) > 2 * half else numpy.empty(0)
+        self._raw_tail = raw[len(raw) - min(len(raw), 2 * half):]
+
+        # Derivative, extrapolated over the sample delay at the start and end of the stream
+        window = DERIVATIVE_WINDOW
+        weights = numpy.arange(-window, window + 1, dtype=float)
+        overlap = numpy.concatenate((self._filtered_tail, filtered))
+        derived = numpy.empty(0)
+        if len(overlap) > 2 * window:
+            derived = sliding_window_view(overlap, 2 * window + 1) @ weights / numpy.dot(weights, weights)
+            self._filtered_tail = overlap[-2 * window:]
+            if not self._derivative_started:
+                derived = numpy.concatenate((numpy.full(window, derived[0]), derived))
+                self._derivative_started = True
+        else:
+            self._filtered_tail = overlap
+        if final and len(self._derived) + len(derived):
+            last = derived[-1] if len(derived) else self._derived[-1]
+            derived = numpy.concatenate((derived, numpy.full(window, last)))
+
+        self._filtered = numpy.concatenate((self._filtered, filtered))
+        self._derived = numpy.concatenate((self._derived, derived))
+        self._squared = numpy.concatenate((self._squared, squaring(derived)))
+
+    def _analyze(self, final=False):
+        """ Detects QRS complexes and reports finished beats from the processed samples """
+
+        self._detect(final)
+        self._determine_qrs(final)
+        beats = self._finish_beats(final)
+        self._trim()
+
+        return beats
+
+    def _detect(self, final):
+        """ Continues QRS detection over the processed samples, as done by qrs_detect """
+
+        squared = self._squared
+        frequency = self._frequency
+        offset = self._offset
+
+        # Get base cutoff from a 2-second max
+        if self._cutoff is None:
+            if int(2 * frequency) < len(squared):
+                self._cutoff = BASE_CUTOFF_FACTOR * squared[:int(2 * frequency)].max()
+            elif final and len(squared):
+                self._cutoff = BASE_CUTOFF_FACTOR * squared.max()
+            else:
+                return
+
+        edges = get_edges(squared)
+        while True:
+            detections = [] if self._last_detection is None else [self._last_detection - offset]
+            found = next_detection(squared, max(self._search - offset, 0), self._cutoff, self._hr, detections,
+                                   frequency)
+            if found is None:
+                break
+
+            # Wait for the rest of the rising edge if it reaches the newest sample
+            peak = find_peak(squared, found, edges)
+            if peak == len(squared) - 1 and not final:
+                break
+
+            detection = offset + peak
+            self._num_detections += 1
+            if self._first_detection is None:
+                self._first_detection = detection
+            self._last_detection = detection
+
+            # Update average heart rate
+            if self._num_detections > 1:
+                self._hr = (detection - self._first_detection) / (self._num_detections - 1)
+
+            # Update cutoff, weighted average between current and new
+            self._cutoff = 0.8 * self._cutoff + 0.2 * (0.8 * squared[peak])
+
+            # Skip the refractory period
+            self._search = detection + self._refract + 1
+
+            # Omit first detection if too close to start for accurate end-point determination
+            if self._num_detections > 1 or detection >= self._width:
+                self._pending.append(detection)
+
+    def _determine_qrs(self, final):
+        """ Determines the boundaries of detections once the samples following them have arrived """
+
+        averaged = None
+        while self._pending:
+            detection = self._pending[0] - self._offset
+            if detection + self._width > len(self._squared) and not final:
+                break
+            self._pending.popleft()
+
+            # Skip a detection whose preceding samples are no longer kept
+            if detection < self._width and self._offset > 0:
+                continue
+
+            if averaged is None:
+                averaged = moving_average(self._squared, self._width)
+            start, end = qrs_boundary(averaged, detection, self._frequency)
+            qrs = (int(start) + self._offset, int(end) + self._offset)
+
+            self._qrs.append((self._num_qrs, qrs))
+            if len(self._first_onsets) < 5:
+                self._first_onsets.append(qrs[0])
+            self._num_qrs += 1
+
+    def _finish_beats(self, final):
+        """ Determines the T-wave, P-wave, and P-terminal force of beats whose following QRS complex is known """
+
+        frequency = self._frequency
+        offset = self._offset
+
+        beats = []
+        while self._next_beat < self._num_qrs - 1 or (final and self._next_beat < self._num_qrs):
+            beat = self._next_beat
+
+            # First beats use the heart rate of the first 5 beats
+            if beat < 4 and len(self._first_onsets) < 5 and not final:
+                break
+
+            first = self._qrs[0][0]
+            qrs = self._qrs[beat - first][1]
+
+            # Define T-wave from search window between the QRS complex and the next
+            t_wave = None
+            if beat + 1 < self._num_qrs:
+                if beat >= 4:
+                    hr = heart_rate([boundary[0] for _, boundary in list(self._qrs)[beat - 4 - first:beat + 1 - first]])
+                else:
+                    hr = heart_rate(self._first_onsets)
+                window = t_wave_window(qrs, self._qrs[beat + 1 - first][1], hr, frequency)
+                if window is not None and window[0] >= offset and window[1] - window[0] > 2 * DERIVATIVE_WINDOW:
+                    local = [(window[0] - offset, window[1] - offset)]
+                    start, end = t_wave_boundaries(None, self._filtered, frequency, windows=local,
+                                                    derived=self._derived)[0]
+                    t_wave = (int(start) + offset, int(end) + offset)
+
+            # Define P-wave from search window between the previous T-wave and the QRS complex
+            p_wave = None
+            p_terminal_force = None
+            if beat > 0 and qrs[0] - int(frequency * PR_INTERVAL_MAX) >= offset:
+                local_qrs = [(start - offset, end - offset) for start, end in (self._qrs[beat - 1 - first][1], qrs)]
+                local_t_waves = []
+                if self._previous_t_wave is not None:
+                    local_t_waves.append(tuple(index - offset for index in self._previous_t_wave))
+                p_waves = p_wave_boundaries(local_qrs, local_t_waves, None, frequency, derived=self._derived)
+                if p_waves:
+                    p_wave = tuple(int(index) + offset for index in p_waves[0])
+                    p_terminal_force = pterm_measurements(self._filtered, frequency, p_waves)[0]
+
+            beats.append(Beat(qrs, t_wave, p_wave, p_terminal_force))
+            self._previous_t_wave = t_wave
+            self._next_beat += 1
+
+            # Discard QRS boundaries no longer needed for the heart rate
+            while self._qrs[0][0] < self._next_beat - 4:
+                self._qrs.popleft()
+
+        return beats
+
+    def _trim(self):
+        """ Discards processed samples that no detection or unfinished beat depends on """
+
+        end = self._offset + len(self._derived)
+        keep = end
+        if self._cutoff is None:
+            keep = self._offset
+        keep = min(keep, self._search)
+        if self._last_detection is not None:
+            keep = min(keep, self._last_detection + self._refract)
+        for detection in self._pending:
+            keep = min(keep, detection - 2 * self._width)
+        if self._next_beat < self._num_qrs:
+            qrs_start = self._qrs[self._next_beat - self._qrs[0][0]][1][0]
+            keep = min(keep, qrs_start - int(self._frequency * PR_INTERVAL_MAX))
+
+        # Keep a margin for peaks found left of the search point, up to the maximum context
+        keep = max(keep - self._width, end - self._max_context)
+        if keep > self._offset:
+            drop = keep - self._offset
+            self._filtered = self._filtered[drop:].copy()
+            self._derived = self._derived[drop:].copy()
+            self._squared = self._squared[drop:].copy()
+            self._offset = keep
@@ -1 +1,2 @@
-from .ecg import ECG, Lead
\ No newline at end of file
+from .ecg import ECG, Lead
+from .beattable import BEAT_DTYPE, BIPHASIC, NO_INDEX, P_WAVE, T_WAVE, BeatTable
@@ -0,0 +1,202 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import numpy
+
+
+# Columns of each beat, the QRS complex, the T-wave following it, and the P-wave preceding it with the depth (in μV),
+# duration (in mS), and index of max depth of its terminal segment
+BEAT_DTYPE = numpy.dtype([
+    ("qrs_on", "<i4"),
+    ("qrs_off", "<i4"),
+    ("t_on", "<i4"),
+    ("t_end", "<i4"),
+    ("p_on", "<i4"),
+    ("p_mid", "<i4"),
+    ("p_off", "<i4"),
+    ("ptf", "<f4"),
+    ("p_depth", "<f4"),
+    ("p_duration", "<f4"),
+    ("p_deepest", "<i4"),
+    ("flags", "u1"),
+])
+
+# Index of a boundary the beat does not have, such as the mid-point of a monophasic P-wave
+NO_INDEX = -1
+
+# Bits of the flags column
+T_WAVE = 1
+P_WAVE = 2
+BIPHASIC = 4
+
+
+class BeatTable:
+    """
+    Boundaries and measurements of an ECG, one row per QRS complex in a structured array ordered by QRS onset.
+    Slicing a table by position or time gives a table sharing the rows of the original.
+    """
+
+    __slots__ = ("_beats",)
+
+    def __init__(self, beats=None):
+        """
+        :param beats: Structured array of BEAT_DTYPE, or number of empty beats, default/None is no beats
+        """
+
+        if beats is None or isinstance(beats, int):
+            beats = numpy.zeros(beats or 0, dtype=BEAT_DTYPE)
+            beats[["t_on", "t_end", "p_on", "p_mid", "p_off", "p_deepest"]] = NO_INDEX
+        elif beats.dtype != BEAT_DTYPE:
+            raise TypeError('beats must be an array of BEAT_DTYPE')
+        self._beats = beats
+
+    @classmethod
+    def from_boundaries(cls, qrs, t_waves=(), p_waves=(), p_terminal_force=None):
+        """
+        Builds a table from lists of boundaries.
+        :param qrs: List of tuples containing start and end index for QRS complexes, ordered by start
+        :param t_waves: List of tuples containing start and end index for T-waves
+        :param p_waves: List of tuples containing P-wave start, inflection (if biphasic), and end indices
+        :param p_terminal_force: List of P-terminal forces corresponding to the P-waves, default/None is 0 for each
+        :return: BeatTable object
+        """
+
+        table = cls(len(qrs))
+        if len(qrs):
+            table._beats["qrs_on"] = [boundary[0] for boundary in qrs]
+            table._beats["qrs_off"] = [boundary[-1] for boundary in qrs]
+        table.set_t_waves(t_waves)
+        table.set_p_waves(p_waves, p_terminal_force)
+
+        return table
+
+    def set_t_waves(self, t_waves):
+        """
+        Sets the T-waves of the beats, each following the QRS complex with the last onset at or before its start.
+        A T-wave before the first QRS complex is dropped, and a later T-wave replaces an earlier one of the same beat.
+        :param t_waves: List of tuples containing start and end index for T-waves, or 2-D array
+        """
+
+        beats = self._beats
+        beats[["t_on", "t_end"]] = NO_INDEX
+        beats["flags"] &= ~numpy.uint8(T_WAVE)
+        if not len(t_waves):
+            return
+
+        t_waves = numpy.asarray([(t_wave[0], t_wave[-1]) for t_wave in t_waves], dtype=int).reshape(-1, 2)
+        rows = numpy.searchsorted(beats["qrs_on"], t_waves[:, 0], side='right') - 1
+        kept = rows >= 0
+        rows = rows[kept]
+        beats["t_on"][rows] = t_waves[kept, 0]
+        beats["t_end"][rows] = t_waves[kept, 1]
+        beats["flags"][rows] |= T_WAVE
+
+    def set_p_waves(self, p_waves, p_terminal_force=None, rows=None):
+        """
+        Sets the P-waves of the beats, each preceding the QRS complex with the first onset at or after its end.
+        A P-wave after the last QRS complex is dropped, and a later P-wave replaces an earlier one of the same beat.
+        :param p_waves: List of tuples containing P-wave start, inflection (if biphasic), and end indices, or 2-D array
+        of start, mid-point (NO_INDEX if monophasic), and end indices
+        :param p_terminal_force: Array of P-terminal forces corresponding to the P-waves, default/None is 0 for each
+        :param rows: Array of the position of the beat of each P-wave, default/None is found from the QRS onsets
+        """
+
+        beats = self._beats
+        beats[["p_on", "p_mid", "p_off", "p_deepest"]] = NO_INDEX
+        beats[["ptf", "p_depth", "p_duration"]] = 0
+        beats["flags"] &= ~numpy.uint8(P_WAVE | BIPHASIC)
+        if not len(p_waves):
+            return
+
+        if not isinstance(p_waves, numpy.ndarray):
+            p_waves = [(p_wave[0], p_wave[1] if len(p_wave) > 2 else NO_INDEX, p_wave[-1]) for p_wave in p_waves]
+        p_waves = numpy.asarray(p_waves, dtype=int).reshape(-1, 3)
+        if rows is None:
+            rows = numpy.searchsorted(beats["qrs_on"], p_waves[:, 2], side='left')
+        kept = rows < len(beats)
+        rows = rows[kept]
+        p_waves = p_waves[kept]
+        beats["p_on"][rows] = p_waves[:, 0]
+        beats["p_mid"][rows] = p_waves[:, 1]
+        beats["p_off"][rows] = p_waves[:, 2]
+        beats["flags"][rows] |= numpy.where(p_waves[:, 1] != NO_INDEX, P_WAVE | BIPHASIC, P_WAVE).astype(numpy.uint8)
+        if p_terminal_force is not None:
+            beats["ptf"][rows] = numpy.asarray(p_terminal_force, dtype=float)[kept]
+
+    def set_p_terminal_force(self, p_terminal_force, depth=None, duration=None, deepest=None):
+        """
+        Sets the P-terminal force of the beats with a P-wave, and the measurements it is the product of.
+        :param p_terminal_force: Array of P-terminal forces, one for each beat with a P-wave in order
+        :param depth: Array of terminal segment depths (in μV), default/None is unchanged
+        :param duration: Array of terminal segment durations (in mS), default/None is unchanged
+        :param deepest: Array of the index of max depth (NO_INDEX if monophasic), default/None is unchanged
+        """
+
+        rows = self.has(P_WAVE)
+        for column, values in (("ptf", p_terminal_force), ("p_depth", depth), ("p_duration", duration),
+                               ("p_deepest", deepest)):
+            if values is not None:
+                self._beats[column][rows] = values
+
+    def get_qrs_complexes(self):
+        return list(zip(self._beats["qrs_on"].tolist(), self._beats["qrs_off"].tolist()))
+
+    def get_t_waves(self):
+        beats = self._beats[self.has(T_WAVE)]
+        return list(zip(beats["t_on"].tolist(), beats["t_end"].tolist()))
+
+    def get_p_waves(self):
+        p_waves = []
+        for start, mid, end in self._beats[["p_on", "p_mid", "p_off"]][self.has(P_WAVE)].tolist():
+            p_waves.append((start, end) if mid == NO_INDEX else (start, mid, end))
+        return p_waves
+
+    def get_p_terminal_force(self):
+        return self._beats["ptf"][self.has(P_WAVE)].tolist()
+
+    def get_p_deepest(self):
+        return self._beats["p_deepest"][self.has(P_WAVE)].tolist()
+
+    def get_array(self):
+        return self._beats
+
+    def has(self, flag):
+        """
+        Finds the beats with a flag set.
+        :param flag: Flag bit, T_WAVE, P_WAVE, or BIPHASIC
+        :return: Boolean array, one for each beat
+        """
+
+        return self._beats["flags"] & flag != 0
+
+    def between(self, start, stop):
+        """
+        Gets the beats with a QRS onset between two indices, sharing the rows of this table.
+        :param start: Index of the first sample of the range
+        :param stop: Index after the last sample of the range
+        :return: BeatTable object
+        """
+
+        onsets = self._beats["qrs_on"]
+        first, last = numpy.searchsorted(onsets, [start, stop], side='left')
+        return BeatTable(self._beats[first:last])
+
+    def __getitem__(self, key):
+        """
+        Gets a column by name, a beat by position, or a table of the beats selected by a slice or mask.
+        Columns and slices share the rows of this table, masks and lists of positions copy them.
+        """
+
+        if isinstance(key, str):
+            return self._beats[key]
+        if isinstance(key, (int, numpy.integer)):
+            return self._beats[key]
+        return BeatTable(self._beats[key])
+
+    def __len__(self):
+        return len(self._beats)
+
+    def __iter__(self):
+        return iter(self._beats)
@@ -5,72 +5,340 @@ Date: Sept. 30, 2019
 
 from enum import Enum
 
+import numpy
+
+from .beattable import BeatTable
+
 
 class ECG:
     def __init__(self, frequency):
         self._frequency = frequency
 
-        # Initialize dict of leads and associated samples
-        self._leads = {}
+        # Initialize matrix of samples with one row per lead, and map of each lead to its row
+        self._samples = numpy.empty((0, 0))
+        self._lead_index = {}
+
+        # Amplitude in mV of one unit of the sample matrix, None when samples are stored in mV
+        self._scale = None
 
-        # Initialize lists of waveform boundaries
+        # Initialize dict of processed samples, keyed by lead and processing stage
+        self._processed = {}
+
+        # Initialize lists of waveform boundaries, or a table of them with lists converted from it when first needed
         self._qrsComplexes = []
         self._t_waves = []
         self._p_waves = []
+        self._p_terminal_force = []
+        self._beats = None
 
     def get_all_leads(self):
-        return list(self._leads.values())
+        return self._get_samples()
+
+    def get_lead_matrix(self):
+        """
+        Gets the samples of all leads, one row per lead in the order given by get_available_leads.
+        :return: Contiguous 2-D array of samples
+        """
+
+        return self._get_samples()
+
+    def get_raw_matrix(self):
+        """
+        Gets the sample matrix as stored, without converting stored units to mV.
+        :return: Tuple of the 2-D array of samples and the mV of one unit, or None if the samples are in mV
+        """
+
+        return self._samples, self._scale
+
+    def set_lead_matrix(self, leads, samples, scale=None):
+        """
+        Sets the samples of all leads from a matrix, without copying it.
+        :param leads: List of Lead enums, one for each row of the matrix
+        :param samples: 2-D array of samples, one row per lead, such as a memory-mapped file
+        :param scale: mV of one unit of the samples, default/None is samples in mV, scaled samples are converted to mV
+        when first accessed, except by get_window
+        """
+
+        # Validate leads
+        if not all(isinstance(lead, Lead) for lead in leads):
+            raise TypeError('leads must be instances of Lead')
+        if len(leads) != len(samples):
+            raise ValueError('{} leads given for {} rows of samples'.format(len(leads), len(samples)))
+
+        self._samples = samples
+        self._scale = scale
+        self._lead_index = {lead: i for i, lead in enumerate(leads)}
+        self._processed.clear()
+
+    def set_lead(self, lead, samples, pad=False):
+        """
+        Sets the samples of a lead.
+        All leads share a single sample matrix, so they must be of equal length.
+        :param lead: Lead enum
+        :param samples: Array of samples
+        :param pad: Pads the shorter of the new lead or the existing leads by repeating their last sample when lengths
+        differ, default is false and raises ValueError
+        """
 
-    def set_lead(self, lead, samples):
         # Validate lead
         if not isinstance(lead, Lead):
             raise TypeError('lead must be an instance of Lead')
 
-        self._leads[lead] = samples
+        samples = numpy.asarray(samples, dtype=float)
+        num_leads, num_samples = self._get_samples().shape
+        if num_leads and len(samples) != num_samples:
+            if not pad:
+                raise ValueError('lead has {} samples, expected {}'.format(len(samples), num_samples))
+            if len(samples) < num_samples:
+                samples = numpy.pad(samples, (0, num_samples - len(samples)), mode='edge')
+            else:
+                self._samples = numpy.pad(self._samples, ((0, 0), (0, len(samples) - num_samples)), mode='edge')
+                self._processed.clear()
+
+        # Overwrite row of existing lead, or grow the matrix by a row for a new lead
+        if lead in self._lead_index:
+            self._samples[self._lead_index[lead]] = samples
+        else:
+            matrix = numpy.empty((num_leads + 1, len(samples)))
+            if num_leads:
+                matrix[:num_leads] = self._samples
+            matrix[num_leads] = samples
+            self._samples = matrix
+            self._lead_index[lead] = num_leads
+
+        # Processed samples of the previous lead samples are no longer valid
+        for key in [key for key in self._processed if key[0] in (lead, None)]:
+            del self._processed[key]
 
     def get_lead(self, lead):
+        """
+        Gets the samples of a lead.
+        :param lead: Lead enum
+        :return: Array of samples, a view of the lead's row in the sample matrix, or None if lead is not available
+        """
+
         # Validate lead
         if not isinstance(lead, Lead):
             raise TypeError('lead must be an instance of Lead')
 
-        if lead in self._leads:
-            return self._leads[lead]
+        if lead in self._lead_index:
+            return self._get_samples()[self._lead_index[lead]]
+
+    def get_available_leads(self):
+        return list(self._lead_index.keys())
+
+    def get_window(self, start, stop):
+        """
+        Gets the samples of all leads between two indices as a new ECG, without boundaries or processed samples.
+        :param start: Index of the first sample of the window
+        :param stop: Index after the last sample of the window
+        :return: ECG object with a copy of the samples of the window
+        """
+
+        window = ECG(self._frequency)
+        window._samples = numpy.array(self._samples[:, start:stop], dtype=float)
+        if self._scale is not None:
+            window._samples *= self._scale
+        window._lead_index = dict(self._lead_index)
+
+        return window
+
+    def get_num_samples(self):
+        return self._samples.shape[1]
+
+    def get_filtered_lead(self, lead):
+        """
+        Gets the band-pass filtered samples of a lead.
+        Filtering is done once per lead and filter parameters, and reused until the lead is set again.
+        :param lead: Lead enum
+        :return: Read-only array of filtered samples
+        """
+
+        from dsp import dsp
+
+        return self._memoize(lead, "filtered", lambda samples: dsp.bandpass_filter(samples, self._frequency))
+
+    def get_derivative(self, lead):
+        """
+        Gets the derivative of the band-pass filtered samples of a lead.
+        :param lead: Lead enum
+        :return: Read-only array of slopes
+        """
+
+        from dsp import dsp
+
+        return self._memoize(lead, "derivative", lambda _: dsp.derivative_filter(self.get_filtered_lead(lead)))
+
+    def get_squared_derivative(self, lead):
+        """
+        Gets the squared derivative of the band-pass filtered samples of a lead.
+        :param lead: Lead enum
+        :return: Read-only array of squared slopes
+        """
+
+        from dsp import dsp
+
+        return self._memoize(lead, "squared_derivative", lambda _: dsp.squaring(self.get_derivative(lead)))
+
+    def get_filtered_leads(self):
+        """
+        Gets the band-pass filtered samples of all leads, filtered together along the sample axis.
+        :return: Read-only 2-D array of filtered samples, one row per lead
+        """
+
+        from dsp import dsp
+
+        return self._memoize(None, "filtered", lambda samples: dsp.bandpass_filter(samples, self._frequency))
+
+    def get_derivatives(self):
+        """
+        Gets the derivative of the band-pass filtered samples of all leads.
+        :return: Read-only 2-D array of slopes, one row per lead
+        """
+
+        from dsp import dsp
+
+        return self._memoize(None, "derivative", lambda _: dsp.derivative_filter(self.get_filtered_leads()))
+
+    def get_squared_derivatives(self):
+        """
+        Gets the squared derivative of the band-pass filtered samples of all leads.
+        :return: Read-only 2-D array of squared slopes, one row per lead
+        """
+
+        from dsp import dsp
+
+        return self._memoize(None, "squared_derivative", lambda _: dsp.squaring(self.get_derivatives()))
+
+    def _memoize(self, lead, stage, process):
+        """
+        Gets processed samples of a lead, or of all leads if lead is None, processing them if not already cached.
+        :param lead: Lead enum, or None for all leads
+        :param stage: Name of the processing stage
+        :param process: Function that processes the lead samples
+        :return: Read-only array of processed samples
+        """
+
+        from dsp import dsp
+
+        # Validate lead
+        if lead is not None and lead not in self._lead_index:
+            raise KeyError('lead not available: {}'.format(lead))
+
+        params = (self._frequency, dsp.SAVGOL_WINDOW, dsp.SAVGOL_ORDER, dsp.HIGHPASS_CUTOFF, dsp.DERIVATIVE_WINDOW)
+
+        # Use the lead's row if all leads have been processed together
+        if lead is not None and self._processed.get((None, stage), (None,))[0] == params:
+            return self._processed[(None, stage)][1][self._lead_index[lead]]
+
+        # Reprocess if never processed or processed with different parameters
+        key = (lead, stage)
+        if self._processed.get(key, (None,))[0] != params:
+            samples = self._get_samples() if lead is None else self.get_lead(lead)
+            processed = process(samples)
+            processed.flags.writeable = False
+            self._processed[key] = (params, processed)
+
+        return self._processed[key][1]
 
     def set_frequency(self, frequency):
         self._frequency = frequency
 
+        # Processed samples depend on the sampling frequency
+        self._processed.clear()
+
     def get_frequency(self):
         return self._frequency
 
     def set_qrs_complexes(self, boundaries):
+        self._unpack_beats()
         self._qrsComplexes = boundaries
 
     def get_qrs_complexes(self):
+        if self._qrsComplexes is None:
+            self._qrsComplexes = self._beats.get_qrs_complexes()
         return self._qrsComplexes
 
     def set_t_waves(self, boundaries):
+        self._unpack_beats()
         self._t_waves = boundaries
 
     def get_t_waves(self):
+        if self._t_waves is None:
+            self._t_waves = self._beats.get_t_waves()
         return self._t_waves
 
     def set_p_terminal_force(self, p_terminal_force):
+        self._unpack_beats()
         self._p_terminal_force = p_terminal_force
 
     def get_p_terminal_force(self):
+        if self._p_terminal_force is None:
+            self._p_terminal_force = self._beats.get_p_terminal_force()
         return self._p_terminal_force
 
     def set_p_waves(self, boundaries):
+        self._unpack_beats()
         self._p_waves = boundaries
 
     def get_p_waves(self):
+        if self._p_waves is None:
+            self._p_waves = self._beats.get_p_waves()
         return self._p_waves
 
+    def set_beats(self, beats):
+        """
+        Sets the boundaries and measurements of all beats, the lists of each boundary are converted from the table
+        when first needed.
+        :param beats: BeatTable object
+        """
+
+        if not isinstance(beats, BeatTable):
+            raise TypeError('beats must be an instance of BeatTable')
+
+        self._beats = beats
+        self._qrsComplexes = None
+        self._t_waves = None
+        self._p_waves = None
+        self._p_terminal_force = None
+
+    def get_beats(self):
+        """
+        Gets the boundaries and measurements grouped by QRS complex.
+        A table is built from the lists of each boundary if they were set on their own, dropping T-waves and P-waves
+        that have no QRS complex.
+        :return: BeatTable object
+        """
+
+        if self._beats is None:
+            self._beats = BeatTable.from_boundaries(self._qrsComplexes, self._t_waves, self._p_waves,
+                                                    self._p_terminal_force or None)
+        return self._beats
+
+    def _unpack_beats(self):
+        """ Converts the table to lists before one of them is set, as the table no longer matches them """
+
+        if self._beats is not None:
+            self.get_qrs_complexes()
+            self.get_t_waves()
+            self.get_p_waves()
+            self.get_p_terminal_force()
+            self._beats = None
+
+    def _get_samples(self):
+        """ Gets the sample matrix in mV, converting stored units once if scaled """
+
+        if self._scale is not None:
+            self._samples = self._samples * self._scale
+            self._scale = None
+
+        return self._samples
+
     def __iter__(self):
-        return iter(self._leads.values())
+        return iter(self._get_samples())
 
     def __len__(self):
-        return len(self._leads)
+        return len(self._lead_index)
 
 
 class Lead(Enum):
@@ -101,11 +369,11 @@ class Lead(Enum):
             case "iii":
                 return Lead.III
             case "avr":
-                return Lead.III
+                return Lead.AVR
             case "avl":
-                return Lead.III
+                return Lead.AVL
             case "avf":
-                return Lead.III
+                return Lead.AVF
             case "v1":
                 return Lead.V1
             case "v2":
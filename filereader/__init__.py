@@ -1 +1,2 @@
-from .filereader import read_file
\ No newline at end of file
+from .filereader import read_file
+from .binary import write_binary
@@ -0,0 +1,136 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import json as jsonparser
+import struct
+import zlib
+
+import numpy
+
+from ecg import ECG, Lead
+
+
+# File starts with the magic bytes and the byte length of the JSON header that follows
+MAGIC = b"ECGB"
+FORMAT_VERSION = 1
+PREFIX = struct.Struct("<4sI")
+
+# Sample matrix starts at a multiple of this many bytes, so it can be memory-mapped
+DATA_ALIGNMENT = 64
+
+# Stored sample type, 16-bit signed little-endian
+SAMPLE_TYPE = "<i2"
+SAMPLE_MAX = 32767
+
+
+def binary(file_path, seconds=None, leads=None):
+    """
+    Reads a binary ECG file written by write_binary.
+    Uncompressed samples are memory-mapped, so only the samples used are read from disk, and processes reading the same
+    file share its pages.
+    :param file_path: Path to binary ECG file
+    :param seconds: Length in seconds to be read, default/None is entire waveform
+    :param leads: Iterable of Lead enums to be read, default/None is all available leads
+    :return: ECG object
+    """
+
+    header, offset = read_header(file_path)
+    shape = (len(header["leads"]), header["num_samples"])
+    if header["compression"] is None:
+        samples = numpy.memmap(file_path, dtype=header["dtype"], mode="r", offset=offset, shape=shape)
+    elif header["compression"] == "zlib-delta":
+        with open(file_path, "rb") as file:
+            file.seek(offset)
+            deltas = numpy.frombuffer(zlib.decompress(file.read()), dtype=header["dtype"]).reshape(shape)
+        samples = numpy.cumsum(deltas, axis=1, dtype=header["dtype"])
+    else:
+        raise Exception("Compression not supported: '{}'".format(header["compression"]))
+
+    # Select samples, rows are only copied when a subset of leads is read
+    file_leads = [Lead(lead) for lead in header["leads"]]
+    if seconds:
+        samples = samples[:, :int(header["frequency"] * seconds)]
+    if leads is not None:
+        rows = [i for i, lead in enumerate(file_leads) if lead in leads]
+        file_leads = [file_leads[i] for i in rows]
+        samples = samples[rows]
+
+    ecg = ECG(header["frequency"])
+    ecg.set_lead_matrix(file_leads, samples, scale=header["scale"])
+
+    boundaries = header.get("boundaries", {})
+    ecg.set_qrs_complexes([tuple(boundary) for boundary in boundaries.get("qrs_complexes", [])])
+    ecg.set_t_waves([tuple(boundary) for boundary in boundaries.get("t_waves", [])])
+    ecg.set_p_waves([tuple(boundary) for boundary in boundaries.get("p_waves", [])])
+    ecg.set_p_terminal_force(boundaries.get("p_terminal_force", []))
+
+    return ecg
+
+
+def write_binary(ecg, file_path, compress=False):
+    """
+    Writes an ECG to a binary file of a JSON header followed by a 16-bit sample matrix, one row per lead.
+    Samples in mV are stored in units of the largest amplitude over 32767, scaled samples are stored as they are.
+    :param ecg: ECG object
+    :param file_path: Path to binary ECG file, by convention with extension .ecgb
+    :param compress: Compresses the differences between samples with zlib, which can then no longer be memory-mapped,
+    default is false
+    """
+
+    samples, scale = ecg.get_raw_matrix()
+    if scale is None or samples.dtype != numpy.dtype(SAMPLE_TYPE):
+        samples = ecg.get_lead_matrix()
+        scale = float(numpy.abs(samples).max(initial=0)) / SAMPLE_MAX or 1.0
+        samples = numpy.rint(samples / scale).astype(SAMPLE_TYPE)
+    data = numpy.ascontiguousarray(samples).tobytes()
+
+    # Differences between neighbouring samples are small and compress well, overflow wraps around and is undone
+    if compress:
+        data = zlib.compress(numpy.diff(samples, axis=1, prepend=numpy.zeros((len(samples), 1), samples.dtype)).tobytes())
+
+    header = {
+        "version": FORMAT_VERSION,
+        "frequency": ecg.get_frequency(),
+        "leads": [lead.value for lead in ecg.get_available_leads()],
+        "num_samples": samples.shape[1],
+        "scale": float(scale),
+        "dtype": SAMPLE_TYPE,
+        "compression": "zlib-delta" if compress else None,
+        "boundaries": {
+            "qrs_complexes": [[int(index) for index in boundary] for boundary in ecg.get_qrs_complexes()],
+            "t_waves": [[int(index) for index in boundary] for boundary in ecg.get_t_waves()],
+            "p_waves": [[int(index) for index in boundary] for boundary in ecg.get_p_waves()],
+            "p_terminal_force": [float(pterm) for pterm in ecg.get_p_terminal_force()],
+        },
+    }
+
+    # Pad header with spaces so the samples are aligned
+    encoded = jsonparser.dumps(header).encode("utf-8")
+    encoded += b" " * (-(PREFIX.size + len(encoded)) % DATA_ALIGNMENT)
+
+    with open(file_path, "wb") as file:
+        file.write(PREFIX.pack(MAGIC, len(encoded)))
+        file.write(encoded)
+        file.write(data)
+
+
+def read_header(file_path):
+    """
+    Reads the header of a binary ECG file.
+    :param file_path: Path to binary ECG file
+    :return: Tuple of the header dictionary and the byte offset of the sample matrix
+    """
+
+    with open(file_path, "rb") as file:
+        prefix = file.read(PREFIX.size)
+        if len(prefix) < PREFIX.size or PREFIX.unpack(prefix)[0] != MAGIC:
+            raise Exception("Not a binary ECG file: '{}'".format(file_path))
+        header_length = PREFIX.unpack(prefix)[1]
+        header = jsonparser.loads(file.read(header_length))
+
+    if header["version"] > FORMAT_VERSION:
+        raise Exception("Binary ECG version not supported: {}".format(header["version"]))
+
+    return header, PREFIX.size + header_length
@@ -5,19 +5,32 @@ Date: Sept. 30, 2019
 
 import base64
 import json as jsonparser
+import math
 import numpy
 import os.path as path
-import struct
-import xml.etree.cElementTree as xmlTree
 
 from ecg import ECG, Lead
+from .binary import binary
 
 
-def read_file(file_path, seconds=None):
+# Conversion factors from MUSE amplitude units to mV
+AMPLITUDE_UNITS = {
+    "MICROVOLTS": 0.001,
+    "MILLIVOLTS": 1.0,
+}
+
+# MUSE waveform block types
+MUSE_RHYTHM = "Rhythm"
+MUSE_MEDIAN = "Median"
+
+
+def read_file(file_path, seconds=None, leads=None, waveform_type=None):
     """
     Reads digital ECG file.
     :param file_path: Path for digital ECG file
     :param seconds: Length of waveform in seconds to be read, default/None is entire waveform
+    :param leads: Iterable of Lead enums to be read, default/None is all available leads
+    :param waveform_type: MUSE waveform block to be read, MUSE_RHYTHM or MUSE_MEDIAN, default/None is the first block
     :return: ECG object
     """
 
@@ -27,11 +40,14 @@ def read_file(file_path, seconds=None):
     # Call appropriate parser for file type
     match file_extension:
         case ".json":
-            return json(file_path, seconds)
+            return json(file_path, seconds, leads)
 
         case ".xml":
             # TODO: differentiate between different XML types (muse, scp)
-            return muse(file_path, seconds)
+            return muse(file_path, seconds, leads, waveform_type)
+
+        case ".ecgb":
+            return binary(file_path, seconds, leads)
 
         case ".dcm":
             return dicom(file_path, seconds)
@@ -43,30 +59,54 @@ def read_file(file_path, seconds=None):
             raise Exception("File type not supported: '{}'".format(file_extension))
 
 
-def json(file_path, seconds=2):
-    """ For test data """
+def json(file_path, seconds=2, leads=None):
+    """
+    For test data.
+    Annotations are either a single beat, extrapolated one beat per second with the samples extended to the requested
+    length, or lists of every beat, such as written by the synthetic generator, with the samples cut to the requested
+    length.
+    :param file_path: Path to JSON ECG file
+    :param seconds: Length in seconds to be read, None is the samples as they are
+    :param leads: Iterable of Lead enums to be read, default/None is all available leads
+    :return: ECG object
+    """
 
     # Pull data from JSON
     with open(file_path) as file:
         data = jsonparser.loads(file.read())
     freq = int(data["frequency"])
+    anno = data["annotation"]
+    listed = len(anno["qrs"]) > 0 and isinstance(anno["qrs"][0], list)
 
     # Get and extrapolate samples for each lead
     ecg = ECG(freq)
     for lead in Lead:
+        if leads is not None and lead not in leads:
+            continue
         if lead.value.lower() in data:
             samples = data[lead.value.lower()]
-            while len(samples) < freq * seconds:
+            if listed and seconds:
+                samples = samples[:int(freq * seconds)]
+            while not listed and seconds and len(samples) < freq * seconds:
                 samples = numpy.append(samples, samples[0:freq])
             ecg.set_lead(lead, samples)
-    
+
+    # Get annotation data of every beat within the samples read
+    if listed:
+        length = len(ecg.get_all_leads()[0]) if len(ecg) else 0
+        beats = [i for i, boundary in enumerate(anno["pwave"]) if boundary[-1] < length]
+        ecg.set_qrs_complexes([tuple(boundary) for boundary in anno["qrs"] if boundary[-1] < length])
+        ecg.set_t_waves([tuple(boundary) for boundary in anno["twave"] if boundary[-1] < length])
+        ecg.set_p_waves([tuple(anno["pwave"][i]) for i in beats])
+        ecg.set_p_terminal_force([anno["pterm"][i] for i in beats])
+        return ecg
+
     # Get and extrapolate annotion data
-    anno = data["annotation"]
     qrs = [(anno["qrs"][0], anno["qrs"][1], anno["qrs"][2])]
     twave = [(anno["twave"][0], anno["twave"][1], anno["twave"][2])]
     pwave = [(anno["pwave"][0], anno["pwave"][1], anno["pwave"][2])]
     pterm = [anno["pterm"]]
-    while len(qrs) < seconds:
+    while seconds and len(qrs) < seconds:
         qrs.append((qrs[-1][0] + freq, qrs[-1][1] + freq, qrs[-1][2] + freq))
         twave.append((twave[-1][0] + freq, twave[-1][1] + freq, twave[-1][2] + freq))
         pwave.append((pwave[-1][0] + freq, pwave[-1][1] + freq, pwave[-1][2] + freq))
@@ -79,28 +119,81 @@ def json(file_path, seconds=2):
     return ecg
 
 
-def muse(file_path, seconds=None):
+def muse(file_path, seconds=None, leads=None, waveform_type=None):
     """
-    Extracts specified lead waveform from MUSE file type.
+    Extracts lead waveforms from MUSE file type.
+    The file is parsed incrementally, and parsing stops once the requested leads of the selected waveform are read.
     :param file_path: Path to MUSE ECG file
     :param seconds: Length in seconds to be read, default/None is entire waveform
+    :param leads: Iterable of Lead enums to be read, default/None is all leads
+    :param waveform_type: Waveform block to be read, MUSE_RHYTHM or MUSE_MEDIAN, default/None is the first block
     :return: ECG object
     """
 
-    xml_tree = xmlTree.parse(file_path)
-    waveform_data = xml_tree.getroot().find("Waveform")
-    all_leads = waveform_data.findall("LeadData")
-
-    frequency = float(waveform_data.find("SampleBase").text)
-
-    ecg = ECG(frequency)
-    for lead_data in all_leads:
-        lead_id = Lead.string_to_lead(lead_data.find("LeadID").text.lower())
-        samples = decode_base64(lead_data.find("WaveFormData").text)
-        if seconds and seconds < len(samples) / frequency:
-            length = int(frequency * seconds)
-            samples = samples[:length]
-        ecg.set_lead(lead_id, numpy.array(samples))
+    # Imported when first needed, as only MUSE files are XML
+    import xml.etree.cElementTree as xmlTree
+
+    if leads is not None:
+        leads = set(leads)
+
+    ecg = None
+    length = None
+    depth = 0
+    selected = False  # True while inside the waveform block being read
+    read = {}  # Stored samples and mV per unit of each lead read
+    with open(file_path, "rb") as file:
+        for event, element in xmlTree.iterparse(file, events=("start", "end")):
+            if event == "start":
+                depth += 1
+
+                # Without a requested type the first waveform block is read
+                if element.tag == "Waveform" and waveform_type is None:
+                    selected = True
+                continue
+
+            depth -= 1
+            match element.tag:
+                case "WaveformType":
+                    if waveform_type is not None:
+                        selected = element.text.strip().lower() == waveform_type.lower()
+
+                case "SampleBase" if selected:
+                    frequency = float(element.text)
+                    ecg = ECG(frequency)
+
+                    # Only decode the samples that will be kept
+                    if seconds:
+                        length = int(frequency * seconds)
+
+                case "LeadData" if selected:
+                    lead_id = Lead.string_to_lead(element.find("LeadID").text)
+                    if leads is None or lead_id in leads:
+                        samples = decode_base64(element.find("WaveFormData").text, length)
+                        read[lead_id] = (samples, amplitude_scale(element))
+
+                        # Stop once every requested lead has been read
+                        if leads is not None and leads <= read.keys():
+                            break
+
+                case "Waveform" if selected:
+                    break
+
+            # Discard parsed elements so memory does not grow with the document
+            if depth <= 2:
+                element.clear()
+
+    if ecg is None:
+        raise Exception("Waveform not found: '{}'".format(waveform_type))
+
+    # Leads of one scale and length keep their stored 16-bit units, so they are converted to mV only when used and
+    # written to binary without quantizing them again
+    scales = {scale for _, scale in read.values()}
+    lengths = {len(samples) for samples, _ in read.values()}
+    if len(scales) == 1 and len(lengths) == 1:
+        ecg.set_lead_matrix(list(read), numpy.stack([samples for samples, _ in read.values()]), scale=scales.pop())
+    else:
+        for lead_id, (samples, scale) in read.items():
+            ecg.set_lead(lead_id, samples * scale)
 
     return ecg
 
@@ -129,22 +222,50 @@ def scp(file_path, seconds=None):
     raise Exception("SCP compatibility not yet implemented")
 
 
-def decode_base64(encoded):
+def decode_base64(encoded, length=None):
     """
     Decodes base64 encoded waveform.
     :param encoded: String of encoded waveform
-    :return: List of samples in mV
+    :param length: Maximum number of samples to be decoded, default/None is all samples
+    :return: Array of 16-bit signed samples
     """
 
+    # Drop line breaks and other whitespace so the string can be sliced by character
+    encoded = "".join(encoded.split())
+
+    # Each 4 base64 characters encode 3 bytes, only decode the characters covering the requested samples
+    if length is not None:
+        num_chars = 4 * math.ceil(2 * length / 3)
+        encoded = encoded[:num_chars]
+
     # base64 string to byte array
     decoded = base64.b64decode(encoded)
 
-    # convert byte array to list of samples, 16-bit signed
-    samples = []
-    for i in range(0, len(decoded), 2):
-        samples.append(struct.unpack("<h", decoded[i:i+2])[0])
+    # View byte array as samples, 16-bit signed little-endian
+    num_samples = len(decoded) // 2
+    if length is not None:
+        num_samples = min(num_samples, length)
+
+    return numpy.frombuffer(decoded, dtype="<i2", count=num_samples)
+
+
+def amplitude_scale(lead_data):
+    """
+    Gets the factor converting a MUSE lead's stored sample values to mV.
+    :param lead_data: LeadData element of a MUSE file
+    :return: Float of mV per sample unit
+    """
+
+    units_per_bit = lead_data.find("LeadAmplitudeUnitsPerBit")
+    units = lead_data.find("LeadAmplitudeUnits")
+
+    scale = 1.0
+    if units_per_bit is not None:
+        scale = float(units_per_bit.text)
+    if units is not None:
+        scale *= AMPLITUDE_UNITS.get(units.text.strip().upper(), 1.0)
 
-    return samples
+    return scale
 
 
 def total_seconds_from_iso8601(time):
@@ -0,0 +1,46 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+from argparse import ArgumentParser
+
+from synthetic import generate_corpus
+
+
+def get_arguments():
+    """ Defines and returns a dictionary of environment arguments """
+
+    parser = ArgumentParser()
+
+    # Argument for output directory
+    parser.add_argument("-o", "--output", required=True, help="Directory of the generated ECG files")
+
+    # Argument for number of ECGs
+    parser.add_argument("-n", "--count", required=True, type=int, help="Number of ECGs to generate")
+
+    # Argument for duration of each ECG
+    parser.add_argument("-s", "--seconds", required=False, type=float, default=10, help="Seconds of each ECG")
+
+    # Argument for sampling frequency
+    parser.add_argument("-f", "--frequency", required=False, type=int, default=500, help="Sampling frequency")
+
+    # Argument for file formats
+    parser.add_argument("--format", required=False, nargs="+", choices=["json", "muse", "ecgb"], default=["json"],
+                        help="File formats each ECG is written as")
+
+    # Argument for reproducible corpora
+    parser.add_argument("--seed", required=False, type=int, help="Seed of the random number generator")
+
+    return vars(parser.parse_args())
+
+
+def main():
+    args = get_arguments()
+    annotations = generate_corpus(args["output"], args["count"], seconds=args["seconds"], frequency=args["frequency"],
+                                  formats=args["format"], seed=args["seed"])
+    print("Generated {} ECGs, annotations written to {}".format(args["count"], annotations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from .instrument import start_recording, stop_recording, is_recording, stage, count, aggregate
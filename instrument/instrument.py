@@ -0,0 +1,148 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy
+
+
+# Percentiles of each measurement reported when aggregating records
+PERCENTILES = (50, 90, 99)
+
+# Record of the current recording, None when not recording so instrumented code does no work
+_record = None
+
+# Frames of the stages being measured, innermost last
+_stack = []
+
+
+def start_recording(trace_memory=True):
+    """
+    Starts recording the time, memory, and counters of instrumented stages.
+    :param trace_memory: Measures the peak memory of each stage with tracemalloc, which slows allocation
+    """
+
+    global _record
+
+    _record = {"stages": {}, "counters": {}}
+    _stack.clear()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _record["tracing"] = True
+
+
+def stop_recording():
+    """
+    Stops recording.
+    :return: Dictionary of stages, each with its calls, wall and CPU seconds, and peak bytes allocated above the memory
+    at its start, and of counters, or None if not recording
+    """
+
+    global _record
+
+    record, _record = _record, None
+    if record is None:
+        return None
+    if record.pop("tracing", False):
+        tracemalloc.stop()
+
+    return record
+
+
+def is_recording():
+    return _record is not None
+
+
+@contextmanager
+def stage(name):
+    """
+    Measures a stage while recording, adding to the measurements of earlier calls of the same stage.
+    :param name: Name of the stage
+    """
+
+    if _record is None:
+        yield
+        return
+
+    # Fold the peak so far into the enclosing stage, then measure this stage's peak on its own
+    tracing = tracemalloc.is_tracing()
+    frame = {"start": 0, "peak": 0}
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1]["peak"] = max(_stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame = {"start": current, "peak": current}
+    _stack.append(frame)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        _stack.pop()
+        if tracing:
+            frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            if _stack:
+                _stack[-1]["peak"] = max(_stack[-1]["peak"], frame["peak"])
+
+        if _record is not None:
+            stages = _record["stages"]
+            if name not in stages:
+                stages[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_memory": None}
+            measurements = stages[name]
+            measurements["calls"] += 1
+            measurements["wall"] += wall
+            measurements["cpu"] += cpu
+            if tracing:
+                measurements["peak_memory"] = max(measurements["peak_memory"] or 0, frame["peak"] - frame["start"])
+
+
+def count(name, amount=1):
+    """
+    Counts an event while recording.
+    :param name: Name of the counter
+    :param amount: Amount added to the counter
+    """
+
+    if _record is not None:
+        _record["counters"][name] = _record["counters"].get(name, 0) + amount
+
+
+def aggregate(records, percentiles=PERCENTILES):
+    """
+    Aggregates the records of many analyses to percentiles.
+    A stage or counter missing from a record counts as 0 for that record.
+    :param records: List of records returned by stop_recording
+    :param percentiles: Iterable of percentiles to be reported
+    :return: Dictionary of the number of records, and percentiles of each stage measurement and counter
+    """
+
+    stages = sorted({name for record in records for name in record["stages"]})
+    counters = sorted({name for record in records for name in record["counters"]})
+
+    def summarize(values):
+        if not values:
+            return {}
+        return {"p{:g}".format(p): float(value) for p, value in zip(percentiles, numpy.percentile(values, percentiles))}
+
+    result = {"records": len(records), "stages": {}, "counters": {}}
+    for name in stages:
+        result["stages"][name] = {}
+        for measurement in ("calls", "wall", "cpu", "peak_memory"):
+            values = []
+            for record in records:
+                value = record["stages"].get(name, {}).get(measurement, 0)
+                if value is not None:
+                    values.append(value)
+            result["stages"][name][measurement] = summarize(values)
+    for name in counters:
+        result["counters"][name] = summarize([record["counters"].get(name, 0) for record in records])
+
+    return result
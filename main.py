@@ -3,11 +3,14 @@ Author: Brody Taylor
 Date: Sept. 30, 2019
 """
 
+import json
+import sys
 from argparse import ArgumentParser
 
-import display
-import dsp
 import filereader
+import instrument
+from cache import ResultCache, set_cached_boundaries
+from analysis import set_boundaries, set_long_boundaries, set_parallel_boundaries, report
 from ecg import Lead
 
 
@@ -23,26 +26,84 @@ def get_arguments():
     parser.add_argument("-s", "--seconds", required=False, type=float, help="Maximum seconds to be displayed",
                         nargs='?', default=10)
 
-    return vars(parser.parse_args())
+    # Argument for analysis without the display
+    parser.add_argument("--no-display", required=False, action="store_true", help="Do not display the ECG")
+
+    # Argument for analysis of long recordings in windows
+    parser.add_argument("--memory-limit", required=False, type=float,
+                        help="Analyze in windows using at most this many MB, for long recordings such as Holters")
+
+    # Argument for analysis of long recordings in parallel segments
+    parser.add_argument("-w", "--workers", required=False, type=int,
+                        help="Analyze in segments with this many processes, for long recordings such as Holters")
+
+    # Argument for always analyzing rather than reusing cached results
+    parser.add_argument("--no-cache", required=False, action="store_true",
+                        help="Analyze even if results of the same file and parameters are cached")
 
+    # Argument for measuring the time and memory of each stage
+    parser.add_argument("--instrument", required=False, action="store_true",
+                        help="Print the time, memory, and counters of each stage as JSON, slows analysis")
 
-def set_boundaries(ecg):
-    frequency = ecg.get_frequency()
-    qrs = dsp.determine_qrs(ecg.get_all_leads(), frequency)
-    ecg.set_qrs_complexes(qrs)
-    t_waves = dsp.determine_t_waves(ecg.get_all_leads(), frequency, qrs)
-    ecg.set_t_waves(t_waves)
-    p_waves = dsp.p_wave_boundaries(qrs, t_waves, ecg.get_lead(Lead.V1), frequency, do_filtering=True)
-    ecg.set_p_waves(p_waves)
-    p_terminal_force = dsp.pterm_measurements(ecg.get_lead(Lead.V1), frequency, p_waves, do_filtering=True)
-    ecg.set_p_terminal_force(p_terminal_force)
+    # Argument for profiling
+    parser.add_argument("--profile", required=False, help="Path to save cProfile statistics of the run")
+
+    # Argument for printing the results
+    parser.add_argument("--output", required=False, choices=["json"],
+                        help="Print the results in the given format instead of displaying the ECG")
+
+    return vars(parser.parse_args())
 
 
 def main():
     args = get_arguments()
-    ecg = filereader.read_file(args["file"], args["seconds"])
-    set_boundaries(ecg)
-    display.plot(ecg, lead_of_interest=Lead.V1, annotate=True, do_filtering=True)
+    if args["profile"]:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.runcall(run, args)
+        profile.dump_stats(args["profile"])
+    else:
+        run(args)
+
+
+def run(args):
+    if args["instrument"]:
+        instrument.start_recording()
+
+    with instrument.stage("read"):
+        ecg = filereader.read_file(args["file"], args["seconds"])
+
+    # Results are cached per analysis mode and the options that place its seams, which can differ slightly in rare cases
+    analyze, options = set_boundaries, {"mode": "whole"}
+    if args["workers"]:
+        analyze = lambda ecg: set_parallel_boundaries(ecg, workers=args["workers"])
+        options = {"mode": "parallel", "workers": args["workers"]}
+    elif args["memory_limit"]:
+        analyze = lambda ecg: set_long_boundaries(ecg, memory_limit=int(args["memory_limit"] * 2**20))
+        options = {"mode": "long", "memory_limit": args["memory_limit"]}
+
+    cache = None if args["no_cache"] else ResultCache()
+    set_cached_boundaries(ecg, args["file"], cache, analyze=analyze, seconds=args["seconds"], **options)
+
+    # Display is only imported when used, as matplotlib is slow to import
+    if not args["no_display"] and not args["output"]:
+        with instrument.stage("plot"):
+            import display
+            display.plot(ecg, lead_of_interest=Lead.V1, annotate=True, do_filtering=True)
+
+    # Instrumentation is printed with the results, or on its own
+    record = instrument.stop_recording()
+    if args["output"] == "json":
+        result = report(ecg)
+        result["file"] = args["file"]
+        if record is not None:
+            result["instrumentation"] = record
+        json.dump(result, sys.stdout)
+        print()
+    elif record is not None:
+        json.dump({"file": args["file"], "instrumentation": record}, sys.stdout)
+        print()
 
 
-main()
+if __name__ == "__main__":
+    main()
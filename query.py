@@ -0,0 +1,102 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import csv
+import json
+import os.path as path
+import statistics
+import sys
+from argparse import ArgumentParser
+
+from store import BEAT_FIELDS, RECORD_FIELDS, ResultStore
+
+
+def get_arguments():
+    """ Defines and returns a dictionary of environment arguments """
+
+    parser = ArgumentParser()
+
+    # Argument for results database
+    parser.add_argument("-d", "--database", required=True, help="Path to SQLite results database written by cohort.py")
+
+    # Arguments for range of median P-terminal force
+    parser.add_argument("--min-ptf", required=False, type=float, help="Lowest median P-terminal force in μV*mS")
+    parser.add_argument("--max-ptf", required=False, type=float, help="Highest median P-terminal force in μV*mS")
+
+    # Records that failed have no beats, so their errors and beats are not exported together
+    exports = parser.add_mutually_exclusive_group()
+
+    # Argument for exporting records that failed
+    exports.add_argument("--errors", required=False, action="store_true", help="Export records that failed instead")
+
+    # Argument for exporting beats rather than records
+    exports.add_argument("--beats", required=False, action="store_true",
+                         help="Export every beat of the records rather than one row per record")
+
+    # Argument for output file path
+    parser.add_argument("-o", "--output", required=False,
+                        help="Path to output file (.csv or .ndjson), default is CSV printed with a summary")
+
+    return vars(parser.parse_args())
+
+
+def main():
+    args = get_arguments()
+
+    with ResultStore(args["database"]) as store:
+        records = store.query_records(args["min_ptf"], args["max_ptf"], errors=args["errors"])
+        if args["beats"]:
+            fields = BEAT_FIELDS
+            rows = store.query_beats(args["min_ptf"], args["max_ptf"])
+        else:
+            fields = RECORD_FIELDS
+            rows = records
+
+        if args["output"]:
+            with open(args["output"], "w", newline="") as output:
+                write_rows(output, rows, fields, path.splitext(args["output"])[1].lower() == ".ndjson")
+        else:
+            write_rows(sys.stdout, rows, fields)
+
+    # Summary of the median P-terminal force of the matching records
+    medians = [record["median_p_terminal_force"] for record in records
+               if record["median_p_terminal_force"] is not None]
+    summary = "{} records".format(len(records))
+    if medians:
+        summary += ", median P-terminal force {:.2f} μV*mS (IQR {:.2f} to {:.2f})".format(
+            statistics.median(medians), *get_quartiles(medians))
+    print(summary, file=sys.stderr if not args["output"] else sys.stdout)
+
+
+def write_rows(output, rows, fields, ndjson=False):
+    """
+    Writes rows as CSV or newline-delimited JSON.
+    :param output: Writable text file
+    :param rows: Iterable of row dictionaries
+    :param fields: Columns of each row
+    :param ndjson: Writes newline-delimited JSON rather than CSV, default is false
+    """
+
+    if ndjson:
+        for row in rows:
+            output.write(json.dumps(row) + "\n")
+        return
+
+    writer = csv.DictWriter(output, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def get_quartiles(values):
+    """ Returns the first and third quartiles of values, or the value itself if there is only one """
+
+    if len(values) < 2:
+        return values[0], values[0]
+    quartiles = statistics.quantiles(values, n=4)
+    return quartiles[0], quartiles[2]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from .store import ResultStore, RECORD_FIELDS, BEAT_FIELDS, get_file_key
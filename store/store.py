@@ -0,0 +1,274 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import hashlib
+import json
+import os
+import os.path as path
+import sqlite3
+import time
+
+from cache.cache import VERSION, get_parameters, hash_file
+from ecg import NO_INDEX, P_WAVE
+
+
+# Columns of each record, and of each beat of a record
+RECORD_FIELDS = (
+    "file",
+    "frequency",
+    "heart_rate",
+    "beats",
+    "median_p_terminal_force",
+    "seconds",
+    "error",
+    "analyzed",
+)
+BEAT_FIELDS = (
+    "file",
+    "beat",
+    "qrs_on",
+    "qrs_off",
+    "t_on",
+    "t_end",
+    "p_on",
+    "p_mid",
+    "p_off",
+    "p_terminal_force",
+    "flags",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    frequency NUMERIC,
+    heart_rate REAL,
+    beats INTEGER,
+    median_p_terminal_force REAL,
+    seconds REAL,
+    error TEXT,
+    analyzed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_median_p_terminal_force ON records (median_p_terminal_force);
+CREATE TABLE IF NOT EXISTS beats (
+    record INTEGER NOT NULL REFERENCES records (id) ON DELETE CASCADE,
+    beat INTEGER NOT NULL,
+    qrs_on INTEGER NOT NULL,
+    qrs_off INTEGER NOT NULL,
+    t_on INTEGER,
+    t_end INTEGER,
+    p_on INTEGER,
+    p_mid INTEGER,
+    p_off INTEGER,
+    p_terminal_force REAL,
+    flags INTEGER NOT NULL,
+    PRIMARY KEY (record, beat)
+);
+CREATE INDEX IF NOT EXISTS beats_p_terminal_force ON beats (p_terminal_force);
+"""
+
+
+class ResultStore:
+    """
+    SQLite database of the record and beat level results of a cohort.
+    Each record is stored with the size, modification time, and hash of its file, and a key of the analysis
+    parameters, code version, and options, so a record is only analyzed again once its file or the analysis changes.
+    Missing boundaries are stored as NULL, as is the P-terminal force of a beat with no P-wave.
+    """
+
+    def __init__(self, database_path):
+        """
+        :param database_path: Path to the database file, created if it does not exist
+        """
+
+        self._connection = sqlite3.connect(database_path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_current(self, file_path, **options):
+        """
+        Checks if the stored results of an ECG file are of its current content and the current analysis.
+        The file is only hashed if its size is unchanged but its modification time is not, records that failed are
+        never current so they are retried.
+        :param file_path: Path to ECG file
+        :param options: Options the results depend on, such as the seconds read
+        :return: True if the stored results can be reused
+        """
+
+        record = self._connection.execute(
+            "SELECT id, size, mtime_ns, hash, analysis, error FROM records WHERE file = ?",
+            (path.abspath(file_path),)).fetchone()
+        if record is None or record["error"] is not None or record["analysis"] != get_analysis_key(options):
+            return False
+
+        stat = os.stat(file_path)
+        if stat.st_size != record["size"]:
+            return False
+        if stat.st_mtime_ns == record["mtime_ns"]:
+            return True
+
+        # Touched but possibly unchanged, such as after a copy
+        if hash_file(file_path) != record["hash"]:
+            return False
+        with self._connection:
+            self._connection.execute("UPDATE records SET mtime_ns = ? WHERE id = ?", (stat.st_mtime_ns, record["id"]))
+        return True
+
+    def put(self, file_path, row, beats=None, file_key=None, **options):
+        """
+        Stores the results of an ECG file, replacing any results stored before.
+        :param file_path: Path to ECG file
+        :param row: Dictionary of record results, as returned by batch.analyze_record
+        :param beats: Structured array of the beats of the record, as returned by BeatTable.get_array
+        :param file_key: Tuple of the file's size, modification time, and hash from before it was read, as returned by
+        get_file_key, default/None is taken now
+        :param options: Options the results depend on, such as the seconds read
+        """
+
+        self.put_many([(file_path, row, beats, file_key or get_file_key(file_path))], **options)
+
+    def put_many(self, results, **options):
+        """
+        Stores the results of several ECG files in one transaction, replacing any results stored before.
+        :param results: Iterable of tuples of file path, row, beats, and file key, as taken by put
+        :param options: Options the results depend on, such as the seconds read
+        """
+
+        analysis = get_analysis_key(options)
+        with self._connection:
+            for file_path, row, beats, (size, mtime_ns, file_hash) in results:
+                record = (path.abspath(file_path), size, mtime_ns, file_hash, analysis, row.get("frequency"),
+                          row.get("heart_rate"), row.get("beats"), row.get("median_p_terminal_force"),
+                          row.get("seconds"), row.get("error"), time.time())
+                self._connection.execute("DELETE FROM records WHERE file = ?", (record[0],))
+                record_id = self._connection.execute(
+                    "INSERT INTO records (file, size, mtime_ns, hash, analysis, frequency, heart_rate, beats, "
+                    "median_p_terminal_force, seconds, error, analyzed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    record).lastrowid
+                if beats is not None and len(beats):
+                    self._connection.executemany(
+                        "INSERT INTO beats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        get_beat_rows(record_id, beats))
+
+    def get_row(self, file_path):
+        """
+        Gets the stored results of an ECG file as a row of the batch output.
+        :param file_path: Path to ECG file
+        :return: Dictionary with a value for each of batch.FIELDS, or None if not stored
+        """
+
+        record = self._connection.execute("SELECT * FROM records WHERE file = ?", (path.abspath(file_path),)).fetchone()
+        if record is None:
+            return None
+
+        p_terminal_force = [beat[0] for beat in self._connection.execute(
+            "SELECT p_terminal_force FROM beats WHERE record = ? AND flags & ? ORDER BY beat", (record["id"], P_WAVE))]
+
+        return {
+            "file": file_path,
+            "frequency": record["frequency"],
+            "heart_rate": record["heart_rate"],
+            "beats": record["beats"],
+            "p_terminal_force": p_terminal_force if record["error"] is None else None,
+            "median_p_terminal_force": record["median_p_terminal_force"],
+            "seconds": record["seconds"],
+            "error": record["error"],
+        }
+
+    def query_records(self, min_p_terminal_force=None, max_p_terminal_force=None, errors=False):
+        """
+        Finds records by median P-terminal force.
+        :param min_p_terminal_force: Lowest median P-terminal force (in μV*mS), default/None is no lower limit
+        :param max_p_terminal_force: Highest median P-terminal force (in μV*mS), default/None is no upper limit
+        :param errors: Finds the records that failed instead, default is false
+        :return: List of dictionaries with a value for each of RECORD_FIELDS, ordered by file
+        """
+
+        where, parameters = get_conditions(min_p_terminal_force, max_p_terminal_force, errors)
+        query = "SELECT {} FROM records WHERE {} ORDER BY file".format(", ".join(RECORD_FIELDS), where)
+
+        return [dict(record) for record in self._connection.execute(query, parameters)]
+
+    def query_beats(self, min_p_terminal_force=None, max_p_terminal_force=None):
+        """
+        Finds the beats of records by median P-terminal force.
+        :param min_p_terminal_force: Lowest median P-terminal force (in μV*mS) of the record, default/None is no limit
+        :param max_p_terminal_force: Highest median P-terminal force (in μV*mS) of the record, default/None is no limit
+        :return: Iterator of dictionaries with a value for each of BEAT_FIELDS, ordered by file and beat
+        """
+
+        where, parameters = get_conditions(min_p_terminal_force, max_p_terminal_force, False)
+        columns = ", ".join("records.file" if field == "file" else "beats." + field for field in BEAT_FIELDS)
+        query = "SELECT {} FROM beats JOIN records ON beats.record = records.id WHERE {} ORDER BY records.file, beat"
+
+        return (dict(beat) for beat in self._connection.execute(query.format(columns, where), parameters))
+
+
+def get_conditions(min_p_terminal_force, max_p_terminal_force, errors):
+    """ Builds the WHERE clause and its parameters of a record query """
+
+    if errors:
+        return "error IS NOT NULL", ()
+
+    conditions = ["error IS NULL"]
+    parameters = []
+    if min_p_terminal_force is not None:
+        conditions.append("median_p_terminal_force >= ?")
+        parameters.append(min_p_terminal_force)
+    if max_p_terminal_force is not None:
+        conditions.append("median_p_terminal_force <= ?")
+        parameters.append(max_p_terminal_force)
+
+    return " AND ".join(conditions), tuple(parameters)
+
+
+def get_beat_rows(record_id, beats):
+    """ Converts the beats of a record to rows of the beats table, with missing boundaries as NULL """
+
+    columns = ["qrs_on", "qrs_off", "t_on", "t_end", "p_on", "p_mid", "p_off", "ptf", "flags"]
+    for i, beat in enumerate(beats[columns].tolist()):
+        qrs_on, qrs_off, t_on, t_end, p_on, p_mid, p_off, pterm, flags = beat
+        boundaries = [None if index == NO_INDEX else index for index in (t_on, t_end, p_on, p_mid, p_off)]
+        yield (record_id, i, qrs_on, qrs_off, *boundaries, pterm if flags & P_WAVE else None, flags)
+
+
+def get_file_key(file_path):
+    """
+    Gets what identifies the content of an ECG file, taken before the file is read so results are never stored with
+    the key of a later change.
+    :param file_path: Path to ECG file
+    :return: Tuple of the size, modification time (in nanoseconds), and hash of the file
+    """
+
+    stat = os.stat(file_path)
+
+    return stat.st_size, stat.st_mtime_ns, hash_file(file_path)
+
+
+def get_analysis_key(options):
+    """
+    Gets the key of the analysis results depend on.
+    :param options: Dictionary of options the results depend on, such as the seconds read
+    :return: Hex digest of the analysis parameters, code version, and options
+    """
+
+    key = {"parameters": get_parameters(), "version": VERSION, "options": options}
+
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
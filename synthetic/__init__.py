@@ -0,0 +1 @@
+from .synthetic import synthesize, generate_corpus, write_json, write_muse
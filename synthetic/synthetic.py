@@ -0,0 +1,253 @@
+"""
+Author: Brody Taylor
+Date: Sept. 30, 2019
+"""
+
+import base64
+import json
+import math
+import os
+import os.path as path
+
+import numpy
+
+import filereader
+from ecg import ECG, Lead
+
+
+# Amplitudes (in mV) of the P, Q, R, S, and T waves of each lead, the V1 P-wave is set by the P-wave morphology
+AMPLITUDES = {
+    Lead.I:   (0.10, -0.05, 0.80, -0.10, 0.25),
+    Lead.II:  (0.15, -0.05, 1.20, -0.20, 0.35),
+    Lead.III: (0.05, -0.05, 0.50, -0.20, 0.10),
+    Lead.V1:  (0.08, 0.00, 0.30, -1.00, 0.10),
+    Lead.V2:  (0.08, 0.00, 0.60, -1.40, 0.50),
+    Lead.V3:  (0.08, 0.00, 1.00, -1.00, 0.45),
+    Lead.V4:  (0.10, -0.05, 1.50, -0.60, 0.40),
+    Lead.V5:  (0.10, -0.08, 1.40, -0.30, 0.30),
+    Lead.V6:  (0.10, -0.08, 1.00, -0.15, 0.25),
+    Lead.AVL: (0.03, -0.05, 0.40, -0.10, 0.10),
+    Lead.AVR: (-0.12, 0.00, 0.15, -0.90, -0.30),
+    Lead.AVF: (0.10, -0.05, 0.85, -0.20, 0.20),
+}
+
+# Durations (in sec) of the P-wave, P-R interval, and QRS complex
+P_WAVE_DURATION = 0.11
+PR_INTERVAL = 0.16
+QRS_DURATION = 0.09
+
+# Q-T interval and S-T segment (in sec) at a heart rate of 60 bpm, scaled by the square root of the R-R interval
+QT_INTERVAL = 0.40
+ST_SEGMENT = 0.10
+
+# Frequency (in Hz) of baseline wander, about the rate of breathing
+WANDER_FREQUENCY = 0.25
+
+# MUSE amplitude resolution (in μV)
+MUSE_UNITS_PER_BIT = 4.88
+
+
+def synthesize(seconds, frequency=500, heart_rate=60, variability=0.0, noise=0.0, wander=0.0,
+               p_terminal_depth=0.1, p_terminal_duration=0.04, leads=None, seed=None):
+    """
+    Synthesizes an ECG of beats of smooth lobes, with ground truth boundaries and P-terminal force set on it.
+    Boundaries are QRS onset, R peak, and end, T-wave start (the QRS end), peak, and end, and P-wave start, V1 mid-point
+    (peak if monophasic), and end, as in the annotations read by filereader.
+    :param seconds: Length in seconds
+    :param frequency: Sampling frequency
+    :param heart_rate: Mean heart rate in beats per minute
+    :param variability: Standard deviation of R-R intervals as a fraction of the mean
+    :param noise: Standard deviation (in mV) of white noise
+    :param wander: Amplitude (in mV) of baseline wander
+    :param p_terminal_depth: Depth (in mV) of the negative terminal portion of the V1 P-wave, 0 is monophasic
+    :param p_terminal_duration: Duration (in sec) of the negative terminal portion of the V1 P-wave
+    :param leads: Iterable of Lead enums to be synthesized, default/None is all 12 leads
+    :param seed: Seed of the random number generator, default/None is unseeded
+    :return: ECG object
+    """
+
+    rng = numpy.random.default_rng(seed)
+    leads = list(Lead) if leads is None else list(leads)
+    num_samples = int(seconds * frequency)
+    samples = numpy.zeros((len(leads), num_samples))
+
+    # QRS onsets, where each beat has room for its P-wave before it and its T-wave after it
+    onsets = []
+    onset = PR_INTERVAL
+    while True:
+        rr = max(60 / heart_rate * (1 + variability * rng.standard_normal()), 0.3)
+        if onset + QT_INTERVAL * math.sqrt(rr) >= seconds:
+            break
+        onsets.append((onset, rr))
+        onset += rr
+
+    qrs_complexes, t_waves, p_waves, p_terminal_force = [], [], [], []
+    for onset, rr in onsets:
+        # Interval times (in sec) of each wave of the beat
+        p_start = onset - PR_INTERVAL
+        p_end = p_start + P_WAVE_DURATION
+        qrs_end = onset + QRS_DURATION
+        t_start = qrs_end + ST_SEGMENT * math.sqrt(rr)
+        t_end = onset + QT_INTERVAL * math.sqrt(rr)
+        third = QRS_DURATION / 3
+
+        for row, lead in enumerate(leads):
+            p, q, r, s, t = AMPLITUDES[lead]
+            if lead == Lead.V1 and p_terminal_depth:
+                add_lobe(samples[row], frequency, p_start, p_end - p_terminal_duration, p)
+                add_lobe(samples[row], frequency, p_end - p_terminal_duration, p_end, -p_terminal_depth)
+            else:
+                add_lobe(samples[row], frequency, p_start, p_end, p)
+            add_lobe(samples[row], frequency, onset, onset + third, q)
+            add_lobe(samples[row], frequency, onset + 0.5 * third, onset + 2.5 * third, r)
+            add_lobe(samples[row], frequency, onset + 2 * third, qrs_end, s)
+            add_lobe(samples[row], frequency, t_start, t_end, t)
+
+        # Ground truth boundaries in samples
+        qrs_complexes.append(to_samples(frequency, onset, onset + 1.5 * third, qrs_end))
+        t_waves.append(to_samples(frequency, qrs_end, (t_start + t_end) / 2, t_end))
+        if p_terminal_depth:
+            p_waves.append(to_samples(frequency, p_start, p_end - p_terminal_duration, p_end))
+            p_terminal_force.append(1000 * p_terminal_depth * 1000 * p_terminal_duration)
+        else:
+            p_waves.append(to_samples(frequency, p_start, (p_start + p_end) / 2, p_end))
+            p_terminal_force.append(0)
+
+    # Baseline wander of each lead, out of phase between leads
+    if wander:
+        time = numpy.arange(num_samples) / frequency
+        phases = rng.uniform(0, 2 * math.pi, (len(leads), 1))
+        samples += wander * numpy.sin(2 * math.pi * WANDER_FREQUENCY * time + phases)
+    if noise:
+        samples += rng.normal(0, noise, samples.shape)
+
+    ecg = ECG(frequency)
+    ecg.set_lead_matrix(leads, samples)
+    ecg.set_qrs_complexes(qrs_complexes)
+    ecg.set_t_waves(t_waves)
+    ecg.set_p_waves(p_waves)
+    ecg.set_p_terminal_force(p_terminal_force)
+
+    return ecg
+
+
+def add_lobe(samples, frequency, start, end, amplitude):
+    """ Adds a smooth lobe, a squared half sine wave, between two times (in sec) """
+
+    first = int(math.ceil(start * frequency))
+    last = min(int(end * frequency), len(samples) - 1)
+    if not amplitude or last < first:
+        return
+
+    time = numpy.arange(first, last + 1) / frequency
+    samples[first:last + 1] += amplitude * numpy.sin(math.pi * (time - start) / (end - start)) ** 2
+
+
+def to_samples(frequency, *times):
+    """ Converts times (in sec) to sample indices """
+
+    return tuple(int(round(time * frequency)) for time in times)
+
+
+def get_annotation(ecg):
+    """
+    Gets the boundaries and P-terminal force of an ECG as annotations read by filereader.
+    :param ecg: ECG object
+    :return: Dictionary of lists of QRS complexes, T-waves, P-waves, and P-terminal force
+    """
+
+    return {
+        "qrs": [list(boundary) for boundary in ecg.get_qrs_complexes()],
+        "twave": [list(boundary) for boundary in ecg.get_t_waves()],
+        "pwave": [list(boundary) for boundary in ecg.get_p_waves()],
+        "pterm": [float(pterm) for pterm in ecg.get_p_terminal_force()],
+    }
+
+
+def write_json(ecg, file_path, description="Synthetic ECG"):
+    """
+    Writes an ECG as a JSON file in the schema of the test data, with its boundaries as annotations.
+    :param ecg: ECG object
+    :param file_path: Path to JSON file
+    :param description: Description of the ECG
+    """
+
+    data = {"description": description, "frequency": ecg.get_frequency()}
+    for lead in ecg.get_available_leads():
+        data[lead.value.lower()] = [round(float(sample), 4) for sample in ecg.get_lead(lead)]
+    data["annotation"] = get_annotation(ecg)
+
+    with open(file_path, "w") as file:
+        json.dump(data, file)
+
+
+def write_muse(ecg, file_path, units_per_bit=MUSE_UNITS_PER_BIT):
+    """
+    Writes an ECG as a MUSE XML file with a rhythm waveform of base64 encoded 16-bit samples.
+    MUSE files do not hold annotations.
+    :param ecg: ECG object
+    :param file_path: Path to XML file
+    :param units_per_bit: Amplitude (in μV) of one unit of the samples
+    """
+
+    frequency = ecg.get_frequency()
+    with open(file_path, "w") as file:
+        file.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n<RestingECG>\n<Waveform>\n')
+        file.write("<WaveformType>Rhythm</WaveformType>\n")
+        file.write("<SampleBase>{:g}</SampleBase>\n".format(frequency))
+        for lead in ecg.get_available_leads():
+            units = numpy.clip(numpy.rint(ecg.get_lead(lead) * 1000 / units_per_bit), -32768, 32767)
+            encoded = base64.b64encode(units.astype("<i2").tobytes()).decode("ascii")
+            file.write("<LeadData>\n")
+            file.write("<LeadSampleCountTotal>{}</LeadSampleCountTotal>\n".format(len(units)))
+            file.write("<LeadAmplitudeUnitsPerBit>{:g}</LeadAmplitudeUnitsPerBit>\n".format(units_per_bit))
+            file.write("<LeadAmplitudeUnits>MICROVOLTS</LeadAmplitudeUnits>\n")
+            file.write("<LeadID>{}</LeadID>\n".format(lead.value))
+            file.write("<WaveFormData>{}</WaveFormData>\n".format(encoded))
+            file.write("</LeadData>\n")
+        file.write("</Waveform>\n</RestingECG>\n")
+
+
+def generate_corpus(directory, count, seconds=10, frequency=500, formats=("json",), seed=None):
+    """
+    Generates a corpus of synthetic ECGs with varied heart rate, variability, noise, baseline wander, and P-wave
+    morphology, and a file of the ground truth annotation of each ECG.
+    :param directory: Directory of the corpus, created if needed
+    :param count: Number of ECGs
+    :param seconds: Length of each ECG in seconds
+    :param frequency: Sampling frequency
+    :param formats: Iterable of file formats each ECG is written as, 'json', 'muse', and 'ecgb'
+    :param seed: Seed of the random number generator, default/None is unseeded
+    :return: Path to the annotations file, one JSON line per ECG file
+    """
+
+    writers = {
+        "json": (".json", write_json),
+        "muse": (".xml", write_muse),
+        "ecgb": (".ecgb", filereader.write_binary),
+    }
+
+    rng = numpy.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    annotations_path = path.join(directory, "annotations.jsonl")
+    with open(annotations_path, "w") as annotations:
+        for i in range(count):
+            # A third of the ECGs have a monophasic V1 P-wave
+            parameters = {
+                "heart_rate": float(rng.uniform(50, 100)),
+                "variability": float(rng.uniform(0, 0.08)),
+                "noise": float(rng.uniform(0, 0.02)),
+                "wander": float(rng.uniform(0, 0.2)),
+                "p_terminal_depth": float(rng.choice([0, rng.uniform(0.04, 0.15)], p=[1 / 3, 2 / 3])),
+                "p_terminal_duration": float(rng.uniform(0.03, 0.05)),
+            }
+            ecg = synthesize(seconds, frequency, seed=int(rng.integers(2**32)), **parameters)
+
+            for file_format in formats:
+                extension, write = writers[file_format]
+                name = "synthetic_{:06d}{}".format(i, extension)
+                write(ecg, path.join(directory, name))
+                annotations.write(json.dumps({"file": name, "parameters": parameters,
+                                              "annotation": get_annotation(ecg)}) + "\n")
+
+    return annotations_path
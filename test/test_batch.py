@@ -0,0 +1,68 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from batch import *
+from .testing import *
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, "cohort"))
+        shutil.copy(NORMAL_SINUS_RHYTHM, os.path.join(self.directory, "cohort"))
+        shutil.copy(BIPHASIC, os.path.join(self.directory, "cohort"))
+        with open(os.path.join(self.directory, "cohort", "malformed.xml"), "w") as file:
+            file.write("<RestingECG>")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_find_records_directory(self):
+        records = find_records(self.directory)
+
+        self.assertListEqual([os.path.basename(record) for record in records],
+                             ["biphasic.json", "malformed.xml", "nsr.json"])
+
+    def test_find_records_manifest(self):
+        manifest = os.path.join(self.directory, "manifest.txt")
+        with open(manifest, "w") as file:
+            file.write("# cohort\ncohort/nsr.json\n\n")
+
+        records = find_records(manifest)
+
+        self.assertListEqual(records, [os.path.join(self.directory, "cohort/nsr.json")])
+
+    def test_run_batch_csv(self):
+        output_path = os.path.join(self.directory, "results.csv")
+
+        analyzed, failed = run_batch(self.directory, output_path, workers=1, seconds=5)
+
+        self.assertEqual((analyzed, failed), (3, 1))
+        with open(output_path) as file:
+            rows = {os.path.basename(row["file"]): row for row in csv.DictReader(file)}
+        self.assertEqual(rows["nsr.json"]["beats"], "5")
+        self.assertEqual(len(rows["nsr.json"]["p_terminal_force"].split(";")), 4)
+        self.assertEqual(rows["nsr.json"]["error"], "")
+        self.assertNotEqual(rows["malformed.xml"]["error"], "")
+
+    def test_run_batch_ndjson(self):
+        output_path = os.path.join(self.directory, "results.ndjson")
+
+        run_batch(self.directory, output_path, workers=2, seconds=5)
+
+        with open(output_path) as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual(len(rows), 3)
+
+    def test_timeout(self):
+        row = analyze_record(NORMAL_SINUS_RHYTHM, seconds=60, timeout=0.001)
+
+        self.assertTrue(row["error"].startswith("TimeoutError"))
+
+
+if __name__ == '__main__':
+    unittest.main()
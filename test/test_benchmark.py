@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from benchmark.benchmark import *
+from .testing import *
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.results = run_benchmarks(lengths=(10,), frequencies=(500,), lead_counts=(1, 12), repeat=1)
+
+    def test_results(self):
+        stages = [result["stage"] for result in self.results["results"]]
+
+        self.assertEqual(len(stages), 2 * 9)
+        self.assertIn("determine_qrs", stages)
+        for result in self.results["results"]:
+            self.assertEqual(result["samples"] % (10 * 500), 0)
+            self.assertGreater(result["throughput"], 0)
+            self.assertGreaterEqual(result["peak_memory"], 0)
+
+    def test_recording(self):
+        ecg = make_recording(2.5, 250, 12)
+
+        self.assertEqual(ecg.get_lead_matrix().shape, (12, 625))
+        self.assertEqual(ecg.get_available_leads()[0], Lead.V1)
+
+    def test_save_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "baseline.json")
+            save_results(self.results, file_path)
+            baseline = load_results(file_path)
+
+        self.assertListEqual(compare_results(baseline, self.results), [])
+
+        # Halve the throughput and grow the peak memory of one stage
+        slower = copy_results(self.results)
+        slower["results"][0]["throughput"] /= 2
+        slower["results"][0]["peak_memory"] += 2 * MEMORY_FLOOR + 2 * slower["results"][0]["peak_memory"]
+        regressions = compare_results(baseline, slower)
+
+        self.assertListEqual([regression[4] for regression in regressions], ["throughput", "peak_memory"])
+
+
+def copy_results(results):
+    return dict(results, results=[dict(result) for result in results["results"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
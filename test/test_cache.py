@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from analysis import set_boundaries
+from cache.cache import *
+from dsp import singlelead
+from .testing import *
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, "nsr.json")
+        shutil.copy(NORMAL_SINUS_RHYTHM, self.file_path)
+        self.cache = ResultCache(os.path.join(self.directory, "cache"))
+
+        self.ecg = get_test_ecg(test_data=self.file_path)
+        set_boundaries(self.ecg)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_happy_path(self):
+        self.assertIsNone(self.cache.get(self.file_path, seconds=5))
+        self.cache.put(self.file_path, self.ecg, seconds=5)
+
+        ecg = get_test_ecg(test_data=self.file_path)
+        analyze = mock.Mock()
+        self.assertTrue(set_cached_boundaries(ecg, self.file_path, self.cache, analyze=analyze, seconds=5))
+
+        analyze.assert_not_called()
+        self.assertListEqual(ecg.get_qrs_complexes(), self.ecg.get_qrs_complexes())
+        self.assertListEqual(ecg.get_t_waves(), self.ecg.get_t_waves())
+        self.assertListEqual(ecg.get_p_waves(), [tuple(int(i) for i in p_wave) for p_wave in self.ecg.get_p_waves()])
+        self.assertListEqual(ecg.get_p_terminal_force(), [float(pterm) for pterm in self.ecg.get_p_terminal_force()])
+        self.assertListEqual(ecg.get_beats().get_p_deepest(), self.ecg.get_beats().get_p_deepest())
+
+    def test_miss_analyzes(self):
+        ecg = get_test_ecg(test_data=self.file_path)
+
+        self.assertFalse(set_cached_boundaries(ecg, self.file_path, self.cache, seconds=5))
+        self.assertListEqual(ecg.get_qrs_complexes(), self.ecg.get_qrs_complexes())
+        self.assertIsNotNone(self.cache.get(self.file_path, seconds=5))
+
+    def test_key(self):
+        self.cache.put(self.file_path, self.ecg, seconds=5)
+
+        # Options
+        self.assertIsNone(self.cache.get(self.file_path, seconds=10))
+
+        # Parameters
+        with mock.patch.object(singlelead, "BIPHASIC_FACTOR", 2.0):
+            self.assertIsNone(self.cache.get(self.file_path, seconds=5))
+
+        # Version
+        with mock.patch("cache.cache.VERSION", "test"):
+            self.assertIsNone(self.cache.get(self.file_path, seconds=5))
+
+        # File content
+        with open(self.file_path, "a") as file:
+            file.write(" ")
+        self.assertIsNone(self.cache.get(self.file_path, seconds=5))
+
+    def test_eviction(self):
+        self.cache.put(self.file_path, self.ecg, seconds=1)
+        entry_size = sum(entry.stat().st_size for entry in os.scandir(os.path.join(self.directory, "cache")))
+        cache = ResultCache(os.path.join(self.directory, "cache"), max_size=2.5 * entry_size)
+
+        cache.put(self.file_path, self.ecg, seconds=2)
+        os.utime(cache._entry(self.file_path, {"seconds": 2}), (0, 0))
+        cache.get(self.file_path, seconds=1)
+        cache.put(self.file_path, self.ecg, seconds=3)
+
+        # Least recently used is evicted
+        self.assertIsNone(cache.get(self.file_path, seconds=2))
+        self.assertIsNotNone(cache.get(self.file_path, seconds=1))
+        self.assertIsNotNone(cache.get(self.file_path, seconds=3))
+
+    def test_scans_once_full(self):
+        directory = os.path.join(self.directory, "cache")
+        self.cache.put(self.file_path, self.ecg, seconds=1)
+
+        # Puts within the maximum size only update the size estimate
+        with mock.patch("cache.cache.os.listdir", wraps=os.listdir) as listdir:
+            for seconds in range(2, 6):
+                self.cache.put(self.file_path, self.ecg, seconds=seconds)
+        self.assertEqual(listdir.call_count, 0)
+
+        # Once over the maximum size, enough results are evicted that the next put does not scan again
+        entry_size = os.stat(self.cache._entry(self.file_path, {"seconds": 1})).st_size
+        cache = ResultCache(directory, max_size=10.5 * entry_size)
+        with mock.patch("cache.cache.os.listdir", wraps=os.listdir) as listdir:
+            for seconds in range(6, 13):
+                cache.put(self.file_path, self.ecg, seconds=seconds)
+        self.assertEqual(listdir.call_count, 1)
+        self.assertEqual(len(os.listdir(directory)), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
 
+import numpy
+from scipy.stats import linregress
+
 from dsp.dsp import *
 from ecg import Lead
 from .testing import *
@@ -40,6 +43,39 @@ class TestDerivativeFilter(unittest.TestCase):
         self.assertEqual(len(derivative), len(samples))
         self.assertListEqual(list(derivative), exp_derivative)
 
+    def test_matches_linear_regression(self):
+        samples = get_test_ecg().get_lead(Lead.V1)
+        window = 2
+        x = range(2 * window + 1)
+        exp_derivative = [linregress(x, samples[i-window:i+window+1]).slope
+                          for i in range(window, len(samples) - window)]
+
+        derivative = derivative_filter(samples, window)
+
+        self.assertEqual(len(derivative), len(samples))
+        numpy.testing.assert_allclose(derivative[window:-window], exp_derivative, atol=1e-12)
+        self.assertListEqual(list(derivative[:window]), [derivative[window]] * window)
+        self.assertListEqual(list(derivative[-window:]), [derivative[-(window+1)]] * window)
+
+    def test_multiple_leads(self):
+        ecg = get_test_ecg()
+        leads = numpy.array([ecg.get_lead(Lead.V1), ecg.get_lead(Lead.V5)])
+
+        derivative = derivative_filter(leads, window=4)
+
+        self.assertEqual(derivative.shape, leads.shape)
+        for i in range(len(leads)):
+            numpy.testing.assert_array_equal(derivative[i], derivative_filter(leads[i], window=4))
+
+    def test_fused_with_bandpass_filter(self):
+        ecg = get_test_ecg()
+        samples = ecg.get_lead(Lead.V1)
+
+        filtered, derivative = bandpass_filter(samples, ecg.get_frequency(), with_derivative=True)
+
+        numpy.testing.assert_array_equal(filtered, bandpass_filter(samples, ecg.get_frequency()))
+        numpy.testing.assert_array_equal(derivative, derivative_filter(filtered))
+
 
 class TestSquaring(unittest.TestCase):
     def test_happy_path_unsigned(self):
@@ -62,6 +98,15 @@ class TestSquaring(unittest.TestCase):
         for i in range(len(samples)):
             self.assertEqual(squared[i], -1*samples[i]**2)
 
+    def test_multiple_leads_with_buffer(self):
+        samples = numpy.array([[-3, -1, 0, 2], [4, -5, 6, -7]])
+        out = numpy.empty(samples.shape)
+
+        squared = squaring(samples, signed=True, out=out)
+
+        self.assertIs(squared, out)
+        numpy.testing.assert_array_equal(squared, [[-9, -1, 0, 4], [16, -25, 36, -49]])
+
 
 class TestMovingAverage(unittest.TestCase):
     def test_happy_path(self):
@@ -72,6 +117,28 @@ class TestMovingAverage(unittest.TestCase):
         self.assertEqual(len(moving_avg), len(samples))
         self.assertListEqual(list(moving_avg), samples)
 
+    def test_edge_weighting(self):
+        samples = get_test_ecg().get_lead(Lead.V1)
+        width = 120
+        padded = [samples[0]] * width + list(samples)
+        exp_avg = [sum(padded[i:i+width]) / width for i in range(len(samples))]
+
+        moving_avg = moving_average(samples, width)
+
+        self.assertEqual(len(moving_avg), len(samples))
+        numpy.testing.assert_allclose(moving_avg, exp_avg, atol=1e-12)
+
+    def test_multiple_leads_with_buffer(self):
+        ecg = get_test_ecg()
+        leads = numpy.array([ecg.get_lead(Lead.V1), ecg.get_lead(Lead.V5)])
+        out = numpy.empty(leads.shape)
+
+        moving_avg = moving_average(leads, 50, out=out)
+
+        self.assertIs(moving_avg, out)
+        for i in range(len(leads)):
+            numpy.testing.assert_array_equal(moving_avg[i], moving_average(leads[i], 50))
+
 
 class TestGetPeak(unittest.TestCase):
     wave = [-3, -2, 0, 1, 2, 3, 2, 0, -3]
@@ -105,5 +172,25 @@ class TestGetPeak(unittest.TestCase):
         self.assertEqual(peak, exp_peak)
 
 
+class TestFindPeak(unittest.TestCase):
+    def test_matches_get_peak(self):
+        samples = [0, 1, 1, 3, 2, 2, 5, 5, 4, 0, 0, 1, 3, 3, 3, 1]
+        edges = get_edges(samples)
+
+        for index in range(len(samples)):
+            self.assertEqual(find_peak(samples, index, edges), get_peak(samples, index))
+
+
+class TestFirstAbove(unittest.TestCase):
+    def test_happy_path(self):
+        samples = numpy.zeros(5000)
+        samples[[10, 3000]] = 1
+
+        self.assertEqual(first_above(samples, 0.5, 0), 10)
+        self.assertEqual(first_above(samples, 0.5, 11), 3000)
+        self.assertIsNone(first_above(samples, 0.5, 11, stop=3000))
+        self.assertIsNone(first_above(samples, 1, 0))
+
+
 if __name__ == '__main__':
     unittest.main()
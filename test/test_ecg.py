@@ -0,0 +1,156 @@
+import unittest
+
+import numpy
+
+from dsp.dsp import *
+from ecg import ECG, Lead, BeatTable, BEAT_DTYPE, NO_INDEX, P_WAVE, T_WAVE
+from ecg import beattable
+from .testing import *
+
+
+class TestLeadMatrix(unittest.TestCase):
+    def setUp(self):
+        self.ecg = ECG(1000)
+        self.ecg.set_lead(Lead.I, [1, 2, 3, 4])
+        self.ecg.set_lead(Lead.V1, [5, 6, 7, 8])
+
+    def test_happy_path(self):
+        matrix = self.ecg.get_lead_matrix()
+
+        self.assertTrue(matrix.flags.c_contiguous)
+        numpy.testing.assert_array_equal(matrix, [[1, 2, 3, 4], [5, 6, 7, 8]])
+        self.assertListEqual(self.ecg.get_available_leads(), [Lead.I, Lead.V1])
+        self.assertEqual(len(self.ecg), 2)
+
+    def test_lead_is_view(self):
+        lead = self.ecg.get_lead(Lead.V1)
+
+        self.assertTrue(numpy.shares_memory(lead, self.ecg.get_lead_matrix()))
+        numpy.testing.assert_array_equal(lead, [5, 6, 7, 8])
+
+    def test_replace_lead(self):
+        self.ecg.set_lead(Lead.I, [0, 0, 0, 0])
+
+        numpy.testing.assert_array_equal(self.ecg.get_lead_matrix(), [[0, 0, 0, 0], [5, 6, 7, 8]])
+
+    def test_mismatched_length(self):
+        with self.assertRaises(ValueError):
+            self.ecg.set_lead(Lead.V2, [1, 2, 3])
+
+    def test_padded_length(self):
+        self.ecg.set_lead(Lead.V2, [1, 2, 3], pad=True)
+        self.ecg.set_lead(Lead.V3, [1, 2, 3, 4, 5], pad=True)
+
+        numpy.testing.assert_array_equal(
+            self.ecg.get_lead_matrix(),
+            [[1, 2, 3, 4, 4], [5, 6, 7, 8, 8], [1, 2, 3, 3, 3], [1, 2, 3, 4, 5]],
+        )
+
+
+class TestProcessedLeads(unittest.TestCase):
+    def setUp(self):
+        self.ecg = get_test_ecg()
+        self.samples = self.ecg.get_lead(Lead.V1)
+        self.frequency = self.ecg.get_frequency()
+
+    def test_happy_path(self):
+        filtered = self.ecg.get_filtered_lead(Lead.V1)
+        derivative = self.ecg.get_derivative(Lead.V1)
+        squared = self.ecg.get_squared_derivative(Lead.V1)
+
+        numpy.testing.assert_array_equal(filtered, bandpass_filter(self.samples, self.frequency))
+        numpy.testing.assert_array_equal(derivative, derivative_filter(filtered))
+        numpy.testing.assert_array_equal(squared, squaring(derivative))
+
+    def test_memoized(self):
+        filtered = self.ecg.get_filtered_lead(Lead.V1)
+
+        self.assertIs(self.ecg.get_filtered_lead(Lead.V1), filtered)
+        self.assertFalse(filtered.flags.writeable)
+
+    def test_invalidated_by_set_lead(self):
+        filtered = self.ecg.get_filtered_lead(Lead.V1)
+        other = self.ecg.get_filtered_lead(Lead.V5)
+
+        self.ecg.set_lead(Lead.V1, self.samples * 2)
+
+        self.assertIsNot(self.ecg.get_filtered_lead(Lead.V1), filtered)
+        self.assertIs(self.ecg.get_filtered_lead(Lead.V5), other)
+        numpy.testing.assert_allclose(self.ecg.get_filtered_lead(Lead.V1), filtered * 2)
+
+    def test_invalidated_by_set_frequency(self):
+        filtered = self.ecg.get_filtered_lead(Lead.V1)
+
+        self.ecg.set_frequency(self.frequency / 2)
+
+        self.assertIsNot(self.ecg.get_filtered_lead(Lead.V1), filtered)
+
+    def test_all_leads(self):
+        derivatives = self.ecg.get_derivatives()
+        squared = self.ecg.get_squared_derivatives()
+
+        self.assertEqual(derivatives.shape, self.ecg.get_lead_matrix().shape)
+        for i, lead in enumerate(self.ecg.get_available_leads()):
+            numpy.testing.assert_allclose(derivatives[i], self.ecg.get_derivative(lead))
+            self.assertTrue(numpy.shares_memory(self.ecg.get_squared_derivative(lead), squared))
+
+    def test_missing_lead(self):
+        with self.assertRaises(KeyError):
+            self.ecg.get_filtered_lead(Lead.AVR)
+
+
+class TestBeatTable(unittest.TestCase):
+    def setUp(self):
+        self.qrs = [(100, 140), (600, 640), (1100, 1140)]
+        self.t_waves = [(160, 300), (660, 800)]
+        self.p_waves = [(500, 540, 580), (1000, 1060)]
+        self.beats = BeatTable.from_boundaries(self.qrs, self.t_waves, self.p_waves, [1500.0, 0.0])
+
+    def test_happy_path(self):
+        beats = self.beats.get_array()
+
+        self.assertEqual(beats.dtype, BEAT_DTYPE)
+        numpy.testing.assert_array_equal(beats["t_end"], [300, 800, NO_INDEX])
+        numpy.testing.assert_array_equal(beats["p_mid"], [NO_INDEX, 540, NO_INDEX])
+        numpy.testing.assert_array_equal(beats["flags"], [T_WAVE, T_WAVE | P_WAVE | beattable.BIPHASIC, P_WAVE])
+        self.assertListEqual(self.beats.get_qrs_complexes(), self.qrs)
+        self.assertListEqual(self.beats.get_t_waves(), self.t_waves)
+        self.assertListEqual(self.beats.get_p_waves(), self.p_waves)
+        self.assertListEqual(self.beats.get_p_terminal_force(), [1500.0, 0.0])
+
+    def test_slice_is_view(self):
+        beats = self.beats[1:]
+        beats["ptf"][0] = 2000
+
+        self.assertEqual(len(beats), 2)
+        self.assertEqual(self.beats["ptf"][1], 2000)
+
+    def test_between(self):
+        beats = self.beats.between(500, 1100)
+
+        self.assertListEqual(beats.get_qrs_complexes(), [(600, 640)])
+        self.assertTrue(numpy.shares_memory(beats.get_array(), self.beats.get_array()))
+        self.assertEqual(len(self.beats.between(2000, 3000)), 0)
+
+    def test_unmatched_waves(self):
+        beats = BeatTable.from_boundaries(self.qrs[1:], [(10, 50)], [(1200, 1250)])
+
+        self.assertListEqual(beats.get_t_waves(), [])
+        self.assertListEqual(beats.get_p_waves(), [])
+
+    def test_ecg(self):
+        ecg = ECG(500)
+        ecg.set_beats(self.beats)
+
+        self.assertIs(ecg.get_beats(), self.beats)
+        self.assertListEqual(ecg.get_p_waves(), self.p_waves)
+
+        # Setting a list replaces the table, keeping the other lists
+        ecg.set_qrs_complexes(self.qrs[:2])
+        self.assertListEqual(ecg.get_t_waves(), self.t_waves)
+        self.assertListEqual(ecg.get_beats().get_qrs_complexes(), self.qrs[:2])
+        self.assertListEqual(ecg.get_beats().get_p_waves(), self.p_waves[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
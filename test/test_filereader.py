@@ -0,0 +1,195 @@
+import base64
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from filereader.binary import *
+from filereader.filereader import *
+from ecg import ECG, Lead
+
+
+def encode_base64(samples):
+    return base64.b64encode(numpy.asarray(samples, dtype="<i2").tobytes()).decode("ascii")
+
+
+def muse_waveform(waveform_type, frequency, leads, units_per_bit=4.88):
+    lead_data = ""
+    for lead, samples in leads.items():
+        lead_data += (
+            "<LeadData>"
+            f"<LeadAmplitudeUnitsPerBit>{units_per_bit}</LeadAmplitudeUnitsPerBit>"
+            "<LeadAmplitudeUnits>MICROVOLTS</LeadAmplitudeUnits>"
+            f"<LeadID>{lead.value}</LeadID>"
+            f"<WaveFormData>{encode_base64(samples)}</WaveFormData>"
+            "</LeadData>"
+        )
+    return (
+        "<Waveform>"
+        f"<WaveformType>{waveform_type}</WaveformType>"
+        f"<SampleBase>{frequency}</SampleBase>"
+        f"{lead_data}"
+        "</Waveform>"
+    )
+
+
+class TestDecodeBase64(unittest.TestCase):
+    samples = [0, 1, -1, 32767, -32768, 250, -250]
+
+    def test_happy_path(self):
+        decoded = decode_base64(encode_base64(self.samples))
+
+        self.assertEqual(decoded.dtype, numpy.dtype("<i2"))
+        self.assertListEqual(list(decoded), self.samples)
+
+    def test_line_breaks(self):
+        encoded = encode_base64(self.samples)
+        encoded = "\n".join(encoded[i:i+4] for i in range(0, len(encoded), 4))
+
+        decoded = decode_base64(encoded)
+
+        self.assertListEqual(list(decoded), self.samples)
+
+    def test_length(self):
+        for length in range(len(self.samples) + 2):
+            decoded = decode_base64(encode_base64(self.samples), length)
+
+            self.assertListEqual(list(decoded), self.samples[:length])
+
+
+class TestMuse(unittest.TestCase):
+    frequency = 500
+
+    def setUp(self):
+        self.leads = {
+            Lead.I: numpy.arange(-500, 500, dtype="<i2"),
+            Lead.V1: numpy.arange(500, -500, -1, dtype="<i2"),
+            Lead.AVL: numpy.zeros(1000, dtype="<i2"),
+        }
+        self.median = {lead: samples[:self.frequency] + 1 for lead, samples in self.leads.items()}
+        with tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False) as file:
+            file.write("<RestingECG><PatientDemographics><PatientID>0</PatientID></PatientDemographics>")
+            file.write(muse_waveform(MUSE_MEDIAN, self.frequency, self.median))
+            file.write(muse_waveform(MUSE_RHYTHM, self.frequency, self.leads))
+            file.write("</RestingECG>")
+        self.file_path = file.name
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def test_happy_path(self):
+        ecg = read_file(self.file_path, waveform_type=MUSE_RHYTHM)
+
+        self.assertEqual(ecg.get_frequency(), self.frequency)
+        self.assertEqual(len(ecg), len(self.leads))
+        for lead, samples in self.leads.items():
+            numpy.testing.assert_allclose(ecg.get_lead(lead), samples * 0.00488)
+
+    def test_first_waveform(self):
+        ecg = read_file(self.file_path)
+
+        for lead, samples in self.median.items():
+            numpy.testing.assert_allclose(ecg.get_lead(lead), samples * 0.00488)
+
+    def test_seconds(self):
+        ecg = read_file(self.file_path, seconds=0.5, waveform_type=MUSE_RHYTHM)
+
+        for lead, samples in self.leads.items():
+            numpy.testing.assert_allclose(ecg.get_lead(lead), samples[:250] * 0.00488)
+
+    def test_lead_selection(self):
+        ecg = read_file(self.file_path, leads=[Lead.V1], waveform_type=MUSE_RHYTHM)
+
+        self.assertEqual(len(ecg), 1)
+        numpy.testing.assert_allclose(ecg.get_lead(Lead.V1), self.leads[Lead.V1] * 0.00488)
+
+    def test_missing_waveform(self):
+        with self.assertRaises(Exception):
+            read_file(self.file_path, waveform_type="Unknown")
+
+    def test_binary_lossless(self):
+        ecg = read_file(self.file_path, waveform_type=MUSE_RHYTHM)
+        binary_path = self.file_path + ".ecgb"
+        try:
+            write_binary(ecg, binary_path)
+            samples, scale = read_file(binary_path).get_raw_matrix()
+        finally:
+            os.remove(binary_path)
+
+        # Stored units of the source are written as they are
+        self.assertAlmostEqual(scale, 0.00488)
+        for row, source in zip(samples, self.leads.values()):
+            numpy.testing.assert_array_equal(row, source)
+
+
+class TestBinary(unittest.TestCase):
+    frequency = 500
+
+    def setUp(self):
+        self.ecg = ECG(self.frequency)
+        self.ecg.set_lead(Lead.V1, numpy.sin(numpy.arange(1000) / 50))
+        self.ecg.set_lead(Lead.I, numpy.linspace(-2, 2, 1000))
+        self.ecg.set_qrs_complexes([(10, 60), (510, 560)])
+        self.ecg.set_p_waves([(400, 450, 490)])
+        self.ecg.set_p_terminal_force([812.5])
+
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, "ecg.ecgb")
+
+    def tearDown(self):
+        for file in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file))
+        os.rmdir(self.directory)
+
+    def assert_samples(self, ecg, seconds=None):
+        length = int(self.frequency * seconds) if seconds else None
+        for lead in ecg.get_available_leads():
+            numpy.testing.assert_allclose(ecg.get_lead(lead), self.ecg.get_lead(lead)[:length], atol=2 / SAMPLE_MAX)
+
+    def test_happy_path(self):
+        write_binary(self.ecg, self.file_path)
+        ecg = read_file(self.file_path)
+
+        self.assertIsInstance(ecg.get_raw_matrix()[0], numpy.memmap)
+        self.assertEqual(ecg.get_frequency(), self.frequency)
+        self.assertListEqual(ecg.get_available_leads(), [Lead.V1, Lead.I])
+        self.assertListEqual(ecg.get_qrs_complexes(), self.ecg.get_qrs_complexes())
+        self.assertListEqual(ecg.get_p_waves(), self.ecg.get_p_waves())
+        self.assertListEqual(ecg.get_p_terminal_force(), self.ecg.get_p_terminal_force())
+        self.assert_samples(ecg)
+
+    def test_compression(self):
+        uncompressed = os.path.join(self.directory, "uncompressed.ecgb")
+        write_binary(self.ecg, uncompressed)
+        write_binary(self.ecg, self.file_path, compress=True)
+        ecg = read_file(self.file_path)
+
+        self.assertLess(os.path.getsize(self.file_path), os.path.getsize(uncompressed))
+        self.assert_samples(ecg)
+
+    def test_rewrite_scaled(self):
+        write_binary(self.ecg, self.file_path)
+        rewritten = os.path.join(self.directory, "rewritten.ecgb")
+        write_binary(read_file(self.file_path), rewritten)
+
+        with open(self.file_path, "rb") as file, open(rewritten, "rb") as rewritten_file:
+            self.assertEqual(file.read(), rewritten_file.read())
+
+    def test_seconds_and_lead_selection(self):
+        write_binary(self.ecg, self.file_path)
+        ecg = read_file(self.file_path, seconds=0.5, leads=[Lead.I])
+
+        self.assertListEqual(ecg.get_available_leads(), [Lead.I])
+        self.assert_samples(ecg, seconds=0.5)
+
+    def test_not_binary(self):
+        with open(self.file_path, "w") as file:
+            file.write("<RestingECG></RestingECG>")
+
+        with self.assertRaises(Exception):
+            read_file(self.file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
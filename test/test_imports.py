@@ -0,0 +1,45 @@
+import os.path as path
+import subprocess
+import sys
+import unittest
+
+
+# Maximum seconds to import the modules needed for headless analysis
+IMPORT_TIME_BUDGET = 1.0
+
+# Modules only imported once they are needed
+LAZY_MODULES = ("matplotlib", "scipy", "xml.etree.ElementTree")
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import main, analysis, batch, display, dsp, ecg, filereader
+print(time.perf_counter() - start)
+print(" ".join(sys.modules))
+"""
+
+
+def run_import_script():
+    root = path.dirname(path.dirname(path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=root, capture_output=True, text=True,
+                            check=True).stdout
+    seconds, modules = output.splitlines()
+    return float(seconds), modules.split()
+
+
+class TestImports(unittest.TestCase):
+    def test_import_time_budget(self):
+        # Best of several runs so that a busy machine does not fail the check
+        seconds = min(run_import_script()[0] for _ in range(3))
+
+        self.assertLessEqual(seconds, IMPORT_TIME_BUDGET, "Import time exceeded budget")
+
+    def test_lazy_imports(self):
+        _, modules = run_import_script()
+
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules, "{} imported before it is needed".format(module))
+
+
+if __name__ == '__main__':
+    unittest.main()
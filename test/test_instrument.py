@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from analysis import Pipeline, set_boundaries
+from batch import run_batch
+from instrument import *
+from .testing import *
+
+
+class TestInstrument(unittest.TestCase):
+    def tearDown(self):
+        stop_recording()
+
+    def test_not_recording(self):
+        with stage("test"):
+            count("test")
+
+        self.assertFalse(is_recording())
+        self.assertIsNone(stop_recording())
+
+    def test_stage(self):
+        start_recording()
+        for _ in range(2):
+            with stage("outer"):
+                with stage("inner"):
+                    data = bytearray(2**20)
+                del data
+        count("test")
+        count("test", 2)
+        record = stop_recording()
+
+        self.assertFalse(is_recording())
+        self.assertEqual(record["stages"]["outer"]["calls"], 2)
+        self.assertEqual(record["counters"]["test"], 3)
+        self.assertGreaterEqual(record["stages"]["outer"]["wall"], record["stages"]["inner"]["wall"])
+
+        # Peak memory of a stage includes the peak of the stages it encloses
+        self.assertGreaterEqual(record["stages"]["inner"]["peak_memory"], 2**20)
+        self.assertGreaterEqual(record["stages"]["outer"]["peak_memory"], record["stages"]["inner"]["peak_memory"])
+
+    def test_without_memory(self):
+        start_recording(trace_memory=False)
+        with stage("test"):
+            pass
+        record = stop_recording()
+
+        self.assertIsNone(record["stages"]["test"]["peak_memory"])
+
+    def test_set_boundaries(self):
+        ecg = get_test_ecg()
+
+        start_recording()
+        set_boundaries(ecg)
+        record = stop_recording()
+
+        for name in ("filter", "qrs_detect", "qrs_consensus", "t_wave", "p_wave", "ptf"):
+            self.assertEqual(record["stages"][name]["calls"], 1)
+        json.dumps(record)
+
+    def test_pipeline(self):
+        start_recording()
+        Pipeline()(get_test_ecg())
+        record = stop_recording()
+
+        for name in ("filter", "qrs_detect", "qrs_consensus", "t_wave", "p_wave", "ptf"):
+            self.assertEqual(record["stages"][name]["calls"], 1)
+
+    def test_aggregate(self):
+        records = [{"stages": {"test": {"calls": 1, "wall": float(i), "cpu": float(i), "peak_memory": None}},
+                    "counters": {"test": i}} for i in range(101)]
+        records.append({"stages": {}, "counters": {}})
+
+        result = aggregate(records, percentiles=(50, 100))
+
+        self.assertEqual(result["records"], 102)
+        self.assertEqual(result["stages"]["test"]["wall"], {"p50": 49.5, "p100": 100.0})
+        self.assertEqual(result["stages"]["test"]["peak_memory"], {"p50": 0.0, "p100": 0.0})
+        self.assertEqual(result["counters"]["test"]["p100"], 100.0)
+
+    def test_run_batch(self):
+        directory = tempfile.mkdtemp()
+        try:
+            shutil.copy(NORMAL_SINUS_RHYTHM, directory)
+            instrument_path = os.path.join(directory, "instrumentation.json")
+
+            run_batch(directory, os.path.join(directory, "results.csv"), workers=1, seconds=5,
+                      instrument_path=instrument_path)
+
+            with open(instrument_path) as file:
+                result = json.load(file)
+            self.assertEqual(result["records"], 1)
+            self.assertIn("p99", result["stages"]["read"]["wall"])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
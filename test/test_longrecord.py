@@ -0,0 +1,48 @@
+import tracemalloc
+import unittest
+
+from analysis import set_boundaries, set_long_boundaries
+from analysis.longrecord import BYTES_PER_SAMPLE
+from .testing import *
+
+
+class TestLongRecord(unittest.TestCase):
+    # ACCEPTABLE_INACCURACY is the allowable percent difference between windowed and whole recording P-terminal force
+    ACCEPTABLE_INACCURACY = 0.001
+
+    def setUp(self):
+        self.ecg = get_test_ecg(seconds=60)
+        self.expected = get_test_ecg(seconds=60)
+        set_boundaries(self.expected)
+
+        # Memory limit of 40 second windows, so the recording spans several seams
+        self.memory_limit = 40 * self.ecg.get_frequency() * BYTES_PER_SAMPLE * len(self.ecg)
+
+    def test_matches_whole_recording(self):
+        set_long_boundaries(self.ecg, memory_limit=self.memory_limit)
+
+        self.assertEqual(self.expected.get_qrs_complexes(), self.ecg.get_qrs_complexes())
+        self.assertEqual(self.expected.get_t_waves(), self.ecg.get_t_waves())
+        self.assertEqual(self.expected.get_p_waves(), self.ecg.get_p_waves())
+        self.assertLessEqual(
+            measurement_accuracy(self.expected.get_p_terminal_force(), self.ecg.get_p_terminal_force()),
+            self.ACCEPTABLE_INACCURACY,
+        )
+
+    def test_memory_limit(self):
+        set_long_boundaries(self.ecg, memory_limit=self.memory_limit)  # imports and caches outside of measurement
+
+        tracemalloc.start()
+        set_long_boundaries(self.ecg, memory_limit=self.memory_limit)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertLessEqual(peak, self.memory_limit)
+
+    def test_memory_limit_too_small(self):
+        with self.assertRaises(ValueError):
+            set_long_boundaries(self.ecg, memory_limit=2**20)
+
+
+if __name__ == '__main__':
+    unittest.main()
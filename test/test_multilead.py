@@ -29,6 +29,17 @@ class TestBoundary(unittest.TestCase):
             "Determined QRS boundary outside of acceptable range",
         )
     
+    def test_determine_qrs_precomputed(self):
+        exp = determine_qrs(self.ecg.get_all_leads(), self.ecg.get_frequency())
+        got = determine_qrs(
+            self.ecg.get_all_leads(),
+            self.ecg.get_frequency(),
+            derivatives=self.ecg.get_derivatives(),
+            squared=self.ecg.get_squared_derivatives(),
+        )
+
+        self.assertListEqual(exp, got)
+
     def test_determine_t_waves(self):
         exp = self.ecg.get_t_waves()[:-1]  # Only expect T-waves between QRS complexes
         got = determine_t_waves(
@@ -49,5 +60,31 @@ class TestBoundary(unittest.TestCase):
         )
 
 
+class TestBuildConsensus(unittest.TestCase):
+    def test_happy_path(self):
+        boundaries = [(10, 20), (12, 22), (15, 18), (40, 50), (60, 70), (65, 75)]
+
+        consensus = build_consensus(boundaries, 2)
+
+        self.assertListEqual(consensus, [(12, 20), (65, 70)])
+
+    def test_adjacent_boundaries(self):
+        boundaries = [(10, 20), (21, 30), (10, 30)]
+
+        consensus = build_consensus(boundaries, 2)
+
+        self.assertListEqual(consensus, [(10, 30)])
+
+    def test_refactory_period(self):
+        boundaries = [(10, 20), (10, 20), (25, 30), (25, 30), (35, 40), (35, 40), (100, 110), (100, 110)]
+
+        consensus = build_consensus(boundaries, 2, refactory_period=30)
+
+        self.assertListEqual(consensus, [(10, 40), (100, 110)])
+
+    def test_no_boundaries(self):
+        self.assertListEqual(build_consensus([], 1), [])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from analysis import set_boundaries, set_parallel_boundaries
+from analysis.parallel import drop_duplicates
+from .testing import *
+
+
+class TestParallel(unittest.TestCase):
+    # Segment length (in sec) placing seams through QRS complexes of the test data
+    SEGMENT_LENGTH = 10.3
+
+    def setUp(self):
+        self.expected = get_test_ecg(seconds=40)
+        set_boundaries(self.expected)
+
+    def assert_matches(self, ecg):
+        self.assertEqual(self.expected.get_qrs_complexes(), ecg.get_qrs_complexes())
+        self.assertEqual(self.expected.get_t_waves(), ecg.get_t_waves())
+        self.assertEqual(self.expected.get_p_waves(), ecg.get_p_waves())
+        self.assertLessEqual(measurement_accuracy(self.expected.get_p_terminal_force(), ecg.get_p_terminal_force()),
+                             0.001)
+        self.assertEqual(self.expected.get_beats().get_p_deepest(), ecg.get_beats().get_p_deepest())
+
+    def test_single_process(self):
+        ecg = get_test_ecg(seconds=40)
+        set_parallel_boundaries(ecg, workers=1, segment_length=self.SEGMENT_LENGTH)
+        self.assert_matches(ecg)
+
+    def test_process_pool(self):
+        ecg = get_test_ecg(seconds=40)
+        set_parallel_boundaries(ecg, workers=2, segment_length=self.SEGMENT_LENGTH)
+        self.assert_matches(ecg)
+
+
+class TestDropDuplicates(unittest.TestCase):
+    def test_every_duplicate(self):
+        # Two beats either side of the seam at 1000 are found by both segments, one of them with a shifted onset
+        previous_qrs = [(500, 540), (940, 980), (1010, 1060)]
+        qrs = [(945, 985), (1000, 1060), (1500, 1540)]
+        previous_owned = [True, True, True]
+        owned = [True, True, True]
+
+        drop_duplicates(previous_qrs, previous_owned, qrs, owned, 1000, 100)
+
+        # Kept from the segment whose core holds the onset
+        self.assertEqual(previous_owned, [True, True, False])
+        self.assertEqual(owned, [False, True, True])
+
+    def test_no_duplicates(self):
+        previous_owned = [True, True]
+        owned = [True, True]
+
+        drop_duplicates([(500, 540), (800, 840)], previous_owned, [(1100, 1140), (1400, 1440)], owned, 1000, 100)
+
+        self.assertEqual(previous_owned, [True, True])
+        self.assertEqual(owned, [True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
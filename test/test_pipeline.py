@@ -0,0 +1,104 @@
+import unittest
+
+import numpy
+
+from analysis import Pipeline, PipelineResult, set_boundaries
+import dsp
+from analysis.pipeline import BufferPool
+from ecg import ECG, BeatTable, Lead
+from .testing import *
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = Pipeline()
+
+    def assertMatchesWhole(self, ecg, seconds):
+        expected = get_test_ecg(seconds=seconds)
+        set_boundaries(expected)
+
+        self.assertEqual(expected.get_qrs_complexes(), ecg.get_qrs_complexes())
+        self.assertEqual(expected.get_t_waves(), ecg.get_t_waves())
+        self.assertEqual(expected.get_p_waves(), ecg.get_p_waves())
+        self.assertEqual(expected.get_p_terminal_force(), ecg.get_p_terminal_force())
+
+    def test_matches_set_boundaries(self):
+        ecg = get_test_ecg(seconds=10)
+        result = self.pipeline(ecg)
+
+        self.assertIsInstance(result, PipelineResult)
+        self.assertIs(ecg.get_beats(), result.beats)
+        self.assertMatchesWhole(ecg, 10)
+
+    def test_reuses_buffers(self):
+        self.pipeline(get_test_ecg(seconds=10))
+        size = self.pipeline.get_pool().get_size()
+
+        # Shorter records fit the buffers of the first, and results do not depend on what the buffers held
+        ecg = get_test_ecg(seconds=5)
+        first = self.pipeline.run(ecg)
+        self.pipeline(ecg)
+        self.pipeline(get_test_ecg(seconds=8))
+
+        self.assertEqual(size, self.pipeline.get_pool().get_size())
+        self.assertMatchesWhole(ecg, 5)
+        self.assertEqual(first.beats.get_p_waves(), ecg.get_p_waves())
+
+    def test_stages(self):
+        pipeline = Pipeline(stages=("qrs", "t_wave"))
+        result = pipeline(get_test_ecg(seconds=5))
+
+        self.assertGreater(len(result.beats), 0)
+        self.assertGreater(len(result.beats.get_t_waves()), 0)
+        self.assertEqual(result.beats.get_p_waves(), [])
+        self.assertIsNone(result.median_p_terminal_force)
+
+        with self.assertRaises(ValueError):
+            Pipeline(stages=("qrs", "ptf"))
+        with self.assertRaises(ValueError):
+            Pipeline(stages=("u_wave",))
+
+    def test_leads(self):
+        pipeline = Pipeline(leads=[Lead.I, Lead.II, Lead.V1])
+        result = pipeline(get_test_ecg(seconds=5))
+
+        self.assertGreater(len(result.beats.get_p_waves()), 0)
+
+        # Consensus of limb leads, with P-waves still found and measured in V1
+        ecg = get_test_ecg(seconds=5)
+        Pipeline(leads=[Lead.I, Lead.II, Lead.III])(ecg)
+        expected = BeatTable.from_boundaries(ecg.get_qrs_complexes(), ecg.get_t_waves())
+        frequency = ecg.get_frequency()
+        dsp.p_wave_boundaries(expected, None, ecg.get_lead(Lead.V1), frequency, derived=ecg.get_derivative(Lead.V1))
+        dsp.pterm_measurements(ecg.get_filtered_lead(Lead.V1), frequency, expected)
+
+        self.assertGreater(len(ecg.get_p_waves()), 0)
+        self.assertEqual(expected.get_p_waves(), ecg.get_p_waves())
+        self.assertEqual(expected.get_p_terminal_force(), ecg.get_p_terminal_force())
+        with self.assertRaises(KeyError):
+            ecg = ECG(500)
+            ecg.set_lead(Lead.I, get_test_ecg(seconds=5).get_lead(Lead.I))
+            self.pipeline(ecg)
+
+    def test_frequency(self):
+        with self.assertRaises(ValueError):
+            Pipeline(frequency=250)(get_test_ecg(seconds=5))
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_get(self):
+        pool = BufferPool()
+        first = pool.get("a", (2, 100))
+        second = pool.get("a", (2, 90))
+
+        self.assertEqual(second.shape, (2, 90))
+        self.assertTrue(second.flags.c_contiguous)
+        self.assertTrue(numpy.shares_memory(first, second))
+
+        # Larger requests grow the buffer with room to spare
+        third = pool.get("a", (2, 200))
+        self.assertFalse(numpy.shares_memory(first, third))
+        self.assertGreaterEqual(pool.get_size(), third.nbytes)
+
+        pool.clear()
+        self.assertEqual(pool.get_size(), 0)
@@ -1,7 +1,11 @@
 import unittest
+from unittest import mock
+
+import numpy
 
 from dsp.singlelead import *
-from ecg import Lead
+from ecg import BeatTable, Lead
+from synthetic import synthesize
 from .testing import *
 
 
@@ -184,6 +188,170 @@ class TestBoundary(unittest.TestCase):
         )
 
 
+class TestTWaveEnds(unittest.TestCase):
+    def setUp(self):
+        self.ecg = get_test_ecg()
+        self.windows = t_wave_windows(self.ecg.get_qrs_complexes(), self.ecg.get_frequency())
+
+    def test_leads_batched(self):
+        derivatives = self.ecg.get_derivatives()
+
+        got = t_wave_ends(derivatives, self.windows)
+
+        self.assertEqual(got.shape, (len(self.ecg), len(self.windows)))
+        for row, derived in zip(got, derivatives):
+            numpy.testing.assert_array_equal(row, t_wave_ends(derived, self.windows))
+
+    def test_blocks(self):
+        derivatives = self.ecg.get_derivatives()
+        exp = t_wave_ends(derivatives, self.windows)
+
+        with mock.patch("dsp.singlelead.T_WAVE_BLOCK", 1):
+            got = t_wave_ends(derivatives, self.windows)
+
+        numpy.testing.assert_array_equal(exp, got)
+
+    def test_window_end(self):
+        # Slope never falls back below the threshold, so the T-wave runs to the end of its window
+        derived = numpy.concatenate((numpy.zeros(10), numpy.linspace(0, 1, 20), numpy.ones(20)))
+
+        got = t_wave_ends(derived, [(5, 40), (0, 10)])
+
+        numpy.testing.assert_array_equal(got, [39, 9])
+
+    def test_matches_windows_derived_alone(self):
+        # Record with beat-to-beat variability, so windows often end on the upstroke of the next P-wave
+        ecg = synthesize(120, heart_rate=75, variability=0.1, seed=2)
+        samples = ecg.get_lead(Lead.V1)
+        windows = t_wave_windows(qrs_boundaries(samples, ecg.get_frequency(), do_filtering=True), ecg.get_frequency())
+
+        got = t_wave_ends(derivative_filter(samples), windows)
+
+        numpy.testing.assert_array_equal(got, [window_derived_end(samples, window) for window in windows])
+
+
+def window_derived_end(samples, window):
+    """ T-wave end-point of a window derived on its own, as each window was before windows were batched """
+
+    derived = squaring(derivative_filter(samples[window[0]:window[1]]), signed=True)
+    up, down = derived.argmax(), derived.argmin()
+    peak_slope = max(abs(derived[up]), abs(derived[down]))
+    if up < down:
+        end_peak = down
+        if abs(derived[down:].max()) * BIPHASIC_FACTOR > peak_slope:
+            end_peak += derived[down:].argmax()
+    else:
+        end_peak = up
+        if abs(derived[up:].min()) * BIPHASIC_FACTOR > peak_slope:
+            end_peak += derived[up:].argmin()
+
+    threshold = derived[end_peak] / 10
+    crossed = derived[end_peak:] < threshold if threshold > 0 else derived[end_peak:] > threshold
+    end = end_peak + crossed.argmax() if crossed.any() else len(derived) - 1
+
+    return window[0] + end
+
+
+class TestPWaveBoundaries(unittest.TestCase):
+    def setUp(self):
+        self.ecg = get_test_ecg(seconds=10)
+        self.args = (self.ecg.get_qrs_complexes(), self.ecg.get_t_waves(), None, self.ecg.get_frequency())
+        self.derived = self.ecg.get_derivative(Lead.V1)
+
+    def test_blocks(self):
+        exp = p_wave_boundaries(*self.args, derived=self.derived)
+
+        with mock.patch("dsp.singlelead.P_WAVE_BLOCK", 1):
+            got = p_wave_boundaries(*self.args, derived=self.derived)
+
+        self.assertListEqual(exp, got)
+
+    def test_t_wave_order(self):
+        qrs, t_waves, samples, frequency = self.args
+        exp = p_wave_boundaries(qrs, t_waves, samples, frequency, derived=self.derived)
+
+        got = p_wave_boundaries(qrs, t_waves[::-1], samples, frequency, derived=self.derived)
+
+        self.assertListEqual(exp, got)
+
+    def test_beat_table(self):
+        qrs, t_waves, samples, frequency = self.args
+        exp = p_wave_boundaries(qrs, t_waves, samples, frequency, derived=self.derived)
+        beats = BeatTable.from_boundaries(qrs, t_waves)
+
+        got = p_wave_boundaries(beats, None, samples, frequency, derived=self.derived)
+
+        self.assertIs(got, beats)
+        self.assertListEqual(beats.get_p_waves(), exp)
+
+    def test_single_qrs(self):
+        self.assertListEqual(p_wave_boundaries(self.args[0][:1], [], None, 500, derived=self.derived), [])
+
+
+class TestMeasurePTerminalForce(unittest.TestCase):
+    def test_happy_path(self):
+        # Terminal segment dips 0.1 mV below the baseline for 40 ms
+        frequency = 500
+        filtered = numpy.zeros(100)
+        filtered[50:70] = -0.1 * numpy.hanning(20)
+        filtered[59] = -0.1
+
+        ptf, depth, duration, deepest = measure_p_terminal_force(filtered, [(10, 50, 70), (10, 70)], frequency)
+
+        numpy.testing.assert_allclose(depth, [100, 0])
+        numpy.testing.assert_allclose(duration, [40, 0])
+        numpy.testing.assert_allclose(ptf, [4000, 0])
+        numpy.testing.assert_array_equal(deepest, [59, NO_INDEX])
+
+    def test_array_boundaries(self):
+        ecg = get_test_ecg()
+        filtered = ecg.get_filtered_lead(Lead.V1)
+        p_waves = ecg.get_p_waves() + [(10, 20)]
+
+        exp = measure_p_terminal_force(filtered, p_waves, ecg.get_frequency())
+        got = measure_p_terminal_force(filtered, p_wave_array(p_waves), ecg.get_frequency())
+
+        for exp_measurements, got_measurements in zip(exp, got):
+            numpy.testing.assert_array_equal(exp_measurements, got_measurements)
+        self.assertEqual(got[0][-1], 0)
+
+    def test_table(self):
+        frequency = 500
+        filtered = numpy.zeros(100)
+        filtered[50:70] = -0.1 * numpy.hanning(20)
+        filtered[59] = -0.1
+        beats = BeatTable.from_boundaries([(80, 90)], p_waves=[(10, 50, 70)])
+
+        pterm_measurements(filtered, frequency, beats)
+
+        # Measurements are kept with the beat, so they are not measured again to be displayed
+        numpy.testing.assert_allclose(beats["p_depth"], [100])
+        numpy.testing.assert_allclose(beats["p_duration"], [40])
+        self.assertEqual(beats.get_p_deepest(), [59])
+
+    def test_no_p_waves(self):
+        ptf, depth, duration, deepest = measure_p_terminal_force(numpy.zeros(10), [], 500)
+
+        self.assertEqual(len(ptf), 0)
+        self.assertEqual(len(deepest), 0)
+
+
+class TestQrsDetect(unittest.TestCase):
+    def test_backtrack(self):
+        frequency = 1000
+        derivative = numpy.zeros(10 * frequency)
+        beats = [500, 1500, 2500, 3500, 4500, 5500, 6500, 7500, 8500]
+        for beat in beats:
+            derivative[beat-2:beat+3] = [2, 6, 10, 6, 2]
+
+        # Beat below the detection cutoff can only be found by backtracking
+        derivative[5498:5503] = [1, 4, 7, 4, 1]
+
+        detections = qrs_detect(derivative, frequency)
+
+        self.assertListEqual(detections, beats)
+
+
 class TestHeartRate(unittest.TestCase):
     def test_happy_path(self):
         exp_rate = 100
@@ -0,0 +1,115 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from batch import analyze_record, run_batch
+from dsp import singlelead
+from store import ResultStore, get_file_key
+from .testing import *
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, "nsr.json")
+        shutil.copy(NORMAL_SINUS_RHYTHM, self.file_path)
+        self.store = ResultStore(os.path.join(self.directory, "results.sqlite"))
+
+        self.row = analyze_record(self.file_path, seconds=5, with_beats=True)
+        self.beats = self.row.pop("beat_table")
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_happy_path(self):
+        self.assertFalse(self.store.is_current(self.file_path, seconds=5))
+        self.store.put(self.file_path, self.row, self.beats, seconds=5)
+
+        self.assertTrue(self.store.is_current(self.file_path, seconds=5))
+        row = self.store.get_row(self.file_path)
+        self.assertEqual(row["beats"], self.row["beats"])
+        self.assertEqual(row["median_p_terminal_force"], self.row["median_p_terminal_force"])
+        self.assertListEqual(row["p_terminal_force"], self.row["p_terminal_force"])
+
+    def test_changes(self):
+        self.store.put(self.file_path, self.row, self.beats, seconds=5)
+
+        # Options
+        self.assertFalse(self.store.is_current(self.file_path, seconds=10))
+
+        # Parameters
+        with mock.patch.object(singlelead, "BIPHASIC_FACTOR", 2.0):
+            self.assertFalse(self.store.is_current(self.file_path, seconds=5))
+
+        # Modification time alone
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertTrue(self.store.is_current(self.file_path, seconds=5))
+
+        # Content
+        with open(self.file_path, "a") as file:
+            file.write(" ")
+        self.assertFalse(self.store.is_current(self.file_path, seconds=5))
+
+    def test_error_retried(self):
+        self.store.put(self.file_path, {"error": "TimeoutError: Analysis exceeded time limit"}, seconds=5)
+
+        self.assertFalse(self.store.is_current(self.file_path, seconds=5))
+
+    def test_changed_while_analyzed(self):
+        file_key = get_file_key(self.file_path)
+        with open(self.file_path, "a") as file:
+            file.write(" ")
+
+        # Results are of the file as it was before the change, so they are not current for the changed file
+        self.store.put(self.file_path, self.row, self.beats, file_key=file_key, seconds=5)
+
+        self.assertFalse(self.store.is_current(self.file_path, seconds=5))
+
+    def test_query(self):
+        self.store.put(self.file_path, self.row, self.beats, seconds=5)
+        median = self.row["median_p_terminal_force"]
+
+        self.assertEqual(len(self.store.query_records(min_p_terminal_force=median - 1)), 1)
+        self.assertEqual(len(self.store.query_records(min_p_terminal_force=median + 1)), 0)
+        self.assertEqual(len(self.store.query_records(errors=True)), 0)
+
+        beats = list(self.store.query_beats(max_p_terminal_force=median + 1))
+        self.assertEqual(len(beats), self.row["beats"])
+        self.assertIsNone(beats[0]["p_on"])
+        self.assertListEqual([beat["p_terminal_force"] for beat in beats[1:]], self.row["p_terminal_force"])
+
+
+class TestIncrementalBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, "cohort"))
+        shutil.copy(NORMAL_SINUS_RHYTHM, os.path.join(self.directory, "cohort"))
+        shutil.copy(BIPHASIC, os.path.join(self.directory, "cohort"))
+        self.store_path = os.path.join(self.directory, "results.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_changed_analyzed(self):
+        source = os.path.join(self.directory, "cohort")
+        output_path = os.path.join(self.directory, "results.csv")
+        self.assertEqual(run_batch(source, output_path, workers=1, seconds=5, store_path=self.store_path), (2, 0))
+
+        with open(os.path.join(source, "nsr.json"), "a") as file:
+            file.write(" ")
+        analyzed, _ = run_batch(source, output_path, workers=1, seconds=5, store_path=self.store_path)
+
+        self.assertEqual(analyzed, 1)
+        with open(output_path) as file:
+            rows = {os.path.basename(row["file"]): row for row in csv.DictReader(file)}
+        self.assertEqual(rows["biphasic.json"]["beats"], "5")
+        self.assertEqual(rows["nsr.json"]["beats"], "5")
+
+
+if __name__ == '__main__':
+    unittest.main()
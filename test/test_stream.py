@@ -0,0 +1,70 @@
+import unittest
+
+from dsp.singlelead import qrs_boundaries
+from dsp.stream import *
+from ecg import Lead
+from .testing import *
+
+
+def stream(samples, frequency, chunk_size):
+    analyzer = StreamAnalyzer(frequency)
+    beats = []
+    for i in range(0, len(samples), chunk_size):
+        beats += analyzer.push(samples[i:i + chunk_size])
+    beats += analyzer.finish()
+    return beats
+
+
+class TestStreamAnalyzer(unittest.TestCase):
+    # ACCEPTABLE_RANGE is allowable time (in sec) that a determined boundary can be off from the actual, in either direction
+    ACCEPTABLE_RANGE = 0.015
+
+    # ACCEPTABLE_INACCURACY is the allowable percent difference between determined and actual P-terminal force
+    ACCEPTABLE_INACCURACY = 0.05
+
+    def setUp(self):
+        self.lead_of_interest = Lead.V1
+        self.ecg = get_test_ecg()
+        self.samples = self.ecg.get_lead(self.lead_of_interest)
+        self.frequency = self.ecg.get_frequency()
+
+    def test_chunk_size(self):
+        exp = stream(self.samples, self.frequency, len(self.samples))
+        for chunk_size in (1, 37, 250):
+            got = stream(self.samples, self.frequency, chunk_size)
+            self.assertEqual(exp, got, f"Beats differ for chunk size {chunk_size}")
+
+    def test_qrs_complexes(self):
+        exp = qrs_boundaries(self.samples, self.frequency, do_filtering=True)
+        got = [beat.qrs for beat in stream(self.samples, self.frequency, 250)]
+
+        self.assertEqual(len(exp), len(got), "QRS complexes differ from offline analysis")
+        self.assertLessEqual(
+            boundary_accuracy(exp, got, self.frequency),
+            self.ACCEPTABLE_RANGE,
+            "Streamed QRS boundary outside of acceptable range",
+        )
+
+    def test_p_terminal_force(self):
+        self.ecg = get_test_ecg(test_data=BIPHASIC)
+        self.samples = self.ecg.get_lead(self.lead_of_interest)
+        beats = [beat for beat in stream(self.samples, self.ecg.get_frequency(), 250) if beat.p_wave is not None]
+
+        # Test detections
+        exp = self.ecg.get_p_waves()
+        got = [beat.p_wave for beat in beats]
+        self.assertFalse(false_negative(exp[1:], got), "Missed P-wave")
+        self.assertFalse(false_positive(exp, got), "False P-wave detection")
+
+        # Test measurement accuracy
+        exp = self.ecg.get_p_terminal_force()
+        got = [beat.p_terminal_force for beat in beats]
+        self.assertLessEqual(
+            measurement_accuracy(exp, got),
+            self.ACCEPTABLE_INACCURACY,
+            "Streamed P-terminal force outside of acceptable range",
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
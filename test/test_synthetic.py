@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy
+
+import filereader
+from analysis import set_boundaries
+from batch import find_records
+from synthetic.synthetic import *
+from .testing import *
+
+
+class TestSynthesize(unittest.TestCase):
+    def setUp(self):
+        self.ecg = synthesize(20, frequency=500, heart_rate=75, variability=0.05, noise=0.01, wander=0.1, seed=0)
+
+    def test_annotations(self):
+        self.assertEqual(len(self.ecg), 12)
+        self.assertEqual(self.ecg.get_lead_matrix().shape[1], 20 * 500)
+        self.assertGreaterEqual(len(self.ecg.get_qrs_complexes()), 23)
+        self.assertEqual(len(self.ecg.get_t_waves()), len(self.ecg.get_qrs_complexes()))
+        self.assertEqual(len(self.ecg.get_p_terminal_force()), len(self.ecg.get_p_waves()))
+        self.assertAlmostEqual(self.ecg.get_p_terminal_force()[0], 100 * 40)
+
+    def test_monophasic(self):
+        ecg = synthesize(5, p_terminal_depth=0, seed=0)
+
+        self.assertTrue(all(pterm == 0 for pterm in ecg.get_p_terminal_force()))
+
+    def test_detection(self):
+        exp_qrs = self.ecg.get_qrs_complexes()
+        exp_p_waves = self.ecg.get_p_waves()
+        set_boundaries(self.ecg)
+
+        self.assertFalse(false_negative(exp_qrs, self.ecg.get_qrs_complexes()), "Missed QRS complex")
+        self.assertFalse(false_positive(exp_qrs, self.ecg.get_qrs_complexes()), "False QRS complex detection")
+        self.assertFalse(false_negative(exp_p_waves[1:], self.ecg.get_p_waves()), "Missed P-wave")
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.ecg = synthesize(10, frequency=250, seed=1)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_json(self):
+        file_path = os.path.join(self.directory.name, "ecg.json")
+        write_json(self.ecg, file_path)
+
+        ecg = filereader.read_file(file_path)
+        numpy.testing.assert_allclose(ecg.get_lead_matrix(), self.ecg.get_lead_matrix(), atol=1e-4)
+        self.assertListEqual(ecg.get_qrs_complexes(), self.ecg.get_qrs_complexes())
+        self.assertListEqual(ecg.get_p_terminal_force(), self.ecg.get_p_terminal_force())
+
+        # Annotations are cut with the samples
+        ecg = filereader.read_file(file_path, seconds=5)
+        self.assertEqual(ecg.get_lead_matrix().shape[1], 5 * 250)
+        self.assertTrue(all(boundary[-1] < 5 * 250 for boundary in ecg.get_qrs_complexes()))
+        self.assertEqual(len(ecg.get_p_waves()), len(ecg.get_p_terminal_force()))
+
+    def test_muse(self):
+        file_path = os.path.join(self.directory.name, "ecg.xml")
+        write_muse(self.ecg, file_path)
+
+        ecg = filereader.read_file(file_path)
+        self.assertListEqual(ecg.get_available_leads(), self.ecg.get_available_leads())
+        numpy.testing.assert_allclose(ecg.get_lead_matrix(), self.ecg.get_lead_matrix(),
+                                      atol=MUSE_UNITS_PER_BIT / 2000)
+
+    def test_corpus(self):
+        annotations_path = generate_corpus(self.directory.name, 2, seconds=5, formats=("json", "muse", "ecgb"), seed=2)
+
+        with open(annotations_path) as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(len(find_records(self.directory.name)), 6)
+
+        ecg = filereader.read_file(os.path.join(self.directory.name, lines[2]["file"]))
+        self.assertListEqual([list(boundary) for boundary in ecg.get_qrs_complexes()], lines[2]["annotation"]["qrs"])
+
+
+if __name__ == '__main__':
+    unittest.main()